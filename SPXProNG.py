@@ -5,6 +5,15 @@ import pandas as pd
 import numpy as np
 from datetime import datetime, timedelta, time
 import json
+import copy
+import asyncio
+import bisect
+import threading
+import time as time_mod
+from collections import deque
+from contextlib import contextmanager
+from functools import lru_cache
+from concurrent.futures import ThreadPoolExecutor
 
 # ============================================================
 # SPX PROPHET NEXT GEN v1.0
@@ -546,6 +555,7 @@ NY_DECISION_CT = time(9, 0)
 NY_CLOSE_CT = time(15, 0)
 
 
+@lru_cache(maxsize=1 << 16)
 def count_candles_between(start_dt: datetime, end_dt: datetime) -> int:
     """
     Count the number of 30-minute candles between two datetimes,
@@ -594,7 +604,8 @@ def count_candles_between(start_dt: datetime, end_dt: datetime) -> int:
 
 
 def calculate_line_value(anchor_price: float, anchor_time: datetime, 
-                         target_time: datetime, direction: str) -> float:
+                         target_time: datetime, direction: str,
+                         rate: float = RATE_PER_CANDLE) -> float:
     """
     Calculate the projected line value at a target time.
     
@@ -603,14 +614,14 @@ def calculate_line_value(anchor_price: float, anchor_time: datetime,
     candles = count_candles_between(anchor_time, target_time)
     
     if direction == 'ascending':
-        return anchor_price + (RATE_PER_CANDLE * candles)
+        return anchor_price + (rate * candles)
     else:
-        return anchor_price - (RATE_PER_CANDLE * candles)
+        return anchor_price - (rate * candles)
 
 
 def generate_line_series(anchor_price: float, anchor_time: datetime,
                          start_time: datetime, end_time: datetime,
-                         direction: str) -> list:
+                         direction: str, rate: float = RATE_PER_CANDLE) -> list:
     """
     Generate a series of (datetime, price) tuples for plotting a projected line.
     """
@@ -642,7 +653,7 @@ def generate_line_series(anchor_price: float, anchor_time: datetime,
         if MAINTENANCE_START_CT <= current_time_only < MAINTENANCE_END_CT:
             continue
         
-        value = calculate_line_value(anchor_price, anchor_time, current, direction)
+        value = calculate_line_value(anchor_price, anchor_time, current, direction, rate)
         points.append((current, value))
     
     # Filter to only show from start_time onward
@@ -653,7 +664,7 @@ def generate_line_series(anchor_price: float, anchor_time: datetime,
 
 def calculate_nine_am_levels(bounces: list, rejections: list,
                              highest_wick: dict, lowest_wick: dict,
-                             next_day_date: datetime) -> dict:
+                             next_day_date: datetime, rate: float = RATE_PER_CANDLE) -> dict:
     """
     Calculate the four key horizontal levels at 9:00 AM CT the next day.
     
@@ -661,13 +672,15 @@ def calculate_nine_am_levels(bounces: list, rejections: list,
     rejections: list of {'price': float, 'time': datetime}
     highest_wick: {'price': float, 'time': datetime}
     lowest_wick: {'price': float, 'time': datetime}
+    rate: points per candle; kept in the result so later projections
+          (build_asian_ladder) use the same rate
     """
     nine_am = datetime.combine(next_day_date.date(), NY_DECISION_CT)
     
     # Calculate all ascending lines at 9 AM (from bounces + highest wick)
     ascending_at_9am = []
     for bounce in bounces:
-        val = calculate_line_value(bounce['price'], bounce['time'], nine_am, 'ascending')
+        val = calculate_line_value(bounce['price'], bounce['time'], nine_am, 'ascending', rate)
         ascending_at_9am.append({
             'source': f"Bounce @ {bounce['price']:.2f} ({bounce['time'].strftime('%I:%M %p')})",
             'anchor_price': bounce['price'],
@@ -677,7 +690,7 @@ def calculate_nine_am_levels(bounces: list, rejections: list,
         })
     
     # Highest wick ascending
-    hw_val = calculate_line_value(highest_wick['price'], highest_wick['time'], nine_am, 'ascending')
+    hw_val = calculate_line_value(highest_wick['price'], highest_wick['time'], nine_am, 'ascending', rate)
     ascending_at_9am.append({
         'source': f"Highest Wick @ {highest_wick['price']:.2f} ({highest_wick['time'].strftime('%I:%M %p')})",
         'anchor_price': highest_wick['price'],
@@ -689,7 +702,7 @@ def calculate_nine_am_levels(bounces: list, rejections: list,
     # Calculate all descending lines at 9 AM (from rejections + lowest wick)
     descending_at_9am = []
     for rejection in rejections:
-        val = calculate_line_value(rejection['price'], rejection['time'], nine_am, 'descending')
+        val = calculate_line_value(rejection['price'], rejection['time'], nine_am, 'descending', rate)
         descending_at_9am.append({
             'source': f"Rejection @ {rejection['price']:.2f} ({rejection['time'].strftime('%I:%M %p')})",
             'anchor_price': rejection['price'],
@@ -699,7 +712,7 @@ def calculate_nine_am_levels(bounces: list, rejections: list,
         })
     
     # Lowest wick descending
-    lw_val = calculate_line_value(lowest_wick['price'], lowest_wick['time'], nine_am, 'descending')
+    lw_val = calculate_line_value(lowest_wick['price'], lowest_wick['time'], nine_am, 'descending', rate)
     descending_at_9am.append({
         'source': f"Lowest Wick @ {lowest_wick['price']:.2f} ({lowest_wick['time'].strftime('%I:%M %p')})",
         'anchor_price': lowest_wick['price'],
@@ -731,10 +744,777 @@ def calculate_nine_am_levels(bounces: list, rejections: list,
             'lowest_wick_descending': lowest_wick_desc,
             'lowest_rejection_descending': lowest_rejection_desc,
         },
-        'nine_am_time': nine_am
+        'nine_am_time': nine_am,
+        'rate': rate,
     }
 
 
+# ============================================================
+# NY 9 AM SIGNAL ENGINE
+# Ladder position → signal, stop line and targets (scalar or batched)
+# ============================================================
+
+def build_ny_ladder(levels: dict) -> list:
+    """9 AM line ladder (high → low) from calculate_nine_am_levels() output."""
+    ny_ladder = []
+    for line in levels['ascending']:
+        ny_ladder.append({
+            'name': line['source'].split(' @ ')[0] if ' @ ' in line['source'] else line['source'],
+            'short': f"{'HW' if line['type'] == 'highest_wick' else 'B'} ↗",
+            'value': line['value_at_9am'],
+            'direction': 'ascending',
+            'color': '#ff1744' if line['type'] == 'highest_wick' else '#ff5252',
+        })
+    for line in levels['descending']:
+        ny_ladder.append({
+            'name': line['source'].split(' @ ')[0] if ' @ ' in line['source'] else line['source'],
+            'short': f"{'LW' if line['type'] == 'lowest_wick' else 'R'} ↘",
+            'value': line['value_at_9am'],
+            'direction': 'descending',
+            'color': '#00e676' if line['type'] == 'lowest_wick' else '#69f0ae',
+        })
+    ny_ladder.sort(key=lambda x: x['value'], reverse=True)
+    return ny_ladder
+
+
+# code → (signal, signal_class, trade_direction); 0 = no position on the ladder
+SIGNAL_NEUTRAL = 0
+SIGNAL_BEARISH = 1
+SIGNAL_BULLISH_TREND = 2
+SIGNAL_BEARISH_TREND = 3
+SIGNAL_BULLISH = 4
+SIGNAL_WAIT = 5
+SIGNAL_BEARISH_LEAN = 6
+SIGNAL_BULLISH_LEAN = 7
+SIGNAL_TABLE = {
+    SIGNAL_NEUTRAL: ("NEUTRAL", "neutral", None),
+    SIGNAL_BEARISH: ("BEARISH — BUY PUTS", "bear", "PUT"),
+    SIGNAL_BULLISH_TREND: ("BULLISH TREND — BUY CALLS", "bull", "CALL"),
+    SIGNAL_BEARISH_TREND: ("BEARISH TREND — BUY PUTS", "bear", "PUT"),
+    SIGNAL_BULLISH: ("BULLISH — BUY CALLS", "bull", "CALL"),
+    SIGNAL_WAIT: ("BETWEEN ASC ↗ & DESC ↘ — WAIT", "neutral", None),
+    SIGNAL_BEARISH_LEAN: ("BEARISH LEAN — BUY PUTS", "bear", "PUT"),
+    SIGNAL_BULLISH_LEAN: ("BULLISH LEAN — BUY CALLS", "bull", "CALL"),
+}
+
+
+def _first_two_at_or_after(idx: np.ndarray, start: np.ndarray) -> tuple:
+    """For each start position, the first two entries of sorted idx that are >= start (-1 = none)."""
+    pos = np.searchsorted(idx, start, side='left')
+    padded = np.r_[idx, -1, -1]
+    return padded[pos], padded[pos + 1]
+
+
+def classify_signal(ladder: list, price):
+    """
+    Pure 9 AM signal logic: where price sits in the ladder decides the signal,
+    stop line (invalidation) and up to two target lines.
+    
+    All comparisons are against the sorted ladder arrays (one searchsorted per
+    price), so an array of prices is classified in one vectorized pass.
+    
+    Args:
+        ladder: build_ny_ladder() output (any order; dicts with 'value', 'direction')
+        price: SPX price, or an array of prices
+    
+    Returns:
+        Scalar price: dict with 'signal', 'signal_class', 'trade_direction',
+        'stop_line', 'target_lines', 'nearest_above', 'nearest_below', 'signal_detail'
+        Array of prices: dict of arrays — 'code' (SIGNAL_*), 'trade_direction',
+        'stop_index', 'target_index' (n × 2, -1 = none, indices into 'ladder'
+        sorted high → low), 'stop_value', 'tp1_value', 'tp2_value' (NaN = none)
+    """
+    order = sorted(range(len(ladder)), key=lambda i: ladder[i]['value'], reverse=True)
+    lines = [ladder[i] for i in order]
+    values = np.array([l['value'] for l in lines], dtype=float)
+    is_asc = np.array([l['direction'] == 'ascending' for l in lines], dtype=bool)
+    scalar = np.ndim(price) == 0
+    p = np.atleast_1d(np.asarray(price, dtype=float))
+    n = len(values)
+    
+    # k = number of lines strictly above price → nearest above is k-1, nearest below is k
+    k = np.searchsorted(-values, -p, side='left')
+    has_both = (k > 0) & (k < n)
+    above = np.clip(k - 1, 0, max(n - 1, 0))
+    below = np.clip(k, 0, max(n - 1, 0))
+    
+    asc_vals, desc_vals = values[is_asc], values[~is_asc]
+    min_asc = asc_vals.min() if len(asc_vals) else np.nan
+    max_asc = asc_vals.max() if len(asc_vals) else np.nan
+    min_desc = desc_vals.min() if len(desc_vals) else np.nan
+    max_desc = desc_vals.max() if len(desc_vals) else np.nan
+    above_asc = is_asc[above] if n else np.zeros(len(p), dtype=bool)
+    below_asc = is_asc[below] if n else np.zeros(len(p), dtype=bool)
+    
+    code = np.select([
+        p < min_asc,
+        (p > max_desc) & (p > max_asc),
+        p < min_desc,
+        p > max_asc,
+        above_asc & ~below_asc,
+        ~above_asc,
+        below_asc,
+    ], [SIGNAL_BEARISH, SIGNAL_BULLISH_TREND, SIGNAL_BEARISH_TREND, SIGNAL_BULLISH,
+        SIGNAL_WAIT, SIGNAL_BEARISH_LEAN, SIGNAL_BULLISH_LEAN], SIGNAL_NEUTRAL)
+    code = np.where(has_both, code, SIGNAL_NEUTRAL)
+    
+    # Stop: the line above for puts, the line below for calls
+    is_put = np.isin(code, [SIGNAL_BEARISH, SIGNAL_BEARISH_TREND, SIGNAL_BEARISH_LEAN])
+    is_call = np.isin(code, [SIGNAL_BULLISH, SIGNAL_BULLISH_TREND, SIGNAL_BULLISH_LEAN])
+    stop_index = np.where(is_put, above, np.where(is_call, below, -1))
+    
+    # Targets: first two descending lines below / ascending lines above / any
+    # lines below (bearish lean) / the top two lines above (bullish lean)
+    desc_idx, asc_idx = np.flatnonzero(~is_asc), np.flatnonzero(is_asc)
+    d1, d2 = _first_two_at_or_after(desc_idx, k)
+    a1, a2 = _first_two_at_or_after(asc_idx, np.zeros_like(k))
+    a1, a2 = np.where(a1 < k, a1, -1), np.where(a2 < k, a2, -1)
+    l1, l2 = np.where(k < n, k, -1), np.where(k + 1 < n, k + 1, -1)
+    t1, t2 = np.where(k > 0, 0, -1), np.where(k > 1, 1, -1)
+    target_index = np.full((len(p), 2), -1)
+    for sig, (first, second) in {SIGNAL_BEARISH: (d1, d2), SIGNAL_BULLISH: (a1, a2),
+                                 SIGNAL_BEARISH_LEAN: (l1, l2), SIGNAL_BULLISH_LEAN: (t1, t2)}.items():
+        hit = code == sig
+        target_index[hit, 0] = first[hit]
+        target_index[hit, 1] = second[hit]
+    
+    padded_values = np.r_[values, np.nan]
+    direction = np.array([SIGNAL_TABLE[c][2] for c in range(len(SIGNAL_TABLE))], dtype=object)[code]
+    
+    if not scalar:
+        return {
+            'code': code,
+            'trade_direction': direction,
+            'stop_index': stop_index,
+            'target_index': target_index,
+            'stop_value': padded_values[stop_index],
+            'tp1_value': padded_values[target_index[:, 0]],
+            'tp2_value': padded_values[target_index[:, 1]],
+            'ladder': lines,
+        }
+    
+    c = int(code[0])
+    price = float(p[0])
+    signal, signal_class, trade_direction = SIGNAL_TABLE[c]
+    stop_line = lines[stop_index[0]] if stop_index[0] >= 0 else None
+    target_lines = [lines[i] for i in target_index[0] if i >= 0]
+    nearest_above = lines[k[0] - 1] if k[0] > 0 else None
+    nearest_below = lines[k[0]] if k[0] < n else None
+    
+    details = {
+        SIGNAL_NEUTRAL: "",
+        SIGNAL_BEARISH: lambda: f"Price {price:.2f} is BELOW all ascending lines. Buyers trapped above. Stop: {stop_line['value']:.2f} ({stop_line['short']})",
+        SIGNAL_BULLISH_TREND: lambda: f"Price {price:.2f} is ABOVE all lines. Strong trend day. Stop: {stop_line['value']:.2f} ({stop_line['short']})",
+        SIGNAL_BEARISH_TREND: lambda: f"Price {price:.2f} is BELOW all lines including descending. Stop: {stop_line['value']:.2f} ({stop_line['short']})",
+        SIGNAL_BULLISH: lambda: f"Price {price:.2f} is ABOVE all ascending lines. Stop: {stop_line['value']:.2f} ({stop_line['short']})",
+        SIGNAL_WAIT: lambda: f"Price {price:.2f} between {nearest_above['short']} ({nearest_above['value']:.2f}) and {nearest_below['short']} ({nearest_below['value']:.2f}). No clear bias.",
+        SIGNAL_BEARISH_LEAN: lambda: f"Descending resistance at {nearest_above['value']:.2f} above. Stop: {stop_line['value']:.2f}",
+        SIGNAL_BULLISH_LEAN: lambda: f"Ascending support at {nearest_below['value']:.2f} below. Stop: {stop_line['value']:.2f}",
+    }
+    detail = details[c]
+    
+    return {
+        'signal': signal,
+        'signal_class': signal_class,
+        'trade_direction': trade_direction,
+        'stop_line': stop_line,
+        'target_lines': target_lines,
+        'nearest_above': nearest_above,
+        'nearest_below': nearest_below,
+        'signal_detail': detail() if callable(detail) else detail,
+    }
+
+
+# Live banner zones, low → high, from the four key 9 AM levels
+LIVE_ZONES = [
+    ("BEARISH TREND DAY", "#ff1744"),
+    ("BETWEEN DESCENDING", "#ffd740"),
+    ("BEARISH BIAS", "#ff5252"),
+    ("BETWEEN ASCENDING", "#ffd740"),
+    ("BULLISH TREND DAY", "#00e676"),
+]
+
+
+def key_level_values(levels: dict) -> dict:
+    """{'HW Asc', 'HB Asc', 'LR Desc', 'LW Desc'} → 9 AM value, for the levels that exist."""
+    kl = levels['key_levels']
+    named = [('HW Asc', 'highest_wick_ascending'), ('HB Asc', 'highest_bounce_ascending'),
+             ('LR Desc', 'lowest_rejection_descending'), ('LW Desc', 'lowest_wick_descending')]
+    return {name: kl[key]['value_at_9am'] for name, key in named if kl[key] and kl[key]['value_at_9am']}
+
+
+def live_zone(price: float, key_values: dict):
+    """Index into LIVE_ZONES for a live price, or None unless all four key levels exist."""
+    if len(key_values) < 4:
+        return None
+    asc_h = max(key_values['HW Asc'], key_values['HB Asc'])
+    asc_l = min(key_values['HW Asc'], key_values['HB Asc'])
+    desc_h = max(key_values['LR Desc'], key_values['LW Desc'])
+    desc_l = min(key_values['LR Desc'], key_values['LW Desc'])
+    if price > asc_h:
+        return 4
+    if price >= asc_l:
+        return 3
+    if price > desc_h:
+        return 2
+    if price >= desc_l:
+        return 1
+    return 0
+
+
+EVENT_START = 'start'
+EVENT_LINE_CROSS = 'line_cross'
+EVENT_ZONE_ENTER = 'zone_enter'
+EVENT_ZONE_REENTER = 'zone_reenter'
+LIVE_EVENT_LOG_SIZE = 200
+
+
+class LiveSignalStateMachine:
+    """
+    Tracks where the live price sits in the ladder across ticks.
+    
+    Lines are every ny_ladder value (the four key levels when no ladder is
+    given). Position = number of lines price has passed: those below it,
+    plus those level with it except the top edge of a key band, where
+    live_zone still counts price as inside the band (two bisects per update).
+    When it changes, one line_cross event is emitted per line passed, in
+    the order price crossed them; a change of LIVE_ZONES zone emits
+    zone_enter, or zone_reenter when the zone was visited earlier in the
+    session. Events go into a bounded log (oldest dropped first).
+    """
+    def __init__(self, key_values: dict, ny_ladder: list = None, max_events: int = LIVE_EVENT_LOG_SIZE):
+        self.key_values = dict(key_values)
+        key_names = {value: name for name, value in key_values.items()}
+        if ny_ladder is None:
+            lines = [(value, name) for name, value in key_values.items()]
+        else:
+            lines = [(l['value'], key_names.get(l['value'], f"{l['short']} {l['name']}")) for l in ny_ladder]
+        band_tops = set()
+        if len(key_values) == 4:
+            band_tops = {max(key_values['HW Asc'], key_values['HB Asc']),
+                         max(key_values['LR Desc'], key_values['LW Desc'])}
+        # Within equal values the lines passed at a tie sort first, so position stays an index
+        ordered = sorted(((value, value not in band_tops, name) for value, name in lines),
+                         key=lambda line: (line[0], not line[1]))
+        self.values = [value for value, _, _ in ordered]
+        self.passed_at_tie = [passed for _, passed, _ in ordered]
+        self.names = [name for _, _, name in ordered]
+        self.position = None
+        self.zone = None
+        self.visited = set()
+        self.last_price = None
+        self.events = deque(maxlen=max_events)
+    
+    def _emit(self, ts, kind: str, price: float, text: str, **fields) -> dict:
+        event = {'time': ts, 'type': kind, 'price': price, 'text': text}
+        event.update(fields)
+        self.events.append(event)
+        return event
+    
+    def update(self, price: float, ts=None) -> list:
+        """Feed one tick; returns the events it produced (possibly none)."""
+        ts = ts if ts is not None else datetime.now()
+        position = bisect.bisect_left(self.values, price)
+        tied = bisect.bisect_right(self.values, price, lo=position)
+        position += sum(self.passed_at_tie[position:tied])
+        zone = live_zone(price, self.key_values)
+        new = []
+        
+        if self.position is None:
+            zone_name = LIVE_ZONES[zone][0] if zone is not None else "—"
+            new.append(self._emit(ts, EVENT_START, price, f"Tracking from {price:.2f} ({zone_name})",
+                                  zone=zone))
+        elif position > self.position:
+            for i in range(self.position, position):
+                new.append(self._emit(ts, EVENT_LINE_CROSS, price, f"Crossed {self.names[i]} "
+                                      f"{self.values[i]:.2f} ↑", line=self.names[i], direction='up'))
+        elif position < self.position:
+            for i in range(self.position - 1, position - 1, -1):
+                new.append(self._emit(ts, EVENT_LINE_CROSS, price, f"Crossed {self.names[i]} "
+                                      f"{self.values[i]:.2f} ↓", line=self.names[i], direction='down'))
+        
+        if self.position is not None and zone != self.zone and zone is not None:
+            kind = EVENT_ZONE_REENTER if zone in self.visited else EVENT_ZONE_ENTER
+            verb = "Re-entered" if kind == EVENT_ZONE_REENTER else "Entered"
+            new.append(self._emit(ts, kind, price, f"{verb} {LIVE_ZONES[zone][0]}",
+                                  zone=zone, from_zone=self.zone))
+        
+        if zone is not None:
+            self.visited.add(zone)
+        self.position = position
+        self.zone = zone
+        self.last_price = price
+        return new
+
+
+# ============================================================
+# LEVEL ALERTS
+# Proximity / cross alerts on projected lines, evaluated per tick by
+# bisect on the sorted ladder and delivered to pluggable sinks
+# ============================================================
+
+ALERT_NEAR = 'near'
+ALERT_CROSS = 'cross'
+ALERT_PROXIMITY_POINTS = 2.0
+ALERT_THROTTLE_SECONDS = 300  # same alert at most once per 5 minutes
+
+
+class FileAlertSink:
+    """Appends each alert as one JSON line."""
+    def __init__(self, path: str):
+        import os
+        self.path = os.path.expanduser(path)
+    
+    def send(self, event: dict):
+        with open(self.path, 'a') as f:
+            f.write(json.dumps(event, default=str) + "\n")
+
+
+class WebhookAlertSink:
+    """POSTs each alert as JSON to a (local) webhook on a background thread."""
+    def __init__(self, url: str, timeout: float = 3.0):
+        self.url = url
+        self.timeout = timeout
+        self.errors = 0
+    
+    def _post(self, event: dict):
+        import requests as req
+        try:
+            req.post(self.url, data=json.dumps(event, default=str),
+                     headers={"Content-Type": "application/json"}, timeout=self.timeout)
+        except Exception:
+            self.errors += 1
+    
+    def send(self, event: dict):
+        get_fetch_executor().submit(self._post, event)
+
+
+class DesktopAlertSink:
+    """
+    Desktop notification stub: keeps the latest alerts for the UI to surface
+    (st.toast) and calls notify(title, text) when one is supplied.
+    """
+    def __init__(self, notify=None, keep: int = 50):
+        self.notify = notify
+        self.pending = deque(maxlen=keep)
+    
+    def send(self, event: dict):
+        self.pending.append(event)
+        if self.notify:
+            self.notify("SPX Prophet", event['text'])
+    
+    def drain(self) -> list:
+        items = list(self.pending)
+        self.pending.clear()
+        return items
+
+
+class AlertEngine:
+    """
+    Evaluates every armed alert on each price update.
+    
+    near:  price comes within `distance` points of a line (edge-triggered on
+           entering the band). Candidates come from one bisect window of
+           ± the widest distance over the sorted line values.
+    cross: price crosses a line between two updates (bisect of the previous
+           and current price; everything in between crossed).
+    
+    Repeats of the same alert (and direction) inside `throttle_seconds` are
+    suppressed. Fired alerts go to every sink; a failing sink never breaks
+    the tick.
+    """
+    def __init__(self, sinks: list = None, throttle_seconds: float = ALERT_THROTTLE_SECONDS):
+        self.sinks = list(sinks or [])
+        self.throttle_seconds = throttle_seconds
+        self._lock = threading.Lock()
+        self._near = ([], [], [])    # values, distances, names (sorted by value)
+        self._cross = ([], [])       # values, names (sorted by value)
+        self._max_distance = 0.0
+        self._inside = set()
+        self._last_fired = {}
+        self.last_price = None
+        self.fired = 0
+        self.suppressed = 0
+    
+    def arm(self, alerts: list):
+        """
+        Replace the armed set. alerts: dicts with 'kind' (near/cross), 'name',
+        'value' and, for near alerts, 'distance'.
+        """
+        near = sorted((a['value'], a.get('distance', ALERT_PROXIMITY_POINTS), a['name'])
+                      for a in alerts if a['kind'] == ALERT_NEAR)
+        cross = sorted((a['value'], a['name']) for a in alerts if a['kind'] == ALERT_CROSS)
+        with self._lock:
+            self._near = ([v for v, _, _ in near], [d for _, d, _ in near], [n for _, _, n in near])
+            self._cross = ([v for v, _ in cross], [n for _, n in cross])
+            self._max_distance = max(self._near[1], default=0.0)
+            self._inside &= set(self._near[2])
+    
+    def _throttled(self, key: tuple, now: float) -> bool:
+        last = self._last_fired.get(key)
+        if last is not None and now - last < self.throttle_seconds:
+            self.suppressed += 1
+            return True
+        self._last_fired[key] = now
+        return False
+    
+    def update(self, price: float, ts=None) -> list:
+        """Evaluate all armed alerts against one price; returns the alerts that fired."""
+        now = time_mod.monotonic()
+        ts = ts if ts is not None else datetime.now()
+        fired = []
+        with self._lock:
+            values, distances, names = self._near
+            lo = bisect.bisect_left(values, price - self._max_distance)
+            hi = bisect.bisect_right(values, price + self._max_distance)
+            inside = set()
+            for i in range(lo, hi):
+                gap = price - values[i]
+                if abs(gap) <= distances[i]:
+                    inside.add(names[i])
+                    if names[i] not in self._inside and not self._throttled((ALERT_NEAR, names[i]), now):
+                        fired.append({'time': ts, 'kind': ALERT_NEAR, 'line': names[i], 'value': values[i],
+                                      'price': price, 'text': f"SPX {price:.2f} within {abs(gap):.1f}pt "
+                                                              f"of {names[i]} ({values[i]:.2f})"})
+            self._inside = inside
+            
+            if self.last_price is not None and price != self.last_price:
+                c_values, c_names = self._cross
+                up = price > self.last_price
+                a = bisect.bisect_right(c_values, min(price, self.last_price))
+                b = bisect.bisect_right(c_values, max(price, self.last_price))
+                crossed = range(a, b) if up else range(b - 1, a - 1, -1)
+                for i in crossed:
+                    direction = 'up' if up else 'down'
+                    if not self._throttled((ALERT_CROSS, c_names[i], direction), now):
+                        fired.append({'time': ts, 'kind': ALERT_CROSS, 'line': c_names[i],
+                                      'value': c_values[i], 'price': price, 'direction': direction,
+                                      'text': f"SPX crossed {c_names[i]} {c_values[i]:.2f} "
+                                              f"{'↑' if up else '↓'} ({price:.2f})"})
+            self.last_price = price
+            self.fired += len(fired)
+        
+        for event in fired:
+            for sink in self.sinks:
+                try:
+                    sink.send(event)
+                except Exception:
+                    pass
+        return fired
+
+
+def ladder_alerts(ny_ladder: list, key_values: dict, distance: float) -> list:
+    """Near alerts on every projected line plus cross alerts on the four key levels."""
+    alerts = [{'kind': ALERT_NEAR, 'name': f"{l['short']} {l['name']}", 'value': l['value'],
+               'distance': distance} for l in ny_ladder]
+    alerts += [{'kind': ALERT_CROSS, 'name': name, 'value': value} for name, value in key_values.items()]
+    return alerts
+
+
+def build_alert_sinks(config: dict) -> list:
+    """Sinks from the [alerts] secrets table: webhook_url, file. The desktop stub is always on."""
+    sinks = [DesktopAlertSink()]
+    if config.get('webhook_url'):
+        sinks.append(WebhookAlertSink(config['webhook_url']))
+    if config.get('file'):
+        sinks.append(FileAlertSink(config['file']))
+    return sinks
+
+
+# ============================================================
+# ASIAN 6 PM FRAMEWORK
+# Line ladder at 6 PM / 7 PM CT and the futures setups it generates
+# ============================================================
+
+ASIAN_DECISION_CT = time(18, 0)
+ASIAN_EXIT_CT = time(19, 0)
+ASIAN_STOP_POINTS = 2.0        # fade setups: stop beyond the line
+ASIAN_BREAKOUT_TRIGGER = 1.0   # price within this of a line → breakout / breakdown setup
+ASIAN_BREAKOUT_BUFFER = 0.5    # breakout entry beyond the line
+ASIAN_BREAKOUT_STOP = 1.5      # breakout stop back through the line
+ASIAN_BREAKOUT_T1 = 2.5
+ASIAN_MAX_MOVE = 5.0
+
+
+def build_asian_ladder(levels: dict, overnight_date, es_offset: float = 0.0) -> list:
+    """
+    Every projected line at 6 PM and 7 PM CT on overnight_date, high → low by
+    6 PM value, at the rate the levels were projected with. Levels are
+    SPX-adjusted; es_offset adds the spread back for ES.
+    """
+    decision_time = datetime.combine(overnight_date, ASIAN_DECISION_CT)
+    exit_time = datetime.combine(overnight_date, ASIAN_EXIT_CT)
+    rate = levels.get('rate', RATE_PER_CANDLE)
+    ladder = []
+    for direction, lines in (('ascending', levels['ascending']), ('descending', levels['descending'])):
+        for line in lines:
+            key_type = 'highest_wick' if direction == 'ascending' else 'lowest_wick'
+            is_key = line['type'] == key_type
+            if direction == 'ascending':
+                short, color = f"{'HW' if is_key else 'B'} ↗", '#ff1744' if is_key else '#ff5252'
+            else:
+                short, color = f"{'LW' if is_key else 'R'} ↘", '#00e676' if is_key else '#69f0ae'
+            ladder.append({
+                'name': line['source'].split(' @ ')[0] if ' @ ' in line['source'] else line['source'],
+                'short': short,
+                'value_6pm': calculate_line_value(line['anchor_price'], line['anchor_time'], decision_time, direction, rate) + es_offset,
+                'value_7pm': calculate_line_value(line['anchor_price'], line['anchor_time'], exit_time, direction, rate) + es_offset,
+                'direction': direction,
+                'anchor': line['anchor_price'] + es_offset,
+                'color': color,
+                'is_key': is_key,
+            })
+    ladder.sort(key=lambda x: x['value_6pm'], reverse=True)
+    return ladder
+
+
+def asian_trade_setups(ladder: list, price: float, max_move: float = ASIAN_MAX_MOVE,
+                       stop_points: float = ASIAN_STOP_POINTS,
+                       breakout_trigger: float = ASIAN_BREAKOUT_TRIGGER) -> dict:
+    """
+    The 6 PM setups for an ES price against the 6 PM ladder:
+    
+    - SHORT / LONG: fade the nearest line above / below (price between two lines);
+      stop stop_points beyond the line, T1 back to price, T2 the opposite line
+      capped at max_move
+    - LONG BREAKOUT / SHORT BREAKDOWN: price within breakout_trigger of a line;
+      entry ASIAN_BREAKOUT_BUFFER through it, T2 capped by max_move and the next line
+    
+    Returns:
+        Dict with 'setups' (entry, stop, target_1, target_2, risk, rewards and
+        display fields), 'nearest_above', 'nearest_below'
+    """
+    lines_above = [l for l in ladder if l['value_6pm'] > price]
+    lines_below = [l for l in ladder if l['value_6pm'] <= price]
+    nearest_above = lines_above[-1] if lines_above else None  # closest above
+    nearest_below = lines_below[0] if lines_below else None   # closest below
+    second_above = lines_above[-2] if len(lines_above) >= 2 else None
+    second_below = lines_below[1] if len(lines_below) >= 2 else None
+    dist_above = (nearest_above['value_6pm'] - price) if nearest_above else 999
+    dist_below = (price - nearest_below['value_6pm']) if nearest_below else 999
+    
+    setups = []
+    
+    # SETUP 1: SHORT / LONG fades — resistance above and support below
+    if nearest_above and nearest_below:
+        short_entry = nearest_above['value_6pm']
+        short_stop = short_entry + stop_points
+        short_t1 = price  # back to current price
+        short_t2 = max(nearest_below['value_6pm'], short_entry - max_move)
+        setups.append({
+            'direction': 'SHORT',
+            'bias': 'Rejection at resistance',
+            'trigger': f"Price rallies to {short_entry:.2f} ({nearest_above['short']})",
+            'entry': short_entry,
+            'stop': short_stop,
+            'target_1': short_t1,
+            'target_2': short_t2,
+            'risk': short_stop - short_entry,
+            'reward_1': short_entry - short_t1,
+            'reward_2': short_entry - short_t2,
+            'color': '#ff5252',
+            'icon': '🔻',
+        })
+        
+        long_entry = nearest_below['value_6pm']
+        long_stop = long_entry - stop_points
+        long_t1 = price
+        long_t2 = min(nearest_above['value_6pm'], long_entry + max_move)
+        setups.append({
+            'direction': 'LONG',
+            'bias': 'Bounce at support',
+            'trigger': f"Price drops to {long_entry:.2f} ({nearest_below['short']})",
+            'entry': long_entry,
+            'stop': long_stop,
+            'target_1': long_t1,
+            'target_2': long_t2,
+            'risk': long_entry - long_stop,
+            'reward_1': long_t1 - long_entry,
+            'reward_2': long_t2 - long_entry,
+            'color': '#00e676',
+            'icon': '🔺',
+        })
+    
+    # SETUP 2: Breakout / breakdown — price already at a line
+    if nearest_above and dist_above <= breakout_trigger:
+        break_entry = nearest_above['value_6pm'] + ASIAN_BREAKOUT_BUFFER
+        break_stop = nearest_above['value_6pm'] - ASIAN_BREAKOUT_STOP
+        break_t1 = break_entry + ASIAN_BREAKOUT_T1
+        break_t2 = break_entry + max_move
+        if second_above:
+            break_t2 = min(break_t2, second_above['value_6pm'])
+        setups.append({
+            'direction': 'LONG BREAKOUT',
+            'bias': f"Break above {nearest_above['short']}",
+            'trigger': f"Price breaks above {nearest_above['value_6pm']:.2f} with momentum",
+            'entry': break_entry,
+            'stop': break_stop,
+            'target_1': break_t1,
+            'target_2': break_t2,
+            'risk': break_entry - break_stop,
+            'reward_1': break_t1 - break_entry,
+            'reward_2': break_t2 - break_entry,
+            'color': '#ffd740',
+            'icon': '⚡',
+        })
+    
+    if nearest_below and dist_below <= breakout_trigger:
+        break_entry = nearest_below['value_6pm'] - ASIAN_BREAKOUT_BUFFER
+        break_stop = nearest_below['value_6pm'] + ASIAN_BREAKOUT_STOP
+        break_t1 = break_entry - ASIAN_BREAKOUT_T1
+        break_t2 = break_entry - max_move
+        if second_below:
+            break_t2 = max(break_t2, second_below['value_6pm'])
+        setups.append({
+            'direction': 'SHORT BREAKDOWN',
+            'bias': f"Break below {nearest_below['short']}",
+            'trigger': f"Price breaks below {nearest_below['value_6pm']:.2f} with momentum",
+            'entry': break_entry,
+            'stop': break_stop,
+            'target_1': break_t1,
+            'target_2': break_t2,
+            'risk': break_stop - break_entry,
+            'reward_1': break_entry - break_t1,
+            'reward_2': break_entry - break_t2,
+            'color': '#ffd740',
+            'icon': '⚡',
+        })
+    
+    return {'setups': setups, 'nearest_above': nearest_above, 'nearest_below': nearest_below}
+
+
+# ============================================================
+# LIVE PIPELINE
+# Everything LIVE MODE does with one price tick, outside Streamlit —
+# shared by the app's live block and the session replay
+# ============================================================
+
+def live_banner(spx_price: float, key_values: dict) -> dict:
+    """Banner zone, signal text, color and the distance to each key level (high → low)."""
+    zone = live_zone(spx_price, key_values)
+    signal, color = LIVE_ZONES[zone] if zone is not None else ("", "#ffd740")
+    distances = []
+    for name, val in sorted(key_values.items(), key=lambda x: x[1], reverse=True):
+        diff = spx_price - val
+        arrow = "▲" if diff > 0 else "▼"
+        distances.append(f"{name}: {val:.2f} ({arrow}{abs(diff):.2f})")
+    return {'zone': zone, 'signal': signal, 'color': color, 'distances': distances}
+
+
+def live_banner_html(tick: dict, header: str) -> str:
+    """The live price banner for a LivePipeline tick."""
+    color = tick['color']
+    return f"""
+            <div style="background: linear-gradient(135deg, #0d1117 0%, #131a2e 100%); border: 2px solid {color}; 
+                        border-radius: 12px; padding: 15px; margin: 10px 0; text-align: center;">
+                <div style="font-family: 'Rajdhani'; color: #8892b0; font-size: 0.85rem;">
+                    {header}
+                </div>
+                <div style="font-family: 'Orbitron'; font-size: 2.2rem; color: {color}; margin: 5px 0;">
+                    {tick['spx_price']:.2f}
+                </div>
+                <div style="font-family: 'Orbitron'; font-size: 1rem; color: {color};">
+                    {tick['signal']}
+                </div>
+                <div style="font-family: 'JetBrains Mono'; font-size: 0.8rem; color: #8892b0; margin-top: 8px;">
+                    {'  •  '.join(tick['distances'])}
+                </div>
+            </div>
+            """
+
+
+def chain_auto_fetch_window(now_ct: datetime, clock) -> bool:
+    """
+    True while live option quotes are pulled automatically: on expiry day,
+    from 30 min before the open to 30 min before the close.
+    """
+    now_minute = now_ct.hour * 60 + now_ct.minute
+    return (now_ct.date() == clock.expiry_date and
+            clock.open_minute - 30 <= now_minute < clock.close_minute - 30)
+
+
+class LivePipeline:
+    """
+    One live session's per-tick state and evaluation.
+    
+    Each tick (an ES price and its quote time) runs the ladder state machine
+    and the level alerts (fresh ticks only), the banner zone and distances,
+    the 6 PM price auto-fill (follows the tick until the trader locks it;
+    a replay passes simulated_lock = (CT time, price) to lock that price at
+    the first tick from that time on, flagged as simulated), the 9 AM signal
+    at the tick price and the option chain auto-fetch window. Levels are
+    SPX-adjusted; ticks are ES.
+    
+    The signal only depends on where price sits among the ladder values
+    (ties included), so it is classified once per (bisect_left,
+    bisect_right) slot and reused while price stays in that slot.
+    """
+    def __init__(self, levels: dict, session_date, es_offset: float = 0.0, alert_engine=None,
+                 asian_max_move: float = ASIAN_MAX_MOVE, simulated_lock: tuple = None):
+        session_date = pd.Timestamp(session_date).date()
+        self.es_offset = es_offset
+        self.key_values = key_level_values(levels)
+        self.ny_ladder = build_ny_ladder(levels)
+        self.tracker = LiveSignalStateMachine(self.key_values, self.ny_ladder)
+        self.alert_engine = alert_engine
+        self._ladder_values = sorted(l['value'] for l in self.ny_ladder)
+        self._signals = {}
+        self.evening_date = session_date - timedelta(days=1)
+        self.asian_ladder = build_asian_ladder(levels, self.evening_date, es_offset)
+        self.asian_max_move = asian_max_move
+        self.clock = ExpiryClock(session_date)
+        self.simulated_lock = simulated_lock
+        self.lock_simulated = False
+        self.locked_price = None
+        self.asian_plan = None
+        self.last_time = None
+    
+    def lock(self, price: float):
+        """Freeze the 6 PM price and build its setups."""
+        self.locked_price = price
+        self.asian_plan = asian_trade_setups(self.asian_ladder, price, self.asian_max_move)
+    
+    def unlock(self):
+        self.locked_price = None
+        self.asian_plan = None
+        self.lock_simulated = False
+    
+    def tick(self, es_price: float, ts: datetime, stale: bool = False) -> dict:
+        """Evaluate one quote; a stale quote or a repeat of the last quote time only refreshes the view."""
+        spx_price = es_price - self.es_offset
+        fresh = not stale and ts != self.last_time
+        events, alerts = [], []
+        if fresh:
+            events = self.tracker.update(spx_price, ts)
+            if self.alert_engine is not None:
+                alerts = self.alert_engine.update(spx_price, ts)
+            self.last_time = ts
+            if (self.simulated_lock is not None and self.locked_price is None
+                    and ts >= self.simulated_lock[0]):
+                self.lock(self.simulated_lock[1])
+                self.lock_simulated = True
+        slot = (bisect.bisect_left(self._ladder_values, spx_price),
+                bisect.bisect_right(self._ladder_values, spx_price))
+        sig = self._signals.get(slot)
+        if sig is None:
+            sig = self._signals[slot] = classify_signal(self.ny_ladder, spx_price)
+        return {
+            'time': ts,
+            'es_price': es_price,
+            'spx_price': spx_price,
+            'fresh': fresh,
+            'events': events,
+            'alerts': alerts,
+            **live_banner(spx_price, self.key_values),
+            'asian_price': es_price if self.locked_price is None else self.locked_price,
+            'asian_locked': self.locked_price is not None,
+            'asian_simulated': self.lock_simulated,
+            'ny_signal': sig['signal'],
+            'ny_direction': sig['trade_direction'],
+            'auto_fetch': chain_auto_fetch_window(ts, self.clock),
+        }
+
+
 # ============================================================
 # PROP FIRM RISK CALCULATOR
 # ============================================================
@@ -833,6 +1613,61 @@ def calculate_confluence(asian_aligns: bool, london_sweep: bool,
     }
 
 
+CLUSTER_WIDTH = 5.0            # 3 lines within this many points = cluster
+CONFLUENCE_MOVE_THRESHOLD = 1.0  # Asian / data-window net move that counts as directional
+SWEEP_TOLERANCE = 0.5          # London must exceed the Asian extreme by this much
+DATA_SPIKE_RANGE = 3.0         # 7:30-8:30 range that counts as a data release
+OPENING_DRIVE_THRESHOLD = 0.5
+
+# CT minute-of-day windows used by the confluence factors
+ASIAN_WINDOW = (17 * 60, 2 * 60)        # 5:00 PM - 2:00 AM (wraps midnight)
+LONDON_WINDOW = (2 * 60, 8 * 60 + 30)   # 2:00 - 8:30 AM
+DATA_WINDOW = (7 * 60 + 30, 8 * 60 + 30)  # 7:30 - 8:30 AM
+OPEN_WINDOW = (8 * 60 + 30, 9 * 60)     # 8:30 - 9:00 AM
+
+
+def _session_window_stats(minute, group, o, h, l, c) -> pd.DataFrame:
+    """
+    First open, last close, high, low and bar count of every confluence window,
+    per group (one group = one session day), via one groupby per window.
+    Rows must be in time order. Columns are prefixed asian_/london_/data_/open_.
+    """
+    minute = np.asarray(minute)
+    windows = {
+        'asian': (minute >= ASIAN_WINDOW[0]) | (minute < ASIAN_WINDOW[1]),
+        'london': (minute >= LONDON_WINDOW[0]) & (minute < LONDON_WINDOW[1]),
+        'data': (minute >= DATA_WINDOW[0]) & (minute < DATA_WINDOW[1]),
+        'open': (minute >= OPEN_WINDOW[0]) & (minute < OPEN_WINDOW[1]),
+    }
+    frames = []
+    for name, mask in windows.items():
+        w = pd.DataFrame({'g': group[mask], 'o': o[mask], 'h': h[mask], 'l': l[mask], 'c': c[mask]})
+        agg = w.groupby('g', sort=True).agg(n=('o', 'size'), open=('o', 'first'), close=('c', 'last'),
+                                            high=('h', 'max'), low=('l', 'min'))
+        frames.append(agg.add_prefix(name + '_'))
+    stats = pd.concat(frames, axis=1)
+    n_cols = [f"{name}_n" for name in windows]
+    stats[n_cols] = stats[n_cols].fillna(0).astype(int)
+    return stats
+
+
+def _ohlc_arrays(df: pd.DataFrame, es_offset: float = 0) -> tuple:
+    """Open/high/low/close as float arrays in SPX terms, whatever the column case."""
+    cols = {str(c).lower().strip(): c for c in df.columns}
+    return tuple(df[cols[name]].to_numpy(dtype=float) - es_offset for name in ('open', 'high', 'low', 'close'))
+
+
+def line_cluster_flags(ladder_values, width: float = CLUSTER_WIDTH) -> np.ndarray:
+    """
+    Vectorized cluster test for many ladders at once: rows are days, columns
+    are line values (NaN-padded). True where any 3 lines sit within `width`.
+    """
+    v = np.sort(np.asarray(ladder_values, dtype=float), axis=1)  # NaNs sort last
+    if v.shape[1] < 3:
+        return np.zeros(len(v), dtype=bool)
+    return np.any(v[:, 2:] - v[:, :-2] <= width, axis=1)
+
+
 def auto_detect_confluence(ny_trade_direction: str, ny_ladder: list,
                            current_price: float, candles_df=None,
                            es_offset: float = 0) -> dict:
@@ -861,7 +1696,7 @@ def auto_detect_confluence(ny_trade_direction: str, ny_ladder: list,
     if ny_ladder and len(ny_ladder) >= 3:
         values = sorted([l['value'] for l in ny_ladder])
         for i in range(len(values) - 2):
-            if values[i+2] - values[i] <= 5.0:  # 3 lines within 5 points
+            if values[i+2] - values[i] <= CLUSTER_WIDTH:  # 3 lines within 5 points
                 cluster_lines = [l for l in ny_ladder if values[i] <= l['value'] <= values[i+2]]
                 cluster_names = ', '.join([l['short'] for l in cluster_lines[:3]])
                 results['line_cluster'] = True
@@ -872,93 +1707,52 @@ def auto_detect_confluence(ny_trade_direction: str, ny_ladder: list,
         return results
     
     try:
-        df = candles_df.copy()
-        # Normalize column names (yfinance returns lowercase)
-        norm_map = {}
-        for col in df.columns:
-            cl = col.lower().strip()
-            if cl == 'datetime':
-                norm_map[col] = 'Datetime'
-            elif cl == 'open':
-                norm_map[col] = 'Open'
-            elif cl == 'high':
-                norm_map[col] = 'High'
-            elif cl == 'low':
-                norm_map[col] = 'Low'
-            elif cl == 'close':
-                norm_map[col] = 'Close'
-        df = df.rename(columns=norm_map)
-        
-        # Ensure datetime index
-        if 'Datetime' in df.columns:
-            df['Datetime'] = pd.to_datetime(df['Datetime'])
-            df = df.set_index('Datetime')
-        elif not isinstance(df.index, pd.DatetimeIndex):
-            df.index = pd.to_datetime(df.index)
-        
-        # Convert ES to SPX terms
-        if es_offset != 0:
-            for col in ['Open', 'High', 'Low', 'Close']:
-                if col in df.columns:
-                    df[col] = df[col] - es_offset
-        
-        # Get session candles by hour (CT timezone)
-        # Asian: 5:00 PM - 2:00 AM CT (previous day 17:00 to 02:00)
-        # London: 2:00 AM - 8:30 AM CT
-        # Pre-market data: 7:30-8:00 AM, 8:00-8:30 AM candles
-        # Opening: 8:30-9:00 AM candle
-        
-        hours = df.index.hour
-        minutes = df.index.minute
-        time_decimal = hours + minutes / 60.0
-        
-        # Asian session: 17:00 - 02:00 CT
-        asian_mask = (time_decimal >= 17.0) | (time_decimal < 2.0)
-        asian_candles = df[asian_mask]
-        
-        # London session: 2:00 - 8:30 CT
-        london_mask = (time_decimal >= 2.0) & (time_decimal < 8.5)
-        london_candles = df[london_mask]
-        
-        # Data candle: 7:30-8:00 AM and 8:00-8:30 AM
-        data_mask = (time_decimal >= 7.5) & (time_decimal < 8.5)
-        data_candles = df[data_mask]
-        
-        # Opening drive: 8:30-9:00 AM candle
-        open_mask = (time_decimal >= 8.5) & (time_decimal < 9.0)
-        open_candles = df[open_mask]
+        # Read columns in place (no frame copy); ES → SPX via es_offset
+        o, h, l, c = _ohlc_arrays(candles_df, es_offset)
+        
+        # Minute of day in CT (precomputed at ingest when available)
+        if 'ct_minute' in candles_df.columns:
+            minute_of_day = candles_df['ct_minute'].to_numpy()
+        else:
+            cols = {str(col).lower().strip(): col for col in candles_df.columns}
+            times = pd.DatetimeIndex(pd.to_datetime(candles_df[cols['datetime']]) if 'datetime' in cols
+                                     else candles_df.index)
+            minute_of_day = times.hour.values * 60 + times.minute.values
+        
+        # Session windows (CT): Asian 5:00 PM - 2:00 AM, London 2:00 - 8:30 AM,
+        # pre-market data 7:30 - 8:30 AM, opening drive 8:30 - 9:00 AM
+        stats = _session_window_stats(minute_of_day, np.zeros(len(minute_of_day), dtype=int), o, h, l, c)
+        w = stats.iloc[0] if len(stats) else pd.Series({'asian_n': 0, 'london_n': 0, 'data_n': 0, 'open_n': 0})
         
         # ── Factor 1: Asian Session Aligned ──
-        if len(asian_candles) >= 2:
-            asian_open = asian_candles.iloc[0]['Open']
-            asian_close = asian_candles.iloc[-1]['Close']
-            asian_move = asian_close - asian_open
+        if w['asian_n'] >= 2:
+            asian_move = w['asian_close'] - w['asian_open']
             
-            if ny_trade_direction == 'PUT' and asian_move < -1.0:
+            if ny_trade_direction == 'PUT' and asian_move < -CONFLUENCE_MOVE_THRESHOLD:
                 results['asian_aligns'] = True
                 results['asian_detail'] = f"Asian sold off {asian_move:.1f}pt → aligns with PUT"
-            elif ny_trade_direction == 'CALL' and asian_move > 1.0:
+            elif ny_trade_direction == 'CALL' and asian_move > CONFLUENCE_MOVE_THRESHOLD:
                 results['asian_aligns'] = True
                 results['asian_detail'] = f"Asian rallied +{asian_move:.1f}pt → aligns with CALL"
-            elif abs(asian_move) <= 1.0:
+            elif abs(asian_move) <= CONFLUENCE_MOVE_THRESHOLD:
                 results['asian_detail'] = f"Asian flat ({asian_move:+.1f}pt) → no alignment"
             else:
                 direction_word = "rallied" if asian_move > 0 else "sold off"
                 results['asian_detail'] = f"Asian {direction_word} {asian_move:+.1f}pt → AGAINST {ny_trade_direction}"
         
         # ── Factor 2: London Sweep ──
-        if len(asian_candles) >= 2 and len(london_candles) >= 2:
-            asian_high = asian_candles['High'].max()
-            asian_low = asian_candles['Low'].min()
-            london_high = london_candles['High'].max()
-            london_low = london_candles['Low'].min()
-            london_close = london_candles.iloc[-1]['Close']
+        if w['asian_n'] >= 2 and w['london_n'] >= 2:
+            asian_high = w['asian_high']
+            asian_low = w['asian_low']
+            london_high = w['london_high']
+            london_low = w['london_low']
+            london_close = w['london_close']
             
             # London swept Asian high then reversed down → bearish sweep
-            swept_high = london_high > asian_high + 0.5
+            swept_high = london_high > asian_high + SWEEP_TOLERANCE
             reversed_from_high = london_close < asian_high
             # London swept Asian low then reversed up → bullish sweep
-            swept_low = london_low < asian_low - 0.5
+            swept_low = london_low < asian_low - SWEEP_TOLERANCE
             reversed_from_low = london_close > asian_low
             
             if ny_trade_direction == 'PUT' and swept_high and reversed_from_high:
@@ -973,23 +1767,19 @@ def auto_detect_confluence(ny_trade_direction: str, ny_ladder: list,
                 results['london_detail'] = f"No sweep (London H:{london_high:.0f} L:{london_low:.0f} vs Asian H:{asian_high:.0f} L:{asian_low:.0f})"
         
         # ── Factor 3: Data Reaction (7:30-8:30 AM) ──
-        if len(data_candles) >= 1:
-            data_open = data_candles.iloc[0]['Open']
-            data_high = data_candles['High'].max()
-            data_low = data_candles['Low'].min()
-            data_close = data_candles.iloc[-1]['Close']
-            data_range = data_high - data_low
-            data_move = data_close - data_open
+        if w['data_n'] >= 1:
+            data_range = w['data_high'] - w['data_low']
+            data_move = w['data_close'] - w['data_open']
             
             # Check if there was a significant spike (> 3pt range = data release)
-            if data_range > 3.0:
-                if ny_trade_direction == 'PUT' and data_move < -1.0:
+            if data_range > DATA_SPIKE_RANGE:
+                if ny_trade_direction == 'PUT' and data_move < -CONFLUENCE_MOVE_THRESHOLD:
                     results['data_reaction'] = 'aligned'
                     results['data_detail'] = f"Data drop {data_move:+.1f}pt → aligns with PUT"
-                elif ny_trade_direction == 'CALL' and data_move > 1.0:
+                elif ny_trade_direction == 'CALL' and data_move > CONFLUENCE_MOVE_THRESHOLD:
                     results['data_reaction'] = 'aligned'
                     results['data_detail'] = f"Data rally {data_move:+.1f}pt → aligns with CALL"
-                elif abs(data_move) <= 1.0 and data_range > 3.0:
+                elif abs(data_move) <= CONFLUENCE_MOVE_THRESHOLD:
                     results['data_reaction'] = 'absorbed'
                     results['data_detail'] = f"Data spike absorbed ({data_range:.1f}pt range, net {data_move:+.1f}pt)"
                 else:
@@ -1000,15 +1790,13 @@ def auto_detect_confluence(ny_trade_direction: str, ny_ladder: list,
                 results['data_detail'] = f"Quiet pre-market ({data_range:.1f}pt range) → neutral"
         
         # ── Factor 4: Opening Drive (8:30-9:00 AM) ──
-        if len(open_candles) >= 1:
-            open_o = open_candles.iloc[0]['Open']
-            open_c = open_candles.iloc[-1]['Close']
-            open_move = open_c - open_o
+        if w['open_n'] >= 1:
+            open_move = w['open_close'] - w['open_open']
             
-            if ny_trade_direction == 'PUT' and open_move < -0.5:
+            if ny_trade_direction == 'PUT' and open_move < -OPENING_DRIVE_THRESHOLD:
                 results['opening_drive'] = True
                 results['opening_detail'] = f"Opening drive down {open_move:+.1f}pt → aligns with PUT"
-            elif ny_trade_direction == 'CALL' and open_move > 0.5:
+            elif ny_trade_direction == 'CALL' and open_move > OPENING_DRIVE_THRESHOLD:
                 results['opening_drive'] = True
                 results['opening_detail'] = f"Opening drive up {open_move:+.1f}pt → aligns with CALL"
             else:
@@ -1022,6 +1810,195 @@ def auto_detect_confluence(ny_trade_direction: str, ny_ladder: list,
     return results
 
 
+def build_confluence_factor_table(candles_df: pd.DataFrame, es_offset: float = 0,
+                                  ladders: dict = None, cluster_width: float = CLUSTER_WIDTH,
+                                  move_threshold: float = CONFLUENCE_MOVE_THRESHOLD,
+                                  sweep_tolerance: float = SWEEP_TOLERANCE) -> pd.DataFrame:
+    """
+    Batch auto_detect_confluence(): the five factors for every session day in
+    a (multi-year) candle frame, in one vectorized pass.
+    
+    Each row is one trading day (its Asian session starts the evening before).
+    Raw window measurements are kept next to the factors, and direction-
+    dependent factors are given for both sides (_put / _call suffixes).
+    
+    Args:
+        candles_df: ES 30-min candles (canonical time columns added if missing)
+        es_offset: ES-SPX spread for converting candle prices
+        ladders: optional {date: [line values]} for the line-cluster factor
+        cluster_width, move_threshold, sweep_tolerance: factor thresholds
+    
+    Returns:
+        DataFrame indexed by date
+    """
+    df = ensure_time_columns(candles_df)
+    o, h, l, c = _ohlc_arrays(df, es_offset)
+    stats = _session_window_stats(df['ct_minute'].to_numpy(), df['session_day'].to_numpy(), o, h, l, c)
+    
+    table = pd.DataFrame(index=stats.index)
+    has_asian = (stats['asian_n'] >= 2).to_numpy()
+    has_london = has_asian & (stats['london_n'] >= 2).to_numpy()
+    has_data = (stats['data_n'] >= 1).to_numpy()
+    has_open = (stats['open_n'] >= 1).to_numpy()
+    
+    asian_move = np.where(has_asian, stats['asian_close'] - stats['asian_open'], np.nan)
+    swept_high = has_london & (stats['london_high'] > stats['asian_high'] + sweep_tolerance).to_numpy()
+    swept_low = has_london & (stats['london_low'] < stats['asian_low'] - sweep_tolerance).to_numpy()
+    rev_high = (stats['london_close'] < stats['asian_high']).to_numpy()
+    rev_low = (stats['london_close'] > stats['asian_low']).to_numpy()
+    data_range = np.where(has_data, stats['data_high'] - stats['data_low'], np.nan)
+    data_move = np.where(has_data, stats['data_close'] - stats['data_open'], np.nan)
+    open_move = np.where(has_open, stats['open_close'] - stats['open_open'], np.nan)
+    spike = has_data & (data_range > DATA_SPIKE_RANGE)
+    
+    table['asian_move'] = asian_move
+    table['london_swept_high'] = swept_high
+    table['london_swept_low'] = swept_low
+    table['data_range'] = data_range
+    table['data_move'] = data_move
+    table['open_move'] = open_move
+    
+    for side, sign in (('put', -1.0), ('call', 1.0)):
+        table[f'asian_aligns_{side}'] = sign * np.nan_to_num(asian_move) > move_threshold
+        table[f'london_sweep_{side}'] = (swept_high & rev_high) if side == 'put' else (swept_low & rev_low)
+        aligned = spike & (sign * np.nan_to_num(data_move) > move_threshold)
+        absorbed = ~spike | (np.abs(np.nan_to_num(data_move)) <= move_threshold)
+        table[f'data_reaction_{side}'] = np.select([aligned, absorbed], ['aligned', 'absorbed'], 'against')
+        table[f'opening_drive_{side}'] = sign * np.nan_to_num(open_move) > OPENING_DRIVE_THRESHOLD
+    
+    table.index = pd.to_datetime(table.index.to_numpy().astype('datetime64[D]')).date
+    table.index.name = 'date'
+    
+    table['line_cluster'] = False
+    if ladders:
+        days = [d for d in table.index if d in ladders]
+        if days:
+            width = max(len(ladders[d]) for d in days)
+            padded = np.full((len(days), width), np.nan)
+            for i, d in enumerate(days):
+                padded[i, :len(ladders[d])] = ladders[d]
+            table.loc[days, 'line_cluster'] = line_cluster_flags(padded, cluster_width)
+    return table
+
+
+def confluence_factors_for(table: pd.DataFrame, directions: pd.Series) -> pd.DataFrame:
+    """
+    Pick each day's side from a factor table (directions: date → 'PUT'/'CALL')
+    and score it like calculate_confluence().
+    
+    Returns:
+        DataFrame with asian_aligns, london_sweep, data_reaction, opening_drive,
+        line_cluster and score, for the days present in both inputs
+    """
+    days = table.index.intersection(directions.dropna().index)
+    t = table.loc[days]
+    is_put = (directions.loc[days] == 'PUT').to_numpy()
+    out = pd.DataFrame(index=days)
+    for factor in ('asian_aligns', 'london_sweep', 'data_reaction', 'opening_drive'):
+        out[factor] = np.where(is_put, t[f'{factor}_put'], t[f'{factor}_call'])
+    out['line_cluster'] = t['line_cluster'].to_numpy()
+    out['score'] = (out['asian_aligns'].astype(float) + out['london_sweep'] + out['opening_drive'] +
+                    out['line_cluster'] + out['data_reaction'].map({'aligned': 1.0, 'absorbed': 0.5}).fillna(0.0))
+    return out
+
+
+CONFLUENCE_FACTORS = ['asian_aligns', 'london_sweep', 'data_reaction', 'opening_drive', 'line_cluster']
+DIRECTION_SIDE = {'PUT': 'PUT', 'CALL': 'CALL'}  # NY options only: the factors run past the 6 PM futures trade
+
+
+def join_outcomes_with_factors(outcomes: pd.DataFrame, table: pd.DataFrame) -> pd.DataFrame:
+    """
+    Attach each trade's confluence factors from a factor table by date and side.
+    Factor columns already on the outcomes (NY backtest rows carry them, see
+    apply_confluence_filter) take precedence; table may then be None.
+    Only NY PUT / CALL trades are joined: a 6 PM futures trade happens before
+    the London, data and opening windows its day's factors measure.
+    
+    Args:
+        outcomes: one row per trade with 'date', 'direction' and 'pnl'
+        table: build_confluence_factor_table() output
+    
+    Returns:
+        outcomes with the five factor columns; trades on days missing from
+        the table keep whatever factors they carried (or are dropped)
+    """
+    df = outcomes[outcomes['direction'].isin(DIRECTION_SIDE)].copy()
+    df['date'] = pd.to_datetime(df['date']).dt.date
+    is_put = (df['direction'].map(DIRECTION_SIDE) == 'PUT').to_numpy()
+    missing = [f for f in CONFLUENCE_FACTORS if f not in df.columns]
+    if missing and table is not None and len(table):
+        rows = table.reindex(df['date'])
+        found = rows.index.isin(table.index)
+        for f in missing:
+            if f == 'line_cluster':
+                picked = rows['line_cluster'].to_numpy()
+            else:
+                picked = np.where(is_put, rows[f'{f}_put'].to_numpy(), rows[f'{f}_call'].to_numpy())
+            df[f] = pd.Series(picked, index=df.index).where(found)
+    df = df.dropna(subset=[f for f in CONFLUENCE_FACTORS if f in df.columns])
+    return df
+
+
+def confluence_combination_stats(trades: pd.DataFrame) -> pd.DataFrame:
+    """
+    Win rate, expectancy and sample size for every combination of the five
+    confluence factors (2 × 2 × 3 × 2 × 2 = 48 rows, empty combos have n = 0),
+    from one groupby over a joined outcome frame.
+    
+    Returns:
+        DataFrame with the factor columns plus n, wins, win_rate, expectancy,
+        total_pnl and avg_r (when trades carry an 'r' column), best first
+    """
+    df = trades.copy()
+    df['win'] = df['pnl'] > 0
+    agg = {'n': ('pnl', 'size'), 'wins': ('win', 'sum'),
+           'expectancy': ('pnl', 'mean'), 'total_pnl': ('pnl', 'sum')}
+    if 'r' in df.columns:
+        agg['avg_r'] = ('r', 'mean')
+    for f in ('asian_aligns', 'london_sweep', 'opening_drive', 'line_cluster'):
+        df[f] = df[f].astype(bool)
+    grouped = df.groupby(CONFLUENCE_FACTORS).agg(**agg)
+    
+    full = pd.MultiIndex.from_product([[True, False], [True, False], ['aligned', 'absorbed', 'against'],
+                                       [True, False], [True, False]], names=CONFLUENCE_FACTORS)
+    stats = grouped.reindex(full)
+    stats[['n', 'wins']] = stats[['n', 'wins']].fillna(0).astype(int)
+    stats['win_rate'] = np.where(stats['n'] > 0, stats['wins'] / stats['n'].clip(lower=1) * 100, np.nan)
+    stats = stats.reset_index()
+    stats['score'] = (stats['asian_aligns'].astype(float) + stats['london_sweep'] + stats['opening_drive'] +
+                      stats['line_cluster'] + stats['data_reaction'].map({'aligned': 1.0, 'absorbed': 0.5, 'against': 0.0}))
+    return stats.sort_values(['n', 'expectancy'], ascending=[False, False], key=lambda c: c.fillna(-np.inf)) \
+        .reset_index(drop=True)
+
+
+@st.cache_data(show_spinner=False, max_entries=8)
+def cached_combination_stats(trades_key: tuple, store_signature: tuple, es_offset: float = 0,
+                             rate: float = RATE_PER_CANDLE) -> dict:
+    """
+    Factor-combination stats for the NY options trades in the log, recomputed
+    only when a trade is added/edited (trades_key), the candle store changes
+    or the rate changes. The line-cluster factor uses each trade day's 9 AM
+    ladder, rebuilt from the stored prior session as the backtester does.
+    trades_key: tuple of (date, direction, pnl) per trade.
+    """
+    trades = pd.DataFrame(list(trades_key), columns=['date', 'direction', 'pnl'])
+    trades = trades[trades['direction'].isin(DIRECTION_SIDE)]
+    table = None
+    if store_signature and len(trades):
+        candles = ensure_time_columns(load_candle_store()).sort_values('ts_ns').reset_index(drop=True)
+        wanted = {day_number(d) for d in trades['date']}
+        pairs = [pair for pair in ny_backtest_days(candles) if pair[1] in wanted]
+        ladders = {}
+        for (_, trade_day), prepared in zip(pairs, prepare_backtest_days(candles, pairs)):
+            levels = backtest_day_levels(prepared, trade_day, es_offset, rate)
+            if levels is not None:
+                ladders[_day_date(trade_day).date()] = [line['value'] for line in build_ny_ladder(levels)]
+        table = build_confluence_factor_table(candles, es_offset, ladders)
+    joined = join_outcomes_with_factors(trades, table)
+    return {'joined': len(joined), 'total': len(trades),
+            'stats': confluence_combination_stats(joined) if len(joined) else None}
+
+
 # ============================================================
 # SESSION TIME ZONES (all in CT)
 # ============================================================
@@ -1039,6 +2016,72 @@ SESSION_TIMES = {
 # yfinance (primary for historical) → Tastytrade SDK (live streaming)
 # ============================================================
 
+CT_TZ = 'America/Chicago'
+NS_PER_MINUTE = 60 * 10**9
+GLOBEX_OPEN_MINUTE = MAINTENANCE_END_CT.hour * 60  # bars from 5:00 PM CT belong to the next session
+
+
+def to_ct_naive(value):
+    """
+    Convert a tz-aware Timestamp / DatetimeIndex / Series to naive CT.
+    Naive input is assumed to already be CT and is returned unchanged.
+    """
+    if isinstance(value, pd.Series):
+        return value.dt.tz_convert(CT_TZ).dt.tz_localize(None) if value.dt.tz is not None else value
+    if getattr(value, 'tz', None) is not None:
+        return value.tz_convert(CT_TZ).tz_localize(None)
+    return value
+
+
+def add_time_columns(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Attach the canonical timeline to a candle frame, once, at ingest.
+    
+    - datetime:    naive CT (what the rest of the app displays and compares)
+    - ts_ns:       int64 epoch nanoseconds, UTC (canonical, DST-proof)
+    - ct_minute:   int16 minute of day in CT (0-1439)
+    - ct_day:      int32 CT calendar day (days since 1970-01-01)
+    - session_day: int32 Globex session day (bars from 5 PM CT roll to the next day)
+    
+    Tz-aware input is converted exactly. Naive input is treated as CT; an existing
+    ts_ns column is kept so repaired frames can be re-derived without re-localizing.
+    """
+    dt = pd.to_datetime(df['datetime'])
+    if dt.dt.tz is not None:
+        ts_ns = pd.DatetimeIndex(dt).as_unit('ns').asi8
+        dt = to_ct_naive(dt)
+    elif 'ts_ns' in df.columns:
+        ts_ns = df['ts_ns'].values.astype(np.int64)
+    else:
+        # Fall-back hour (Nov) resolves to standard time; nonexistent (Mar) shifts forward
+        aware = dt.dt.tz_localize(CT_TZ, ambiguous=np.zeros(len(dt), dtype=bool),
+                                  nonexistent='shift_forward')
+        ts_ns = pd.DatetimeIndex(aware).as_unit('ns').asi8
+    
+    ct_index = pd.DatetimeIndex(dt)
+    ct_minute = (ct_index.hour.values * 60 + ct_index.minute.values).astype(np.int16)
+    ct_day = ct_index.values.astype('datetime64[D]').astype(np.int64).astype(np.int32)
+    
+    df['datetime'] = dt.values
+    df['ts_ns'] = ts_ns
+    df['ct_minute'] = ct_minute
+    df['ct_day'] = ct_day
+    df['session_day'] = ct_day + (ct_minute >= GLOBEX_OPEN_MINUTE).astype(np.int32)
+    return df
+
+
+def ensure_time_columns(df: pd.DataFrame) -> pd.DataFrame:
+    """Return df with the canonical time columns, adding them only if missing."""
+    if all(col in df.columns for col in ('ts_ns', 'ct_minute', 'ct_day', 'session_day')):
+        return df
+    return add_time_columns(df.copy())
+
+
+def day_number(d) -> int:
+    """Date → days since epoch, the integer used by ct_day / session_day."""
+    return int(np.datetime64(pd.Timestamp(d).date(), 'D').astype(np.int64))
+
+
 class DataSourceStatus:
     """Track data source status for display"""
     def __init__(self):
@@ -1047,6 +2090,7 @@ class DataSourceStatus:
         self.source_used = "manual"
         self.error_msg = ""
         self.candles = None  # DataFrame with OHLC 30-min candles
+        self.quality = None  # validate_candles() report for the fetched frame
 
 
 def fetch_yfinance_candles(start_date: str, end_date: str) -> dict:
@@ -1079,13 +2123,8 @@ def fetch_yfinance_candles(start_date: str, end_date: str) -> dict:
             df = df.rename(columns=col_map)
             if 'datetime' not in df.columns:
                 df = df.rename(columns={df.columns[0]: 'datetime'})
-            df['datetime'] = pd.to_datetime(df['datetime'])
-            # Convert to CT if timezone-aware
-            if df['datetime'].dt.tz is not None:
-                import pytz
-                ct = pytz.timezone('America/Chicago')
-                df['datetime'] = df['datetime'].dt.tz_convert(ct).dt.tz_localize(None)
-            df = df.sort_values('datetime').reset_index(drop=True)
+            df = add_time_columns(df)
+            df = df.sort_values('ts_ns').reset_index(drop=True)
             return {'ok': True, 'data': df}
         return {'ok': False, 'error': 'No data returned from Yahoo Finance'}
     except ImportError:
@@ -1128,7 +2167,7 @@ def fetch_tastytrade_candles_via_sdk(start_dt: datetime, end_dt: datetime) -> di
                     while True:
                         candle = await aio.wait_for(streamer.get_event(Candle), timeout=10)
                         candles.append({
-                            'datetime': datetime.fromtimestamp(candle.time / 1000),
+                            'datetime': candle.time,  # epoch ms, converted below
                             'open': float(candle.open),
                             'high': float(candle.high),
                             'low': float(candle.low),
@@ -1147,8 +2186,9 @@ def fetch_tastytrade_candles_via_sdk(start_dt: datetime, end_dt: datetime) -> di
         
         if candles:
             df = pd.DataFrame(candles)
-            df['datetime'] = pd.to_datetime(df['datetime'])
-            df = df.sort_values('datetime').reset_index(drop=True)
+            df['datetime'] = pd.to_datetime(df['datetime'], unit='ms', utc=True)
+            df = add_time_columns(df)
+            df = df.sort_values('ts_ns').reset_index(drop=True)
             # Filter to date range
             df = df[(df['datetime'] >= start_dt) & (df['datetime'] <= end_dt)]
             if len(df) > 0:
@@ -1175,7 +2215,8 @@ def fetch_es_candles(prior_date, next_date) -> DataSourceStatus:
     if result['ok']:
         status.yfinance_ok = True
         status.source_used = "yfinance"
-        status.candles = result['data']
+        status.quality = validate_candles(result['data'], repair=True)
+        status.candles = status.quality['data']
         return status
     
     yf_error = result['error']
@@ -1187,7 +2228,8 @@ def fetch_es_candles(prior_date, next_date) -> DataSourceStatus:
     if result['ok']:
         status.tastytrade_ok = True
         status.source_used = "tastytrade"
-        status.candles = result['data']
+        status.quality = validate_candles(result['data'], repair=True)
+        status.candles = status.quality['data']
         return status
     
     tt_error = result['error']
@@ -1224,16 +2266,13 @@ def calculate_es_spx_spread(es_candles: pd.DataFrame, session_date) -> dict:
         spx_df = spx_df.rename(columns=col_map)
         if 'datetime' not in spx_df.columns:
             spx_df = spx_df.rename(columns={spx_df.columns[0]: 'datetime'})
-        spx_df['datetime'] = pd.to_datetime(spx_df['datetime'])
-        if spx_df['datetime'].dt.tz is not None:
-            import pytz
-            ct = pytz.timezone('America/Chicago')
-            spx_df['datetime'] = spx_df['datetime'].dt.tz_convert(ct).dt.tz_localize(None)
+        spx_df = add_time_columns(spx_df)
         
-        # Round both to nearest 30 min for matching
-        es_rth = es_candles.copy()
-        es_rth['dt_round'] = es_rth['datetime'].dt.round('30min')
-        spx_df['dt_round'] = spx_df['datetime'].dt.round('30min')
+        # Round both to nearest 30 min on the integer timeline for matching
+        slot_ns = CANDLE_MINUTES * NS_PER_MINUTE
+        es_rth = ensure_time_columns(es_candles)[['ts_ns', 'close']].copy()
+        es_rth['dt_round'] = (es_rth['ts_ns'].values + slot_ns // 2) // slot_ns
+        spx_df['dt_round'] = (spx_df['ts_ns'].values + slot_ns // 2) // slot_ns
         
         merged = es_rth.merge(spx_df[['dt_round', 'close']], on='dt_round', 
                                suffixes=('_es', '_spx'), how='inner')
@@ -1271,11 +2310,7 @@ def fetch_live_price() -> dict:
         data = es.history(period="1d", interval="1m")
         if len(data) > 0:
             last = data.iloc[-1]
-            last_time = data.index[-1]
-            if hasattr(last_time, 'tz') and last_time.tz is not None:
-                import pytz
-                ct = pytz.timezone('America/Chicago')
-                last_time = last_time.tz_convert(ct).tz_localize(None)
+            last_time = to_ct_naive(data.index[-1])
             return {
                 'ok': True,
                 'price': float(last['Close']),
@@ -1289,62 +2324,814 @@ def fetch_live_price() -> dict:
         return {'ok': False, 'error': str(e), 'price': 0}
 
 
-def estimate_option_premium(spx_price: float, strike: float, vix: float,
-                             hours_to_expiry: float, opt_type: str) -> float:
+# ============================================================
+# BACKGROUND-REFRESHED VALUES
+# Process-wide caches (st.cache_resource) refreshed off the script thread
+# ============================================================
+
+VIX_DEFAULT = 18.0
+VIX_REFRESH_SECONDS = 60  # override with vix_refresh_seconds in secrets.toml (server-wide)
+
+
+class BackgroundRefreshCache:
     """
-    Estimate 0DTE SPX option premium using Black-Scholes with 0DTE adjustment.
-    
-    Real 0DTE options trade at a discount to theoretical BS because:
-    - Realized vol is lower than implied for short timeframes
-    - Bid-ask spread compresses theoretical value
-    - Market makers discount extreme gamma risk
+    Stale-while-revalidate holder for a single value.
     
-    We apply a 0.35x discount factor to align with typical 0DTE market prices.
+    A daemon thread calls loader() every `interval` seconds. Readers call get()
+    and always receive the latest value already in memory — they never wait on
+    the network. A failed refresh keeps the previous value and records the error.
     """
-    import math
-    
-    if hours_to_expiry <= 0:
-        if opt_type == 'CALL':
-            return max(0, spx_price - strike)
-        else:
-            return max(0, strike - spx_price)
-    
-    T = hours_to_expiry / (252 * 6.5)  # fraction of trading year
-    sigma = vix / 100.0  # annualized vol
-    
-    if T <= 0 or sigma <= 0:
-        return 0.25
-    
-    def norm_cdf(x):
-        return 0.5 * (1 + math.erf(x / math.sqrt(2)))
+    def __init__(self, loader, interval: float, name: str = "value"):
+        self._loader = loader
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self.interval = interval
+        self.name = name
+        self.value = None
+        self.updated = None   # datetime of last successful refresh
+        self.error = ""
+        self.refreshes = 0
+        self._thread = threading.Thread(target=self._run, name=f"refresh-{name}", daemon=True)
+        self._thread.start()
     
-    vol_t = sigma * math.sqrt(T)
+    def _run(self):
+        while True:
+            self.refresh()
+            self._wake.wait(self.interval)
+            self._wake.clear()
     
-    # Standard Black-Scholes
-    d1 = (math.log(spx_price / strike)) / vol_t + 0.5 * vol_t
-    d2 = d1 - vol_t
-    
-    if opt_type == 'CALL':
-        premium = spx_price * norm_cdf(d1) - strike * norm_cdf(d2)
-    else:
-        premium = strike * norm_cdf(-d2) - spx_price * norm_cdf(-d1)
+    def refresh(self) -> bool:
+        """Load a new value now (called by the background thread)."""
+        try:
+            value = self._loader()
+        except Exception as e:
+            with self._lock:
+                self.error = str(e)[:120]
+            return False
+        with self._lock:
+            self.value = value
+            self.updated = datetime.now()
+            self.error = ""
+            self.refreshes += 1
+        return True
     
-    # 0DTE discount: real market trades at ~35% of theoretical BS for OTM options
-    # This narrows as options go ITM (intrinsic value dominates)
-    intrinsic = max(0, (strike - spx_price) if opt_type == 'PUT' else (spx_price - strike))
-    extrinsic = max(0, premium - intrinsic)
-    adjusted = intrinsic + extrinsic * 0.35
+    def set_interval(self, seconds: float):
+        """Change the refresh interval; takes effect after the current wait."""
+        seconds = max(5.0, float(seconds))
+        if seconds != self.interval:
+            self.interval = seconds
+            self._wake.set()
     
-    return max(0.25, round(adjusted * 4) / 4)  # min $0.25, round to nearest 0.25
+    def get(self) -> dict:
+        """Latest value with its age. Stale = older than two refresh intervals."""
+        with self._lock:
+            value, updated, error = self.value, self.updated, self.error
+        age = (datetime.now() - updated).total_seconds() if updated else None
+        return {
+            'value': value,
+            'updated': updated,
+            'age': age,
+            'stale': age is None or age > 2 * self.interval,
+            'error': error,
+        }
 
 
-def project_premium_at_scenarios(current_spx: float, strike: float, vix: float,
-                                  opt_type: str, stop_price: float,
-                                  tp1_price: float, tp2_price: float,
-                                  base_premium: float = None,
-                                  current_hours: float = 6.5,
-                                  entry_hours: float = 5.9) -> dict:
-    """
+def fetch_vix() -> float:
+    """Latest ^VIX close from yfinance. Raises if no data is returned."""
+    import yfinance as yf
+    vix_data = yf.Ticker("^VIX").history(period="1d")
+    if len(vix_data) == 0:
+        raise ValueError("No VIX data returned")
+    return float(vix_data['Close'].iloc[-1])
+
+
+def vix_refresh_seconds() -> float:
+    """The shared VIX cache's refresh interval: an admin setting, never a per-viewer one."""
+    seconds = VIX_REFRESH_SECONDS
+    try:
+        seconds = float(st.secrets.get("vix_refresh_seconds", seconds))
+    except:
+        pass
+    return seconds
+
+
+@st.cache_resource(show_spinner=False)
+def get_vix_cache() -> BackgroundRefreshCache:
+    """One VIX cache per server process, shared by every session."""
+    return BackgroundRefreshCache(lambda: coalesced(('vix',), fetch_vix), vix_refresh_seconds(), name="vix")
+
+
+RV_WINDOW_BARS = 60       # rolling window of 1-minute bars
+RV_MIN_BARS = 15
+RV_REFRESH_SECONDS = 60
+RV_ESTIMATORS = {
+    'garman_klass': "Realized (Garman-Klass)",
+    'parkinson': "Realized (Parkinson)",
+    'close_to_close': "Realized (close-to-close)",
+}
+
+
+class RealizedVolEstimator:
+    """
+    Rolling realized volatility over the last `window` 1-minute bars.
+    
+    Keeps running sums of the per-bar Parkinson, Garman-Klass and
+    close-to-close terms, so each new bar costs O(1): add its terms, subtract
+    the bar leaving the window. Estimates are annualized over trading minutes
+    (252 × 390) to match the pricing engine.
+    """
+    _LN2_4 = 4.0 * np.log(2.0)
+    _GK_C = 2.0 * np.log(2.0) - 1.0
+    
+    def __init__(self, window: int = RV_WINDOW_BARS):
+        self.window = window
+        self._lock = threading.Lock()
+        self._bars = deque()
+        self._sum_pk = 0.0
+        self._sum_gk = 0.0
+        self._sum_r = 0.0
+        self._sum_r2 = 0.0
+        self._n_r = 0
+        self._last_close = None
+        self.last_ts = None
+    
+    def update(self, ts, o: float, h: float, l: float, c: float) -> bool:
+        """Add one completed bar. Bars at or before the last one seen are ignored."""
+        if not (o > 0 and h > 0 and l > 0 and c > 0) or h < l:
+            return False
+        with self._lock:
+            if self.last_ts is not None and ts <= self.last_ts:
+                return False
+            hl = np.log(h / l)
+            co = np.log(c / o)
+            pk = hl * hl / self._LN2_4
+            gk = 0.5 * hl * hl - self._GK_C * co * co
+            r = np.log(c / self._last_close) if self._last_close else None
+            
+            self._bars.append((pk, gk, r))
+            self._sum_pk += pk
+            self._sum_gk += gk
+            if r is not None:
+                self._sum_r += r
+                self._sum_r2 += r * r
+                self._n_r += 1
+            if len(self._bars) > self.window:
+                old_pk, old_gk, old_r = self._bars.popleft()
+                self._sum_pk -= old_pk
+                self._sum_gk -= old_gk
+                if old_r is not None:
+                    self._sum_r -= old_r
+                    self._sum_r2 -= old_r * old_r
+                    self._n_r -= 1
+            self._last_close = c
+            self.last_ts = ts
+            return True
+    
+    def update_frame(self, df: pd.DataFrame, skip_last: bool = True) -> dict:
+        """
+        Feed only the bars newer than the last one seen (binary search on ts_ns).
+        skip_last leaves out the final bar, which is still forming on a live feed.
+        """
+        df = ensure_time_columns(df)
+        ts = df['ts_ns'].to_numpy()
+        start = 0 if self.last_ts is None else int(np.searchsorted(ts, self.last_ts, side='right'))
+        stop = len(df) - 1 if skip_last else len(df)
+        ohlc = df[['open', 'high', 'low', 'close']].to_numpy(dtype=float)
+        for i in range(start, stop):
+            self.update(int(ts[i]), *ohlc[i])
+        return self.estimates()
+    
+    def estimates(self) -> dict:
+        """Annualized vols as decimals (None until RV_MIN_BARS bars are in the window)."""
+        with self._lock:
+            n = len(self._bars)
+            out = {'bars': n, 'as_of': self.last_ts,
+                   'parkinson': None, 'garman_klass': None, 'close_to_close': None}
+            if n < RV_MIN_BARS:
+                return out
+            out['parkinson'] = float(np.sqrt(max(self._sum_pk, 0.0) / n * TRADING_MINUTES_PER_YEAR))
+            out['garman_klass'] = float(np.sqrt(max(self._sum_gk, 0.0) / n * TRADING_MINUTES_PER_YEAR))
+            if self._n_r >= 2:
+                var = (self._sum_r2 - self._sum_r ** 2 / self._n_r) / (self._n_r - 1)
+                out['close_to_close'] = float(np.sqrt(max(var, 0.0) * TRADING_MINUTES_PER_YEAR))
+            return out
+
+
+def fetch_es_minute_bars() -> pd.DataFrame:
+    """Today's ES=F 1-minute bars from yfinance. Raises if no data is returned."""
+    import yfinance as yf
+    data = yf.Ticker("ES=F").history(period="1d", interval="1m")
+    if len(data) == 0:
+        raise ValueError("No ES 1-minute data returned")
+    data = data.reset_index()
+    data.columns = [str(c).lower() for c in data.columns]
+    data = data.rename(columns={data.columns[0]: 'datetime'})
+    return add_time_columns(data).sort_values('ts_ns').reset_index(drop=True)
+
+
+def _refresh_realized_vol(estimator: RealizedVolEstimator) -> dict:
+    """Feed the estimator and keep the completed 1-minute bars in the local store."""
+    bars = coalesced(('es_1m',), fetch_es_minute_bars)
+    try:
+        store_candles(bars.iloc[:-1], '1m')
+    except Exception:
+        pass
+    return estimator.update_frame(bars)
+
+
+@st.cache_resource(show_spinner=False)
+def get_realized_vol_cache() -> BackgroundRefreshCache:
+    """Process-wide realized-vol estimator fed incrementally from ES 1-minute bars."""
+    estimator = RealizedVolEstimator()
+    return BackgroundRefreshCache(lambda: _refresh_realized_vol(estimator),
+                                  RV_REFRESH_SECONDS, name="realized_vol")
+
+
+# ============================================================
+# REQUEST COALESCING (single-flight)
+# Identical concurrent fetches across sessions share one upstream call
+# ============================================================
+
+class SingleFlight:
+    """
+    Process-wide single-flight group.
+    
+    The first caller for a key runs the upstream function; callers that arrive
+    with the same key while it is in flight wait and receive the same result
+    (or the same exception). Nothing is cached after the call completes.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._inflight = {}   # key -> {'done': Event, 'result': ..., 'error': ...}
+        self._stats = {}      # source name -> counters
+    
+    def do(self, key: tuple, fn, *args, **kwargs):
+        with self._lock:
+            counters = self._stats.setdefault(key[0], {'requests': 0, 'upstream': 0, 'coalesced': 0})
+            counters['requests'] += 1
+            call = self._inflight.get(key)
+            leader = call is None
+            if leader:
+                call = {'done': threading.Event(), 'result': None, 'error': None}
+                self._inflight[key] = call
+                counters['upstream'] += 1
+            else:
+                counters['coalesced'] += 1
+        
+        if leader:
+            try:
+                call['result'] = fn(*args, **kwargs)
+            except Exception as e:
+                call['error'] = e
+            finally:
+                with self._lock:
+                    self._inflight.pop(key, None)
+                call['done'].set()
+        else:
+            call['done'].wait()
+        
+        if call['error'] is not None:
+            raise call['error']
+        return call['result']
+    
+    def metrics(self) -> dict:
+        """Per-source counters plus totals. 'saved' = upstream calls avoided."""
+        with self._lock:
+            per_source = {name: dict(c) for name, c in self._stats.items()}
+            in_flight = len(self._inflight)
+        totals = {
+            'requests': sum(c['requests'] for c in per_source.values()),
+            'upstream': sum(c['upstream'] for c in per_source.values()),
+            'saved': sum(c['coalesced'] for c in per_source.values()),
+            'in_flight': in_flight,
+        }
+        return {'sources': per_source, 'totals': totals}
+
+
+@st.cache_resource(show_spinner=False)
+def get_single_flight() -> SingleFlight:
+    """One single-flight group per server process, shared by every session."""
+    return SingleFlight()
+
+
+def coalesced(key: tuple, fn, *args, **kwargs):
+    """Run fn(*args) through the shared single-flight group under `key`."""
+    return get_single_flight().do(key, fn, *args, **kwargs)
+
+
+def tastytrade_login() -> str:
+    """Authenticate with the Tastytrade REST API using secrets. Returns '' if no credentials."""
+    import requests as req
+    tt_user, tt_pass = "", ""
+    try:
+        tt_user = st.secrets.get("tastytrade", {}).get("username", "")
+        tt_pass = st.secrets.get("tastytrade", {}).get("password", "")
+    except:
+        pass
+    if tt_user and tt_pass:
+        auth_resp = req.post("https://api.tastytrade.com/sessions",
+                              json={"login": tt_user, "password": tt_pass}, timeout=10)
+        if auth_resp.status_code in (200, 201):
+            return auth_resp.json().get("data", {}).get("session-token", "")
+    return ""
+
+
+def build_occ_symbol(exp_date, opt_type: str, strike: float) -> str:
+    """OCC symbol for an SPXW weekly option, e.g. 'SPXW  250117P05900000'."""
+    date_str = exp_date.strftime("%y%m%d")
+    opt_char = "C" if opt_type == "CALL" else "P"
+    strike_str = f"{int(strike * 1000):08d}"
+    return f"SPXW  {date_str}{opt_char}{strike_str}"
+
+
+def fetch_option_quote(occ_symbol: str, tt_token: str = "") -> dict:
+    """
+    Fetch bid/ask/mid for one option symbol from Tastytrade market data.
+    Logs in first when no session token is given; the token used is returned.
+    """
+    import requests as req
+    if not tt_token:
+        tt_token = tastytrade_login()
+        if not tt_token:
+            return {'ok': False, 'error': 'No Tastytrade session', 'token': ''}
+    headers = {"Authorization": tt_token, "Content-Type": "application/json"}
+    quote_url = f"https://api.tastytrade.com/market-data/{occ_symbol}/quote"
+    quote_resp = req.get(quote_url, headers=headers, timeout=10)
+    
+    if quote_resp.status_code != 200:
+        return {'ok': False, 'error': f"HTTP {quote_resp.status_code}", 'token': tt_token}
+    
+    q = quote_resp.json().get("data", {})
+    bid = float(q.get("bid", 0))
+    ask = float(q.get("ask", 0))
+    mid = (bid + ask) / 2 if bid and ask else 0
+    return {'ok': mid > 0, 'bid': bid, 'ask': ask, 'mid': mid, 'token': tt_token}
+
+
+def fetch_option_chain(occ_symbols: tuple, tt_token: str = "") -> dict:
+    """
+    Quote a set of option symbols under one Tastytrade session.
+    Logs in once before fanning out when no token is given; a token every
+    quote rejects with HTTP 401 is returned as '' so the caller drops it.
+    """
+    if not tt_token:
+        tt_token = coalesced(('tastytrade_login',), tastytrade_login)
+        if not tt_token:
+            return {'ok': False, 'error': 'No Tastytrade session', 'token': '', 'quotes': {}}
+    
+    def _quote(sym):
+        try:
+            return fetch_option_quote(sym, tt_token)
+        except Exception as e:
+            return {'ok': False, 'error': str(e)[:120], 'token': tt_token}
+    
+    with ThreadPoolExecutor(max_workers=8, thread_name_prefix="quote") as pool:
+        quotes = dict(zip(occ_symbols, pool.map(_quote, occ_symbols)))
+    if quotes and all(q.get('error') == 'HTTP 401' for q in quotes.values()):
+        tt_token = ''
+    errors = [q['error'] for q in quotes.values() if q.get('error')]
+    return {'ok': any(q['ok'] for q in quotes.values()), 'quotes': quotes, 'token': tt_token,
+            'error': errors[0] if errors else ''}
+
+
+# ============================================================
+# FETCH ORCHESTRATION
+# A rerun's automatic data calls go out as one batch under one latency
+# budget; a fetch the user clicked for gets its own, longer budget.
+# Late or failed calls degrade to the last good value, marked stale
+# ============================================================
+
+RERUN_FETCH_BUDGET_SECONDS = 4.0  # override with fetch_budget_seconds in secrets.toml
+USER_FETCH_BUDGET_SECONDS = 15.0  # outlasts the 10 s Tastytrade timeouts; override with user_fetch_budget_seconds
+
+
+class LastGoodStore:
+    """Thread-safe map of fetch key → last successful value and when it arrived."""
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._values = {}
+    
+    def put(self, key: tuple, value):
+        with self._lock:
+            self._values[key] = {'value': value, 'as_of': datetime.now()}
+    
+    def get(self, key: tuple):
+        with self._lock:
+            return self._values.get(key)
+
+
+@st.cache_resource(show_spinner=False)
+def get_fetch_executor() -> ThreadPoolExecutor:
+    """Shared worker threads for blocking fetches (they outlive a timed-out rerun)."""
+    return ThreadPoolExecutor(max_workers=8, thread_name_prefix="fetch")
+
+
+@st.cache_resource(show_spinner=False)
+def get_last_good_store() -> LastGoodStore:
+    return LastGoodStore()
+
+
+def _fetch_succeeded(value) -> bool:
+    """A result counts as good unless it reports ok=False or carries no candles."""
+    if value is None:
+        return False
+    if isinstance(value, dict):
+        return bool(value.get('ok', True))
+    if isinstance(value, DataSourceStatus) or hasattr(value, 'candles'):
+        return value.candles is not None and len(value.candles) > 0
+    return True
+
+
+def _fetch_and_remember(key: tuple, fn, args: tuple):
+    """Worker-thread body: coalesced upstream call, remembered when it succeeds."""
+    value = coalesced(key, fn, *args)
+    if _fetch_succeeded(value):
+        get_last_good_store().put(key, value)
+    return value
+
+
+def run_fetches(calls: dict, budget_seconds: float) -> dict:
+    """
+    Run blocking fetches concurrently on the shared executor under a deadline.
+    
+    Args:
+        calls: name -> (key, fn, args); key identifies the request for
+               single-flight coalescing and the last-good fallback
+        budget_seconds: deadline for the whole batch
+    
+    Returns:
+        name -> {'value', 'stale', 'timed_out', 'error', 'as_of', 'elapsed'}
+        A call that misses the deadline keeps running in the background and
+        refreshes the last-good value for the next rerun.
+    """
+    if not calls:
+        return {}
+    store = get_last_good_store()
+    started = time_mod.monotonic()
+    
+    async def _gather():
+        loop = asyncio.get_running_loop()
+        executor = get_fetch_executor()
+        futures = {name: loop.run_in_executor(executor, _fetch_and_remember, key, fn, tuple(args))
+                   for name, (key, fn, args) in calls.items()}
+        await asyncio.wait(list(futures.values()), timeout=max(0.0, budget_seconds))
+        return futures
+    
+    futures = asyncio.run(_gather())
+    
+    results = {}
+    for name, (key, fn, args) in calls.items():
+        fut = futures[name]
+        result = {'value': None, 'stale': False, 'timed_out': False, 'error': '',
+                  'as_of': None, 'elapsed': time_mod.monotonic() - started}
+        if not fut.done() or fut.cancelled():
+            result['timed_out'] = True
+            result['error'] = f"exceeded {budget_seconds:.1f}s budget"
+        elif fut.exception() is not None:
+            result['error'] = str(fut.exception())[:120]
+        else:
+            result['value'] = fut.result()
+            if _fetch_succeeded(result['value']):
+                result['as_of'] = datetime.now()
+                results[name] = result
+                continue
+        
+        # Degrade gracefully: last good value for this key, marked stale
+        last_good = store.get(key)
+        if last_good is not None:
+            result['value'] = last_good['value']
+            result['as_of'] = last_good['as_of']
+            result['stale'] = True
+        results[name] = result
+    return results
+
+
+# ============================================================
+# OPTIONS PRICING ENGINE
+# Vectorized Black-Scholes for 0DTE SPX (zero rate, no dividends)
+# ============================================================
+
+TRADING_MINUTES_PER_YEAR = 252 * 390
+TRADING_HOURS_PER_YEAR = TRADING_MINUTES_PER_YEAR / 60
+ZERO_DTE_EXTRINSIC_FACTOR = 0.35  # real 0DTE OTM premium ≈ 35% of theoretical extrinsic
+REALIZED_VOL_EXTRINSIC_FACTOR = 1.0  # realized vol already sits below implied — no second discount
+PREMIUM_TICK = 0.25
+
+# SPX half-days, from the NYSE holiday & early-close calendar (nyse.com/markets/hours-calendars)
+# and Cboe's matching holiday notices: the cash index closes at 12:00 PM CT and expiring SPXW
+# stop trading with it (non-expiring SPX/SPXW run to 12:15 PM CT). Extend the list each year
+# when the exchanges publish it; expiries outside EARLY_CLOSE_FIRST_YEAR..EARLY_CLOSE_LAST_YEAR are
+# flagged as unknown. No early close precedes an observed Friday holiday (e.g. Christmas 2027).
+EARLY_CLOSE_CT = time(12, 0)
+EARLY_CLOSE_DATES = {
+    '2024-07-03', '2024-11-29', '2024-12-24',
+    '2025-07-03', '2025-11-28', '2025-12-24',
+    '2026-11-27', '2026-12-24',
+    '2027-11-26',
+}
+EARLY_CLOSE_FIRST_YEAR = min(int(d[:4]) for d in EARLY_CLOSE_DATES)
+EARLY_CLOSE_LAST_YEAR = max(int(d[:4]) for d in EARLY_CLOSE_DATES)
+
+
+class ExpiryClock:
+    """
+    Trading-time-to-expiry for one 0DTE expiry date — the single source of
+    hours/minutes left for every pricing call. Only regular-session minutes
+    count (8:30 AM CT to the close, 12:00 PM on early-close days); before the
+    open the full session is left, after the close nothing is. calendar_known
+    is False outside EARLY_CLOSE_FIRST_YEAR..EARLY_CLOSE_LAST_YEAR, where a
+    half-day cannot be recognised.
+    """
+    def __init__(self, expiry_date):
+        self.expiry_date = pd.Timestamp(expiry_date).date()
+        close = EARLY_CLOSE_CT if self.expiry_date.isoformat() in EARLY_CLOSE_DATES else NY_CLOSE_CT
+        self.open_minute = NY_OPEN_CT.hour * 60 + NY_OPEN_CT.minute
+        self.close_minute = close.hour * 60 + close.minute
+        self.session_minutes = self.close_minute - self.open_minute
+        self.early_close = close != NY_CLOSE_CT
+        self.calendar_known = EARLY_CLOSE_FIRST_YEAR <= self.expiry_date.year <= EARLY_CLOSE_LAST_YEAR
+    
+    @staticmethod
+    def now_ct() -> datetime:
+        return to_ct_naive(pd.Timestamp.now(tz='UTC')).to_pydatetime()
+    
+    def _minute_of_day(self, when):
+        """CT minute of day for a datetime (days before/after expiry clamp) or minute array."""
+        if isinstance(when, datetime):
+            if when.date() < self.expiry_date:
+                return self.open_minute
+            if when.date() > self.expiry_date:
+                return self.close_minute
+            return when.hour * 60 + when.minute + when.second / 60.0
+        return np.asarray(when, dtype=float)
+    
+    def minutes_left(self, when=None):
+        """Trading minutes from `when` (naive CT datetime, CT minute or minute array; default now) to expiry."""
+        m = self._minute_of_day(self.now_ct() if when is None else when)
+        return np.clip(self.close_minute - np.maximum(m, self.open_minute), 0, self.session_minutes)
+    
+    def hours_left(self, when=None):
+        left = self.minutes_left(when)
+        return left / 60.0 if np.ndim(left) else float(left) / 60.0
+    
+    def time_grid(self, start_minute: int, step_minutes: int) -> tuple:
+        """(CT minutes, hours to expiry) from start_minute through the close, every step_minutes."""
+        minutes = np.arange(start_minute, self.close_minute + 1, step_minutes)
+        return minutes, self.minutes_left(minutes) / 60.0
+
+
+try:
+    from scipy.special import ndtr as _scipy_ndtr
+except ImportError:
+    _scipy_ndtr = None
+
+
+def norm_cdf(x) -> np.ndarray:
+    """
+    Standard normal CDF for arrays. Uses scipy when installed, otherwise the
+    Numerical Recipes erfc approximation (fractional error < 1.2e-7).
+    """
+    x = np.asarray(x, dtype=float)
+    if _scipy_ndtr is not None:
+        return _scipy_ndtr(x)
+    z = np.abs(x) / np.sqrt(2.0)
+    t = 1.0 / (1.0 + 0.5 * z)
+    poly = -z * z - 1.26551223 + t * (1.00002368 + t * (0.37409196 + t * (0.09678418 +
+           t * (-0.18628806 + t * (0.27886807 + t * (-1.13520398 + t * (1.48851587 +
+           t * (-0.82215223 + t * 0.17087277))))))))
+    erfc = t * np.exp(poly)
+    return np.where(x >= 0, 1.0 - 0.5 * erfc, 0.5 * erfc)
+
+
+def _is_call_array(opt_type) -> np.ndarray:
+    """'CALL'/'PUT' string or boolean is-call array → boolean array."""
+    if isinstance(opt_type, str):
+        return np.asarray(opt_type == 'CALL')
+    return np.asarray(opt_type, dtype=bool)
+
+
+def _bs_terms(spot, strike, vol, hours_to_expiry, opt_type) -> dict:
+    """
+    Broadcast inputs and compute the shared Black-Scholes intermediates
+    (d1, d2, N(±d1), N(±d2)) once for both the pricer and the Greeks.
+    """
+    S, K, sigma, hours, is_call = np.broadcast_arrays(
+        np.asarray(spot, dtype=float), np.asarray(strike, dtype=float),
+        np.asarray(vol, dtype=float), np.asarray(hours_to_expiry, dtype=float),
+        _is_call_array(opt_type))
+    
+    T = np.maximum(hours, 0.0) / TRADING_HOURS_PER_YEAR
+    intrinsic = np.where(is_call, np.maximum(S - K, 0.0), np.maximum(K - S, 0.0))
+    live = (T > 0) & (sigma > 0)
+    vol_t = np.where(live, sigma * np.sqrt(T), 1.0)
+    
+    with np.errstate(divide='ignore', invalid='ignore'):
+        d1 = np.log(S / K) / vol_t + 0.5 * vol_t
+    d2 = d1 - vol_t
+    nd1, nd2 = norm_cdf(d1), norm_cdf(d2)
+    call = S * nd1 - K * nd2
+    put = K * (1.0 - nd2) - S * (1.0 - nd1)
+    
+    return {
+        'S': S, 'K': K, 'sigma': sigma, 'hours': hours, 'is_call': is_call,
+        'T': T, 'live': live, 'vol_t': vol_t, 'd1': d1, 'd2': d2,
+        'nd1': nd1, 'nd2': nd2, 'intrinsic': intrinsic,
+        'premium': np.where(is_call, call, put),
+    }
+
+
+def price_options_bs(spot, strike, vol, hours_to_expiry, opt_type='CALL',
+                     extrinsic_factor: float = ZERO_DTE_EXTRINSIC_FACTOR,
+                     round_to: float = PREMIUM_TICK,
+                     min_premium: float = PREMIUM_TICK) -> np.ndarray:
+    """
+    Vectorized 0DTE option premium. All inputs broadcast against each other,
+    so spot[:, None, None] × strike[None, :, None] × hours[None, None, :]
+    prices a whole grid in one call.
+    
+    Args:
+        spot, strike: SPX level(s) and strike(s)
+        vol: annualized volatility as a decimal (VIX / 100)
+        hours_to_expiry: trading hours left (252 × 6.5 hours per year)
+        opt_type: 'CALL' / 'PUT', or a boolean is-call array
+        extrinsic_factor: 0DTE discount applied to extrinsic value (1.0 = pure BS)
+        round_to: tick to round to (None = no rounding)
+        min_premium: floor for live options (None = no floor)
+    
+    At expiry (hours <= 0) the result is intrinsic value, unrounded.
+    """
+    b = _bs_terms(spot, strike, vol, hours_to_expiry, opt_type)
+    hours, live, intrinsic = b['hours'], b['live'], b['intrinsic']
+    
+    # 0DTE discount on extrinsic only — intrinsic dominates as options go ITM
+    extrinsic = np.maximum(b['premium'] - intrinsic, 0.0)
+    adjusted = intrinsic + extrinsic * extrinsic_factor
+    if round_to:
+        adjusted = np.round(adjusted / round_to) * round_to
+    floor = min_premium if min_premium is not None else 0.0
+    adjusted = np.maximum(floor, adjusted)
+    
+    return np.where(hours <= 0, intrinsic, np.where(live, adjusted, floor))
+
+
+def price_options_grid(spots, strikes, hours_to_expiry, vol, opt_type, **kwargs) -> np.ndarray:
+    """Price a full spot × strike × time grid. Returns shape (len(spots), len(strikes), len(hours))."""
+    spots = np.asarray(spots, dtype=float).reshape(-1, 1, 1)
+    strikes = np.asarray(strikes, dtype=float).reshape(1, -1, 1)
+    hours = np.asarray(hours_to_expiry, dtype=float).reshape(1, 1, -1)
+    return price_options_bs(spots, strikes, vol, hours, opt_type, **kwargs)
+
+
+def compute_greeks(spot, strike, vol, hours_to_expiry, opt_type='CALL',
+                   extrinsic_factor: float = ZERO_DTE_EXTRINSIC_FACTOR) -> dict:
+    """
+    Vectorized 0DTE Greeks consistent with price_options_bs(). Inputs broadcast
+    the same way, and d1/d2 are computed once for premium and all Greeks.
+    
+    The model premium is intrinsic + factor × BS extrinsic, so gamma, theta
+    and vega scale by the factor and delta blends toward the intrinsic delta.
+    
+    Returns:
+        Dict of arrays: 'premium' (unrounded), 'delta', 'gamma' (per point),
+        'theta' ($ per trading hour, negative = decay), 'vega' (per 1 vol point)
+    """
+    b = _bs_terms(spot, strike, vol, hours_to_expiry, opt_type)
+    S, K, is_call, live = b['S'], b['K'], b['is_call'], b['live']
+    f = extrinsic_factor
+    
+    pdf = np.exp(-0.5 * b['d1'] ** 2) / np.sqrt(2 * np.pi)
+    bs_delta = np.where(is_call, b['nd1'], b['nd1'] - 1.0)
+    itm_delta = np.where(is_call, (S > K).astype(float), -(S < K).astype(float))
+    sqrt_t = np.sqrt(np.where(live, b['T'], 1.0))
+    
+    gamma = pdf / (S * b['vol_t'])
+    vega = S * pdf * sqrt_t / 100.0
+    theta = -S * pdf * b['sigma'] / (2 * sqrt_t) / TRADING_HOURS_PER_YEAR
+    
+    extrinsic = np.maximum(b['premium'] - b['intrinsic'], 0.0)
+    return {
+        'premium': np.where(live, b['intrinsic'] + f * extrinsic, b['intrinsic']),
+        'delta': np.where(live, f * bs_delta + (1 - f) * itm_delta, itm_delta),
+        'gamma': np.where(live, f * gamma, 0.0),
+        'theta': np.where(live, f * theta, 0.0),
+        'vega': np.where(live, f * vega, 0.0),
+    }
+
+
+@st.cache_data(show_spinner=False, max_entries=64)
+def greeks_snapshot(spot: float, strikes: tuple, vol, hours: tuple, opt_type: str,
+                    extrinsic_factor: float = ZERO_DTE_EXTRINSIC_FACTOR) -> dict:
+    """
+    Greeks for a strike × time grid at one (spot, vol) snapshot — cached so reruns are free.
+    vol is one number or a per-strike tuple (e.g. a live IV smile).
+    """
+    vol = np.asarray(vol, dtype=float)
+    if vol.ndim:
+        vol = vol[:, None]
+    return compute_greeks(spot, np.asarray(strikes, dtype=float)[:, None], vol,
+                          np.asarray(hours, dtype=float)[None, :], opt_type, extrinsic_factor)
+
+
+IV_MIN = 0.01
+IV_MAX = 5.0
+
+
+def implied_vol_batch(prices, spot, strikes, hours_to_expiry, opt_type='CALL',
+                      tol: float = 1e-6, max_iter: int = 20, bisect_iter: int = 60) -> np.ndarray:
+    """
+    Invert pure Black-Scholes (no 0DTE discount) for a whole chain at once.
+    
+    Vectorized Newton steps on vega; any strike that fails to converge or
+    steps outside [IV_MIN, IV_MAX] is finished by vectorized bisection.
+    Prices at or below intrinsic (or above the no-arbitrage bound) give NaN.
+    
+    Returns:
+        Array of annualized implied vols, broadcast shape of the inputs
+    """
+    price, S, K, hours, is_call = np.broadcast_arrays(
+        np.asarray(prices, dtype=float), np.asarray(spot, dtype=float),
+        np.asarray(strikes, dtype=float), np.asarray(hours_to_expiry, dtype=float),
+        _is_call_array(opt_type))
+    
+    def bs(vol):
+        return price_options_bs(S, K, vol, hours, is_call, extrinsic_factor=1.0,
+                                round_to=None, min_premium=None)
+    
+    intrinsic = np.where(is_call, np.maximum(S - K, 0.0), np.maximum(K - S, 0.0))
+    upper = np.where(is_call, S, K)
+    valid = (hours > 0) & np.isfinite(price) & (price > intrinsic) & (price < upper)
+    
+    # Newton from the Brenner-Subrahmanyam ATM guess
+    T = np.maximum(hours, 1e-9) / TRADING_HOURS_PER_YEAR
+    vol = np.clip(np.sqrt(2 * np.pi / T) * price / S, 0.05, 2.0)
+    converged = ~valid
+    for _ in range(max_iter):
+        vega = compute_greeks(S, K, vol, hours, is_call, extrinsic_factor=1.0)['vega'] * 100
+        diff = bs(vol) - price
+        converged |= np.abs(diff) < tol
+        if converged.all():
+            break
+        with np.errstate(divide='ignore', invalid='ignore'):
+            step = np.where(converged, 0.0, diff / vega)
+        vol = vol - np.nan_to_num(step, nan=np.inf, posinf=np.inf, neginf=np.inf)
+    
+    # Bisection fallback for whatever Newton could not settle
+    todo = valid & ~(converged & np.isfinite(vol) & (vol >= IV_MIN) & (vol <= IV_MAX))
+    if todo.any():
+        lo = np.full(price.shape, IV_MIN)
+        hi = np.full(price.shape, IV_MAX)
+        for _ in range(bisect_iter):
+            mid = 0.5 * (lo + hi)
+            above = bs(mid) > price
+            hi = np.where(above, mid, hi)
+            lo = np.where(above, lo, mid)
+        vol = np.where(todo, 0.5 * (lo + hi), vol)
+    
+    return np.where(valid, vol, np.nan)
+
+
+def build_smile(strikes, ivs) -> dict:
+    """Per-strike smile from solved IVs (NaNs dropped, sorted by strike)."""
+    strikes = np.asarray(strikes, dtype=float)
+    ivs = np.asarray(ivs, dtype=float)
+    ok = np.isfinite(ivs)
+    order = np.argsort(strikes[ok])
+    return {'strikes': strikes[ok][order], 'ivs': ivs[ok][order]}
+
+
+def smile_vol(smile: dict, strike) -> np.ndarray:
+    """Implied vol at any strike(s): linear in strike, flat beyond the wings."""
+    return np.interp(np.asarray(strike, dtype=float), smile['strikes'], smile['ivs'])
+
+
+def estimate_option_premium(spx_price: float, strike: float, vix: float,
+                             hours_to_expiry: float, opt_type: str,
+                             extrinsic_factor: float = ZERO_DTE_EXTRINSIC_FACTOR) -> float:
+    """
+    Estimate 0DTE SPX option premium using Black-Scholes with 0DTE adjustment.
+    
+    Real 0DTE options trade at a discount to theoretical BS because:
+    - Realized vol is lower than implied for short timeframes
+    - Bid-ask spread compresses theoretical value
+    - Market makers discount extreme gamma risk
+    
+    We apply a 0.35x discount factor to align with typical 0DTE market prices;
+    pass REALIZED_VOL_EXTRINSIC_FACTOR when `vix` is realized vol.
+    Scalar wrapper around price_options_bs().
+    """
+    return float(price_options_bs(spx_price, strike, vix / 100.0, hours_to_expiry, opt_type,
+                                  extrinsic_factor=extrinsic_factor))
+
+
+def project_premium_at_scenarios(current_spx: float, strike: float, vix: float,
+                                  opt_type: str, stop_price: float,
+                                  tp1_price: float, tp2_price: float,
+                                  base_premium: float = None,
+                                  current_hours: float = 6.5,
+                                  entry_hours: float = 5.9,
+                                  smile: dict = None,
+                                  extrinsic_factor: float = ZERO_DTE_EXTRINSIC_FACTOR) -> dict:
+    """
     Project option premium at 9:05 AM entry under three scenarios using actual trade levels.
     
     If base_premium (live 8:30 AM price) is available, calibrates the model to match it,
@@ -1361,19 +3148,28 @@ def project_premium_at_scenarios(current_spx: float, strike: float, vix: float,
         base_premium: Live premium pulled at 8:30 AM (None if unavailable)
         current_hours: Hours to expiry at time of live pull (default 6.5 = 8:30 AM)
         entry_hours: Hours to expiry at 9:05 AM entry (default 5.9)
+        smile: Per-strike IV smile from a live chain (build_smile). When given,
+               pure BS at the strike's implied vol replaces VIX × 0.35
+        extrinsic_factor: Discount on the no-smile estimate (1.0 for realized vol)
     
     Returns:
         Dict with scenario projections
     """
-    # Estimate premiums at different SPX levels at entry time
-    est_at_entry = estimate_option_premium(current_spx, strike, vix, entry_hours, opt_type)
-    est_at_stop = estimate_option_premium(stop_price, strike, vix, entry_hours, opt_type)
-    est_at_tp1 = estimate_option_premium(tp1_price, strike, vix, entry_hours, opt_type)
-    est_at_tp2 = estimate_option_premium(tp2_price, strike, vix, entry_hours, opt_type)
+    # Estimate premiums at entry (four SPX levels) and now, in one vectorized call
+    spots = [current_spx, stop_price, tp1_price, tp2_price, current_spx]
+    hours = [entry_hours, entry_hours, entry_hours, entry_hours, current_hours]
+    use_smile = smile is not None and len(smile['strikes']) > 0
+    if use_smile:
+        iv = float(smile_vol(smile, strike))
+        est = price_options_bs(spots, strike, iv, hours, opt_type, extrinsic_factor=1.0)
+    else:
+        iv = None
+        est = price_options_bs(spots, strike, vix / 100.0, hours, opt_type,
+                               extrinsic_factor=extrinsic_factor)
+    est_at_entry, est_at_stop, est_at_tp1, est_at_tp2, est_now = (float(v) for v in est)
     
-    # If we have a live base premium, calibrate with a scaling factor
-    if base_premium and base_premium > 0:
-        est_now = estimate_option_premium(current_spx, strike, vix, current_hours, opt_type)
+    # If we have a live base premium (and no smile), calibrate with a scaling factor
+    if base_premium and base_premium > 0 and not use_smile:
         if est_now > 0:
             calibration = base_premium / est_now
         else:
@@ -1389,70 +3185,596 @@ def project_premium_at_scenarios(current_spx: float, strike: float, vix: float,
         'at_stop': max(0.25, est_at_stop),
         'at_tp1': max(0.25, est_at_tp1),
         'at_tp2': max(0.25, est_at_tp2),
-        'calibrated': base_premium is not None and base_premium > 0,
+        'calibrated': (base_premium is not None and base_premium > 0) or use_smile,
+        'iv': iv,
     }
 
 
-# ============================================================
-# AUTO-DETECTION ENGINE
-# Detect bounces, rejections, and wick extremes from candle data
-# ============================================================
+RULE_OTM_POINTS = 20
+STRIKE_INCREMENT = 5
 
-def filter_ny_session(df: pd.DataFrame, session_date) -> pd.DataFrame:
-    """
-    Filter candles to only the NY regular session: 8:30 AM - 3:00 PM CT.
-    Uses a flexible window to catch candles even if timestamps are slightly off.
-    """
-    session_start = datetime.combine(session_date, time(8, 0))   # slightly early to catch 8:30
-    session_end = datetime.combine(session_date, time(15, 30))    # slightly late to catch 3:00
-    
-    mask = (df['datetime'] >= session_start) & (df['datetime'] <= session_end)
-    filtered = df[mask].copy().reset_index(drop=True)
-    return filtered
 
+def rule_strike(spot: float, opt_type: str, otm_points: float = RULE_OTM_POINTS) -> int:
+    """The fixed rule: otm_points OTM, rounded away from the money to the strike increment."""
+    if opt_type == "PUT":
+        return int((spot - otm_points) // STRIKE_INCREMENT) * STRIKE_INCREMENT
+    return int((spot + otm_points + STRIKE_INCREMENT - 1) // STRIKE_INCREMENT) * STRIKE_INCREMENT
 
-def detect_inflections(ny_candles: pd.DataFrame) -> dict:
+
+def optimize_strike(spot: float, opt_type: str, stop_price: float, tp1_price: float,
+                    tp2_price: float, strikes, vol, entry_hours: float, odds: dict,
+                    max_cost: float = None, contracts: int = 3,
+                    extrinsic_factor: float = ZERO_DTE_EXTRINSIC_FACTOR, entry_premiums=None) -> dict:
     """
-    Auto-detect bounces and rejections from 30-min candle data.
+    Score every strike by expected R in one vectorized pricing call.
     
-    Uses LINE CHART logic: closing prices only for bounces/rejections.
+    Premiums at entry / stop / TP1 / TP2 come from a strikes × 5 grid (the
+    fifth column is expiry at the entry level, for paths that never resolve).
+    Exit value per strike is weighted by the path odds from
+    simulate_trade_outcomes(): stop first, TP1 first (exit at TP1 unless TP2
+    is also reached), TP2, expire in between. R = expected P&L / stop loss.
     
-    Bounce = trough: close[i] <= close[i-1] AND close[i] < close[i+1]
-      OR close[i] < close[i-1] AND close[i] <= close[i+1]
-      (handles flat bottoms)
+    Args:
+        strikes: candidate strikes
+        vol: one annualized vol or one per strike (e.g. a live IV smile)
+        odds: simulate_trade_outcomes() result
+        max_cost: budget for the whole position (contracts × premium × 100)
+        entry_premiums: quoted premium per strike (live chain mids); replaces
+                        the model entry price in the cost, budget and R
     
-    Rejection = peak: close[i] >= close[i-1] AND close[i] > close[i+1]
-      OR close[i] > close[i-1] AND close[i] >= close[i+1]
-      (handles flat tops)
+    Returns:
+        Dict with per-strike arrays 'strikes', 'entry', 'at_stop', 'at_tp1',
+        'at_tp2', 'cost', 'expected_pnl', 'expected_r', 'affordable', and
+        'best' (strike with the highest expected R that fits the budget, or None)
+    """
+    strikes = np.asarray(strikes, dtype=float)
+    vol = np.asarray(vol, dtype=float)
+    vol = vol[:, None] if vol.ndim else vol
+    spots = np.array([spot, stop_price, tp1_price, tp2_price, spot], dtype=float)
+    hours = np.array([entry_hours] * 4 + [0.0])
     
-    For multi-candle patterns (W-bottoms, M-tops), uses a 5-candle window:
-      If close[i] is the lowest/highest within a 5-candle window centered on it,
-      it's also detected as a bounce/rejection.
+    # Unrounded premiums so $0.25 ticks don't dominate R on cheap strikes
+    grid = price_options_bs(spots[None, :], strikes[:, None], vol, hours[None, :], opt_type,
+                            extrinsic_factor=extrinsic_factor, round_to=None)
+    entry, at_stop, at_tp1, at_tp2, at_expiry = grid.T
+    if entry_premiums is not None:
+        entry = np.asarray(entry_premiums, dtype=float)
     
-    Highest Wick = highest HIGH of a BEARISH candle (close < open)
-      - Exclude the 8:30 AM candle (opening noise)
+    p_tp1_only = max(odds['p_tp1_first'] - odds['p_tp2'], 0.0)
+    exit_value = (odds['p_stop_first'] * at_stop + p_tp1_only * at_tp1 +
+                  odds['p_tp2'] * at_tp2 + odds['p_expire'] * at_expiry)
+    expected_pnl = (exit_value - entry) * 100 * contracts
+    risk = (entry - at_stop) * 100 * contracts
+    with np.errstate(divide='ignore', invalid='ignore'):
+        expected_r = np.where(risk > 0, expected_pnl / risk, np.nan)
     
-    Lowest Wick = lowest LOW of a BULLISH candle (close > open)
-      - Exclude the 8:30 AM candle (opening noise)
+    cost = entry * 100 * contracts
+    affordable = np.ones(len(strikes), dtype=bool) if not max_cost else cost <= max_cost
+    eligible = affordable & np.isfinite(expected_r)
+    best = float(strikes[np.nanargmax(np.where(eligible, expected_r, -np.inf))]) if eligible.any() else None
+    
+    return {
+        'strikes': strikes,
+        'entry': entry,
+        'at_stop': at_stop,
+        'at_tp1': at_tp1,
+        'at_tp2': at_tp2,
+        'cost': cost,
+        'expected_pnl': expected_pnl,
+        'expected_r': expected_r,
+        'affordable': affordable,
+        'best': best,
+    }
+
+
+SURFACE_START_MINUTE = 9 * 60    # 9:00 AM CT
+SURFACE_STEP_MINUTES = 5
+SURFACE_LEVEL_STEP = 5.0
+
+
+def surface_spx_levels(ladder_values, low: float, high: float,
+                       step: float = SURFACE_LEVEL_STEP) -> tuple:
     """
-    if len(ny_candles) < 3:
-        return {'bounces': [], 'rejections': [], 'highest_wick': None, 'lowest_wick': None}
+    SPX axis for the premium surface: a regular grid from low to high plus
+    every ladder line inside that range, so each line gets its own row.
+    """
+    grid = np.arange(np.floor(low / step) * step, np.ceil(high / step) * step + step, step)
+    lines = np.asarray([v for v in ladder_values if low <= v <= high], dtype=float)
+    return tuple(float(v) for v in np.unique(np.round(np.concatenate([grid, lines]), 2)))
+
+
+@st.cache_data(show_spinner=False, max_entries=32)
+def _premium_grid(strike: float, vol: float, trade_date, opt_type: str,
+                  spx_levels: tuple, extrinsic_factor: float) -> dict:
+    """Uncalibrated surface prices, cached per (strike, vol, date) and the level axis."""
+    minutes, hours = ExpiryClock(trade_date).time_grid(SURFACE_START_MINUTE, SURFACE_STEP_MINUTES)
+    levels = np.asarray(spx_levels, dtype=float)
+    premium = price_options_bs(levels[:, None], strike, vol, hours[None, :], opt_type,
+                               extrinsic_factor=extrinsic_factor)
+    labels = [f"{(m // 60 - 1) % 12 + 1}:{m % 60:02d}" for m in minutes]
+    return {'levels': levels, 'minutes': minutes, 'hours': hours, 'labels': labels, 'premium': premium}
+
+
+def build_premium_surface(strike: float, vol: float, trade_date, opt_type: str,
+                          spx_levels: tuple, entry_premium: float,
+                          calibration: float = 1.0, contracts: int = 3,
+                          extrinsic_factor: float = ZERO_DTE_EXTRINSIC_FACTOR) -> dict:
+    """
+    Estimated premium and position P&L over SPX level × time of day.
     
-    closes = ny_candles['close'].values
-    times = ny_candles['datetime'].values
-    opens = ny_candles['open'].values
-    highs = ny_candles['high'].values
-    lows = ny_candles['low'].values
-    n = len(closes)
+    Prices the whole grid in one price_options_bs() call: rows are spx_levels,
+    columns are every SURFACE_STEP_MINUTES from 9:00 AM to the session close
+    (ExpiryClock, so early-close days stop at 12:00 PM).
+    The raw grid is cached (_premium_grid); the live calibration and entry
+    premium, which move every tick, are applied on top of it.
     
-    bounces = []
-    rejections = []
-    bounce_times = set()
-    rejection_times = set()
+    Returns:
+        Dict with 'levels', 'minutes' (CT minute of day), 'labels',
+        'premium' and 'pnl' (2D arrays, levels × minutes)
+    """
+    grid = _premium_grid(float(strike), round(float(vol), 4), trade_date, opt_type,
+                         tuple(spx_levels), float(extrinsic_factor))
+    levels, hours, premium = grid['levels'], grid['hours'], grid['premium']
+    if calibration != 1.0:
+        premium = np.maximum(PREMIUM_TICK, np.round(premium * calibration / PREMIUM_TICK) * PREMIUM_TICK)
+        premium[:, hours <= 0] = price_options_bs(levels[:, None], strike, vol, 0.0, opt_type)
+    pnl = (premium - entry_premium) * 100 * contracts
     
-    # Pass 1: Standard 3-candle pattern (with <= to catch flat edges)
+    return {
+        'levels': levels,
+        'minutes': grid['minutes'],
+        'labels': grid['labels'],
+        'premium': premium,
+        'pnl': pnl,
+    }
+
+
+# ============================================================
+# MONTE CARLO TRADE OUTCOMES
+# Simulated 1-minute SPX paths → stop / TP1 / TP2 / expiry odds
+# ============================================================
+
+MC_PATHS = 100_000
+MC_CHUNK_PATHS = 20_000  # fixed chunk size keeps results identical for any worker count
+MC_SEED = 20240101
+MC_BLOCK_MINUTES = 30
+MC_BARRIER_DECIMALS = 4  # log-distance rounding (~0.6 SPX pts): ticks that barely move the setup reuse the odds
+
+
+def _simulate_chunk(args: tuple) -> np.ndarray:
+    """
+    One chunk of paths (picklable for process pools). Returns per-path minute
+    indices of the first stop, TP1 and TP2 touch (n_steps = never), shape (3, n).
+    
+    Paths advance MC_BLOCK_MINUTES at a time and drop out once stopped or at
+    TP2, so close barriers cost far less than the full session. Draws are
+    antithetic pairs: half the normals, mirrored.
+    """
+    seed_seq, n_paths, n_steps, sigma_minute, barriers = args
+    b_stop, b_tp1, b_tp2 = barriers
+    rng = np.random.default_rng(seed_seq)
+    drift = np.float32(0.5 * sigma_minute ** 2)
+    
+    first = np.full((3, n_paths), n_steps, dtype=np.int32)
+    active = np.arange(n_paths)
+    level = np.zeros(n_paths, dtype=np.float32)
+    
+    for t0 in range(0, n_steps, MC_BLOCK_MINUTES):
+        width = min(MC_BLOCK_MINUTES, n_steps - t0)
+        n = len(active)
+        half = rng.standard_normal(((n + 1) // 2, width), dtype=np.float32)
+        steps = np.concatenate([half, -half])[:n]
+        steps *= np.float32(sigma_minute)
+        steps -= drift
+        steps[:, 0] += level[active]
+        y = np.cumsum(steps, axis=1, out=steps)
+        
+        for row, hit in enumerate((y <= b_stop, y >= b_tp1, y >= b_tp2)):
+            idx = hit.argmax(axis=1)
+            touched = hit[np.arange(n), idx] & (first[row, active] == n_steps)
+            first[row, active[touched]] = t0 + idx[touched]
+        
+        level[active] = y[:, -1]
+        done = (first[0, active] < n_steps) | (first[2, active] < n_steps)
+        active = active[~done]
+        if not len(active):
+            break
+    
+    return first
+
+
+@st.cache_resource(show_spinner=False)
+def get_mc_pool(workers: int):
+    """Process pool shared by every Monte Carlo run (started once per worker count)."""
+    from concurrent.futures import ProcessPoolExecutor
+    return ProcessPoolExecutor(max_workers=workers)
+
+
+@st.cache_data(show_spinner=False, max_entries=64)
+def _trade_outcome_odds(barriers: tuple, sigma_minute: float, n_steps: int, n_paths: int,
+                        seed: int, workers: int) -> dict:
+    """simulate_trade_outcomes odds for log-distance barriers (spot-free, so cacheable)."""
+    sizes = [MC_CHUNK_PATHS] * (n_paths // MC_CHUNK_PATHS)
+    if n_paths % MC_CHUNK_PATHS:
+        sizes.append(n_paths % MC_CHUNK_PATHS)
+    seeds = np.random.SeedSequence(seed).spawn(len(sizes))
+    jobs = [(sq, n, n_steps, sigma_minute, barriers) for sq, n in zip(seeds, sizes)]
+    
+    chunks = None
+    if workers and workers > 1 and len(jobs) > 1:
+        try:
+            chunks = list(get_mc_pool(workers).map(_simulate_chunk, jobs))
+        except Exception:
+            get_mc_pool.clear()  # a broken pool is rebuilt on the next run
+            chunks = None
+    if chunks is None:
+        chunks = [_simulate_chunk(job) for job in jobs]
+    
+    stop_idx, tp1_idx, tp2_idx = np.concatenate(chunks, axis=1)
+    stop_first = (stop_idx < n_steps) & (stop_idx <= tp1_idx)
+    tp1_first = tp1_idx < stop_idx
+    tp1_minutes = tp1_idx[tp1_first] + 1
+    
+    return {
+        'p_stop_first': float(np.mean(stop_first)),
+        'p_tp1_first': float(np.mean(tp1_first)),
+        'p_tp2': float(np.mean(tp2_idx < stop_idx)),
+        'p_expire': float(np.mean((stop_idx == n_steps) & (tp1_idx == n_steps))),
+        'median_minutes_to_tp1': float(np.median(tp1_minutes)) if len(tp1_minutes) else None,
+        'n_paths': int(n_paths),
+    }
+
+
+def simulate_trade_outcomes(spot: float, opt_type: str, stop_price: float,
+                            tp1_price: float, tp2_price: float, vol: float,
+                            minutes: int, n_paths: int = MC_PATHS,
+                            seed: int = MC_SEED, workers: int = 0) -> dict:
+    """
+    Monte Carlo odds for the NY 0DTE trade from simulated 1-minute SPX paths
+    (driftless GBM at annualized vol, e.g. VIX / 100 or a calibrated IV).
+    
+    Args:
+        spot: SPX at entry
+        opt_type: 'CALL' (long bias) or 'PUT' (short bias)
+        stop_price, tp1_price, tp2_price: SPX trade levels
+        vol: annualized volatility as a decimal
+        minutes: trading minutes from entry to expiry (or time stop)
+        n_paths: number of simulated paths
+        seed: fixed seed — same setup, same answer
+        workers: > 1 splits chunks over the shared process pool (falls back to serial)
+    
+    A stop and target touched in the same minute count as the stop. The
+    odds are cached on the barriers' log distances from spot (rounded to
+    MC_BARRIER_DECIMALS) and the vol, not on spot itself, so live ticks that
+    leave the setup where it was reuse them.
+    
+    Returns:
+        Dict with 'p_stop_first', 'p_tp1_first', 'p_tp2', 'p_expire',
+        'median_minutes_to_tp1', 'n_paths', 'seconds'
+    """
+    started = time_mod.perf_counter()
+    n_steps = max(1, int(minutes))
+    side = 1.0 if opt_type == 'CALL' else -1.0
+    barriers = tuple(round(float(side * np.log(level / spot)), MC_BARRIER_DECIMALS)
+                     for level in (stop_price, tp1_price, tp2_price))
+    sigma_minute = round(float(vol), 4) / np.sqrt(TRADING_MINUTES_PER_YEAR)
+    
+    odds = _trade_outcome_odds(barriers, sigma_minute, n_steps, int(n_paths), int(seed), int(workers or 0))
+    return {**odds, 'seconds': time_mod.perf_counter() - started}
+
+
+# ============================================================
+# DATA QUALITY VALIDATOR
+# Vectorized checks on a candle frame before it reaches detection
+# ============================================================
+
+SPIKE_MAD_THRESHOLD = 8.0  # robust z-score above which a bar counts as an outlier
+CALENDAR_NOTE = ("No exchange-holiday calendar: holiday closures and early "
+                 "closes are reported as gaps")
+
+
+def trading_slot_mask(times) -> np.ndarray:
+    """
+    Vectorized version of the calendar rules in count_candles_between().
+    Returns True for every timestamp that falls inside a tradable 30-min slot.
+    """
+    idx = pd.DatetimeIndex(times)
+    weekday = idx.weekday.values
+    minute_of_day = idx.hour.values * 60 + idx.minute.values
+    
+    maint_start = MAINTENANCE_START_CT.hour * 60
+    maint_end = MAINTENANCE_END_CT.hour * 60
+    
+    closed = (
+        (weekday == 5) |                                   # Saturday
+        ((weekday == 6) & (minute_of_day < maint_end)) |   # Sunday before Globex open
+        ((weekday == 4) & (minute_of_day >= maint_start)) |  # Friday after close
+        ((minute_of_day >= maint_start) & (minute_of_day < maint_end))  # Daily maintenance
+    )
+    return ~closed
+
+
+def validate_candles(df: pd.DataFrame, repair: bool = False) -> dict:
+    """
+    Check a 30-min candle frame against the trading calendar in a few
+    vectorized passes (no per-bar Python loops).
+    
+    Reports:
+    - duplicates:   repeated timestamps
+    - misaligned:   bars not on the :00/:30 grid
+    - off_calendar: bars inside maintenance / weekend closures
+    - dst_suspect:  off-calendar bars in the 4-5 PM hour (typical 1-hour DST shift)
+    - ohlc_invalid: high/low that do not bracket open/close
+    - spikes:       range or close-to-close jumps beyond SPIKE_MAD_THRESHOLD robust z
+    - gaps:         runs of missing tradable slots between first and last bar
+    
+    With repair=True the returned frame has misaligned bars snapped to the grid
+    (a genuine on-grid bar keeps its slot), duplicates collapsed (last wins),
+    DST suspects moved one hour into whichever neighbouring slot is empty
+    (dropped when neither or both are), remaining off-calendar rows dropped
+    and OHLC fixed. Gaps and spikes are reported only — prices are never invented.
+    
+    The calendar knows weekends and the daily maintenance break only, so
+    exchange holidays show up as gaps (see CALENDAR_NOTE in the report).
+    """
+    empty_issues = {'duplicates': 0, 'misaligned': 0, 'off_calendar': 0, 'dst_suspect': 0,
+                    'ohlc_invalid': 0, 'spikes': 0, 'missing_slots': 0}
+    if df is None or len(df) == 0:
+        return {'ok': True, 'rows': 0, 'issues': empty_issues, 'gaps': [], 'data': df, 'repaired': False,
+                'dst_shifted': 0, 'note': CALENDAR_NOTE}
+    
+    data = ensure_time_columns(df).sort_values('ts_ns', kind='stable').reset_index(drop=True)
+    times = pd.DatetimeIndex(data['datetime'])
+    opens = data['open'].values.astype(float)
+    highs = data['high'].values.astype(float)
+    lows = data['low'].values.astype(float)
+    closes = data['close'].values.astype(float)
+    
+    # ── Pass 1: grid alignment, duplicates, calendar ──
+    misaligned = ((times.minute.values % CANDLE_MINUTES) != 0) | (times.second.values != 0) | (times.microsecond.values != 0)
+    duplicates = pd.Index(data['ts_ns']).duplicated(keep='last')  # UTC, so the DST fall-back hour is not a duplicate
+    on_calendar = trading_slot_mask(times)
+    minute_of_day = data['ct_minute'].values
+    maint_start = MAINTENANCE_START_CT.hour * 60
+    maint_end = MAINTENANCE_END_CT.hour * 60
+    dst_suspect = ~on_calendar & (minute_of_day >= maint_start) & (minute_of_day < maint_end)
+    
+    # ── Pass 2: OHLC consistency and spikes ──
+    body_high = np.maximum(opens, closes)
+    body_low = np.minimum(opens, closes)
+    ohlc_invalid = (highs < body_high) | (lows > body_low) | (highs < lows) | ~np.isfinite(closes)
+    
+    def robust_z(values: np.ndarray) -> np.ndarray:
+        finite = values[np.isfinite(values)]
+        if len(finite) < 5:
+            return np.zeros_like(values)
+        med = np.median(finite)
+        mad = np.median(np.abs(finite - med)) * 1.4826
+        if mad <= 0:
+            return np.zeros_like(values)
+        return np.abs(values - med) / mad
+    
+    bar_range = highs - lows
+    jumps = np.concatenate(([0.0], np.diff(closes)))
+    spikes = (robust_z(bar_range) > SPIKE_MAD_THRESHOLD) | (robust_z(jumps) > SPIKE_MAD_THRESHOLD)
+    
+    # ── Pass 3: gaps against the expected grid ──
+    grid_times = times[on_calendar & ~misaligned]
+    gaps = []
+    missing_slots = 0
+    if len(grid_times) >= 2:
+        expected = pd.date_range(grid_times.min(), grid_times.max(), freq=f'{CANDLE_MINUTES}min')
+        expected = expected[trading_slot_mask(expected)]
+        present = np.isin(expected.asi8, grid_times.asi8)
+        missing = ~present
+        missing_slots = int(missing.sum())
+        if missing_slots:
+            # Collapse consecutive missing slots into runs
+            edges = np.diff(np.concatenate(([0], missing.astype(np.int8), [0])))
+            run_starts = np.flatnonzero(edges == 1)
+            run_ends = np.flatnonzero(edges == -1) - 1
+            gaps = [{'start': expected[s].to_pydatetime(), 'end': expected[e].to_pydatetime(),
+                     'slots': int(e - s + 1)} for s, e in zip(run_starts, run_ends)]
+    
+    issues = {
+        'duplicates': int(duplicates.sum()),
+        'misaligned': int(misaligned.sum()),
+        'off_calendar': int((~on_calendar).sum()),
+        'dst_suspect': int(dst_suspect.sum()),
+        'ohlc_invalid': int(ohlc_invalid.sum()),
+        'spikes': int(spikes.sum()),
+        'missing_slots': missing_slots,
+    }
+    
+    out = data
+    dst_shifted = 0
+    if repair:
+        slot_ns = CANDLE_MINUTES * NS_PER_MINUTE
+        hour = pd.Timedelta(hours=1)
+        floored = times.floor(f'{CANDLE_MINUTES}min')
+        slots = (data['ts_ns'].values // slot_ns) * slot_ns
+        
+        # A DST suspect moves one hour toward the neighbouring slot the feed left empty
+        occupied = slots[trading_slot_mask(floored)]
+        back_free = trading_slot_mask(floored - hour) & ~np.isin(slots - hour.value, occupied)
+        fwd_free = trading_slot_mask(floored + hour) & ~np.isin(slots + hour.value, occupied)
+        shift = np.where(dst_suspect & back_free & ~fwd_free, -1,
+                         np.where(dst_suspect & fwd_free & ~back_free, 1, 0))
+        dst_shifted = int(np.count_nonzero(shift))
+        
+        out = data.copy()
+        out['datetime'] = floored + pd.to_timedelta(shift, unit='h')
+        out['ts_ns'] = slots + shift * hour.value
+        out['_on_grid'] = ~misaligned & (shift == 0)
+        out = out[np.isfinite(closes) & trading_slot_mask(out['datetime'])]
+        # Within a slot the genuine on-grid bar wins over a snapped or shifted one
+        out = out.sort_values(['ts_ns', '_on_grid'], kind='stable')
+        out = out.drop_duplicates(subset='ts_ns', keep='last').drop(columns='_on_grid')
+        ohlc = out[['open', 'high', 'low', 'close']].values.astype(float)
+        out['high'] = ohlc.max(axis=1)
+        out['low'] = ohlc.min(axis=1)
+        out = add_time_columns(out.reset_index(drop=True))
+    
+    return {
+        'ok': not any(issues.values()),
+        'rows': len(data),
+        'issues': issues,
+        'gaps': gaps,
+        'data': out,
+        'repaired': repair,
+        'dst_shifted': dst_shifted,
+        'note': CALENDAR_NOTE,
+    }
+
+
+# ============================================================
+# LOCAL CANDLE STORE
+# Every fetched ES 30-min frame (and the 1-minute bars behind realized
+# vol) is merged into monthly parquet files, building the multi-year
+# history the batch analytics and backtests run on
+# ============================================================
+
+STORE_DIR = "~/.spx_prophet_store"
+CANDLE_COLUMNS = ['datetime', 'open', 'high', 'low', 'close', 'volume', 'ts_ns']
+STORE_INTERVALS = {'30m': ('candles', 'es_30m'), '1m': ('minutes', 'es_1m')}  # → (subdir, file prefix)
+
+
+def candle_store_dir(interval: str = '30m') -> str:
+    import os
+    path = os.path.join(os.path.expanduser(STORE_DIR), STORE_INTERVALS[interval][0])
+    os.makedirs(path, exist_ok=True)
+    return path
+
+
+def store_candles(df: pd.DataFrame, interval: str = '30m') -> int:
+    """
+    Merge a candle frame into the store (one parquet file per CT month).
+    Rows are keyed on ts_ns; a re-fetched bar replaces the stored one.
+    Returns the number of bars that were not in the store before.
+    """
+    import os
+    if df is None or len(df) == 0:
+        return 0
+    df = ensure_time_columns(df)
+    cols = [c for c in CANDLE_COLUMNS if c in df.columns]
+    new = df[cols]
+    months = pd.DatetimeIndex(new['datetime']).strftime('%Y-%m')
+    added = 0
+    for month, part in new.groupby(months):
+        path = os.path.join(candle_store_dir(interval), f"{STORE_INTERVALS[interval][1]}_{month}.parquet")
+        if os.path.exists(path):
+            old = pd.read_parquet(path)
+            added += int((~part['ts_ns'].isin(old['ts_ns'])).sum())
+            part = pd.concat([old, part], ignore_index=True)
+        else:
+            added += len(part)
+        part = part.drop_duplicates('ts_ns', keep='last').sort_values('ts_ns')
+        tmp = path + ".tmp"
+        part.to_parquet(tmp, index=False)
+        os.replace(tmp, path)
+    return added
+
+
+def candle_store_signature(interval: str = '30m') -> tuple:
+    """(file, mtime, size) of every store file — changes whenever the store does."""
+    import os
+    root = candle_store_dir(interval)
+    return tuple(sorted((f, os.path.getmtime(os.path.join(root, f)), os.path.getsize(os.path.join(root, f)))
+                        for f in os.listdir(root) if f.endswith('.parquet')))
+
+
+@st.cache_data(show_spinner=False, max_entries=4)
+def _load_candle_store(signature: tuple, interval: str = '30m') -> pd.DataFrame:
+    import os
+    root = candle_store_dir(interval)
+    parts = [pd.read_parquet(os.path.join(root, f)) for f, _, _ in signature]
+    if not parts:
+        return pd.DataFrame(columns=CANDLE_COLUMNS)
+    df = pd.concat(parts, ignore_index=True).drop_duplicates('ts_ns', keep='last').sort_values('ts_ns')
+    return add_time_columns(df.reset_index(drop=True))
+
+
+def load_candle_store(start=None, end=None, interval: str = '30m') -> pd.DataFrame:
+    """All stored candles (optionally by session day, inclusive), with time columns."""
+    df = _load_candle_store(candle_store_signature(interval), interval)
+    if start is not None or end is not None:
+        days = df['session_day'].to_numpy()
+        keep = np.ones(len(df), dtype=bool)
+        if start is not None:
+            keep &= days >= day_number(start)
+        if end is not None:
+            keep &= days <= day_number(end)
+        df = df[keep]
+    return df
+
+
+# ============================================================
+# AUTO-DETECTION ENGINE
+# Detect bounces, rejections, and wick extremes from candle data
+# ============================================================
+
+def filter_ny_session(df: pd.DataFrame, session_date) -> pd.DataFrame:
+    """
+    Filter candles to only the NY regular session: 8:30 AM - 3:00 PM CT.
+    Uses a flexible window to catch candles even if timestamps are slightly off.
+    """
+    df = ensure_time_columns(df)
+    session_start = 8 * 60        # 8:00 AM — slightly early to catch 8:30
+    session_end = 15 * 60 + 30    # 3:30 PM — slightly late to catch 3:00
+    
+    ct_minute = df['ct_minute'].values
+    mask = (df['ct_day'].values == day_number(session_date)) & (ct_minute >= session_start) & (ct_minute <= session_end)
+    filtered = df[mask].copy().reset_index(drop=True)
+    return filtered
+
+
+def detect_inflections(ny_candles: pd.DataFrame) -> dict:
+    """
+    Auto-detect bounces and rejections from 30-min candle data.
+    
+    Uses LINE CHART logic: closing prices only for bounces/rejections.
+    
+    Bounce = trough: close[i] <= close[i-1] AND close[i] < close[i+1]
+      OR close[i] < close[i-1] AND close[i] <= close[i+1]
+      (handles flat bottoms)
+    
+    Rejection = peak: close[i] >= close[i-1] AND close[i] > close[i+1]
+      OR close[i] > close[i-1] AND close[i] >= close[i+1]
+      (handles flat tops)
+    
+    For multi-candle patterns (W-bottoms, M-tops), uses a 5-candle window:
+      If close[i] is the lowest/highest within a 5-candle window centered on it,
+      it's also detected as a bounce/rejection.
+    
+    Highest Wick = highest HIGH of a BEARISH candle (close < open)
+      - Exclude the 8:30 AM candle (opening noise)
+    
+    Lowest Wick = lowest LOW of a BULLISH candle (close > open)
+      - Exclude the 8:30 AM candle (opening noise)
+    """
+    if len(ny_candles) < 3:
+        return {'bounces': [], 'rejections': [], 'highest_wick': None, 'lowest_wick': None}
+    
+    ny_candles = ensure_time_columns(ny_candles)
+    closes = ny_candles['close'].values
+    times = pd.DatetimeIndex(ny_candles['datetime']).to_pydatetime()  # converted once
+    opens = ny_candles['open'].values
+    highs = ny_candles['high'].values
+    lows = ny_candles['low'].values
+    ct_minute = ny_candles['ct_minute'].values
+    n = len(closes)
+    
+    # Wick window: 9:00 AM to before 2:30 PM CT (exclude open/close noise)
+    wick_window = (ct_minute >= 9 * 60) & (ct_minute < 14 * 60 + 30)
+    
+    bounces = []
+    rejections = []
+    bounce_times = set()
+    rejection_times = set()
+    
+    # Pass 1: Standard 3-candle pattern (with <= to catch flat edges)
     for i in range(1, n - 1):
-        t = pd.Timestamp(times[i]).to_pydatetime()
+        t = times[i]
         
         # Bounce: local trough
         is_bounce = (
@@ -1481,7 +3803,7 @@ def detect_inflections(ny_candles: pd.DataFrame) -> dict:
         if i in bounce_times or i in rejection_times:
             continue
         
-        t = pd.Timestamp(times[i]).to_pydatetime()
+        t = times[i]
         window = closes[i-2:i+3]
         
         # Bounce: lowest in 5-candle window
@@ -1496,66 +3818,1787 @@ def detect_inflections(ny_candles: pd.DataFrame) -> dict:
     bounces.sort(key=lambda x: x['time'])
     rejections.sort(key=lambda x: x['time'])
     
-    # Highest wick: highest HIGH of a BEARISH candle (close < open)
-    # Only consider candles from 9:00 AM to 2:30 PM CT (exclude open/close noise)
-    bearish_mask = closes < opens
-    highest_wick = None
-    if bearish_mask.any():
-        best_high = -1
-        best_idx = None
-        for idx in range(n):
-            if not bearish_mask[idx]:
-                continue
-            t = pd.Timestamp(times[idx]).to_pydatetime()
-            # Skip opening noise (before 9:00 AM)
-            if t.hour < 9:
-                continue
-            # Skip closing noise (2:30 PM and later)
-            if t.hour >= 15 or (t.hour == 14 and t.minute >= 30):
-                continue
-            if highs[idx] > best_high:
-                best_high = highs[idx]
-                best_idx = idx
-        
-        if best_idx is not None:
-            highest_wick = {
-                'price': float(highs[best_idx]),
-                'time': pd.Timestamp(times[best_idx]).to_pydatetime()
-            }
+    # Highest wick: highest HIGH of a BEARISH candle (close < open)
+    # Only consider candles from 9:00 AM to 2:30 PM CT (exclude open/close noise)
+    bearish_mask = (closes < opens) & wick_window
+    highest_wick = None
+    if bearish_mask.any():
+        best_idx = int(np.argmax(np.where(bearish_mask, highs, -np.inf)))
+        highest_wick = {
+            'price': float(highs[best_idx]),
+            'time': times[best_idx]
+        }
+    
+    # Lowest wick: lowest LOW of a BULLISH candle (close > open)
+    # Only consider candles from 9:00 AM to 2:30 PM CT (exclude open/close noise)
+    bullish_mask = (closes > opens) & wick_window
+    lowest_wick = None
+    if bullish_mask.any():
+        best_idx = int(np.argmin(np.where(bullish_mask, lows, np.inf)))
+        lowest_wick = {
+            'price': float(lows[best_idx]),
+            'time': times[best_idx]
+        }
+    
+    return {
+        'bounces': bounces,
+        'rejections': rejections,
+        'highest_wick': highest_wick,
+        'lowest_wick': lowest_wick,
+    }
+
+
+# ============================================================
+# NY 9 AM BACKTESTER
+# Replays detection → 9 AM levels → signal → 0DTE trade over the
+# candle store, one row per trading day, sharded across processes
+# ============================================================
+
+NY_BACKTEST_DEFAULTS = {
+    'rate': RATE_PER_CANDLE,
+    'otm_points': RULE_OTM_POINTS,
+    'es_offset': 0.0,            # ES → SPX; history is in ES terms unless set
+    'vol': None,                 # annualized decimal; None = prior session realized vol
+    'contracts': 3,
+    'entry_minute': 9 * 60 + 5,  # 9:05 AM CT entry
+    'time_stop_minute': 11 * 60, # 11:00 AM CT time stop
+    'extrinsic_factor': ZERO_DTE_EXTRINSIC_FACTOR,
+    'min_confluence': 0.0,       # trades scoring below this are FILTERED
+    'cluster_width': CLUSTER_WIDTH,
+    'move_threshold': CONFLUENCE_MOVE_THRESHOLD,
+    'sweep_tolerance': SWEEP_TOLERANCE,
+}
+BACKTEST_BARS_PER_YEAR = 252 * 13  # 30-min RTH bars
+BACKTEST_VOL_RANGE = (0.05, 1.0)
+
+
+def ny_backtest_days(candles: pd.DataFrame, start=None, end=None) -> list:
+    """
+    (prior_day, trade_day) ct_day pairs: consecutive weekdays that both have
+    regular-session bars, with the trade day inside [start, end].
+    """
+    df = ensure_time_columns(candles)
+    minute = df['ct_minute'].to_numpy()
+    rth = (minute >= NY_OPEN_CT.hour * 60 + NY_OPEN_CT.minute) & (minute < NY_CLOSE_CT.hour * 60)
+    days = np.unique(df['ct_day'].to_numpy()[rth])
+    days = days[(days + 3) % 7 < 5]  # ct_day 0 was a Thursday → weekdays only
+    pairs = list(zip(days[:-1].tolist(), days[1:].tolist()))
+    lo = day_number(start) if start is not None else -np.inf
+    hi = day_number(end) if end is not None else np.inf
+    return [(a, b) for a, b in pairs if lo <= b <= hi]
+
+
+def _day_date(ct_day: int) -> datetime:
+    return datetime(1970, 1, 1) + timedelta(days=int(ct_day))
+
+
+def detect_backtest_day(prior_bars: pd.DataFrame, prior_day: int) -> dict:
+    """
+    The parameter-independent part of a backtest day: detect_inflections on the
+    prior NY session (ES terms). Returns {'closes': session closes, 'detected': ...},
+    'detected' None when the session has no wick extremes.
+    """
+    ny = filter_ny_session(prior_bars, _day_date(prior_day))
+    detected = detect_inflections(ny) if len(ny) >= 3 else None
+    if detected is not None and (detected['highest_wick'] is None or detected['lowest_wick'] is None):
+        detected = None
+    return {'closes': ny['close'].to_numpy(dtype=float), 'detected': detected}
+
+
+def prepare_backtest_days(candles: pd.DataFrame, pairs: list) -> list:
+    """detect_backtest_day for every (prior_day, trade_day) pair; candles sorted by time."""
+    day = candles['ct_day'].to_numpy()
+    out = []
+    for prior_day, _ in pairs:
+        lo, hi = np.searchsorted(day, [prior_day, prior_day + 1])
+        out.append(detect_backtest_day(candles.iloc[lo:hi], prior_day))
+    return out
+
+
+def backtest_day_levels(day_data: dict, trade_day: int, offset: float, rate: float = RATE_PER_CANDLE):
+    """
+    calculate_nine_am_levels for the trade day from a prepared day, with the
+    ES → SPX offset applied. None when the prior session had no wick extremes.
+    """
+    detected = day_data['detected']
+    if detected is None:
+        return None
+    trade_date = _day_date(trade_day)
+    bounces = apply_offset(detected['bounces'], offset)
+    rejections = apply_offset(detected['rejections'], offset)
+    hw = dict(detected['highest_wick'], price=detected['highest_wick']['price'] - offset)
+    lw = dict(detected['lowest_wick'], price=detected['lowest_wick']['price'] - offset)
+    return calculate_nine_am_levels(bounces, rejections, hw, lw,
+                                    datetime.combine(trade_date.date(), NY_DECISION_CT), rate)
+
+
+def backtest_ny_day(day_data: dict, trade_bars: pd.DataFrame,
+                    prior_day: int, trade_day: int, params: dict) -> dict:
+    """
+    One day of the 9 AM framework, exactly as the app runs it live:
+    detect_inflections on the prior NY session → calculate_nine_am_levels →
+    classify_signal at the 9:00 price → rule strike, stop and targets →
+    30-min bars from the entry bar to the time stop resolve the exit (stop
+    and TP1 touched in one bar count as the stop). The entry bar can only
+    stop out: its high and low may come before the 9:05 fill. The position is
+    priced with the 0DTE premium model at entry and at the exit bar's close.
+    Lines are projected at params['rate'].
+    """
+    prior_date, trade_date = _day_date(prior_day), _day_date(trade_day)
+    offset = params['es_offset']
+    clock = ExpiryClock(trade_date)
+    row = {'trade_day': trade_day, 'date': trade_date.date(), 'prior_date': prior_date.date(), 'signal': None,
+           'direction': None, 'exit_reason': 'NO DATA', 'pnl': 0.0, 'calendar_known': clock.calendar_known}
+    
+    levels = backtest_day_levels(day_data, trade_day, offset, params['rate'])
+    minute = trade_bars['ct_minute'].to_numpy()
+    decision = np.flatnonzero(minute == NY_DECISION_CT.hour * 60)
+    if levels is None or not len(decision):
+        return row
+    ladder = build_ny_ladder(levels)
+    
+    o, h, l, c = _ohlc_arrays(trade_bars, offset)
+    price = float(o[decision[0]])
+    sig = classify_signal(ladder, price)
+    row.update(signal=sig['signal'], direction=sig['trade_direction'], price=price,
+               n_lines=len(ladder), ladder_values=[l['value'] for l in ladder], exit_reason='NO TRADE')
+    direction = sig['trade_direction']
+    if not direction:
+        return row
+    
+    # Stop / targets with the trade card's fallbacks
+    side = 1.0 if direction == "CALL" else -1.0
+    stop = sig['stop_line']['value'] if sig['stop_line'] else price - side * 10
+    targets = sig['target_lines']
+    if targets:
+        tp1 = targets[0]['value']
+        tp2 = targets[1]['value'] if len(targets) >= 2 else tp1 + side * 5
+    else:
+        tp1, tp2 = price + side * 10, price + side * 20
+    
+    closes = day_data['closes']
+    vol = params['vol']
+    if vol is None:
+        rets = np.diff(np.log(closes))
+        vol = float(np.std(rets, ddof=1) * np.sqrt(BACKTEST_BARS_PER_YEAR)) if len(rets) > 1 else VIX_DEFAULT / 100
+        vol = float(np.clip(vol, *BACKTEST_VOL_RANGE))
+    
+    strike = rule_strike(price, direction, params['otm_points'])
+    entry_minute = params['entry_minute']
+    entry_premium = float(price_options_bs(price, strike, vol, clock.hours_left(entry_minute), direction,
+                                           extrinsic_factor=params['extrinsic_factor']))
+    
+    # Walk the 30-min bars from the entry bar up to the time stop; first touch decides
+    window = np.flatnonzero((minute >= NY_DECISION_CT.hour * 60) & (minute + CANDLE_MINUTES > entry_minute)
+                            & (minute < params['time_stop_minute']))
+    exit_reason, exit_spx, exit_minute = 'TIME', price, entry_minute
+    tp2_hit = False
+    for i in window:
+        hi_side, lo_side = (h[i], l[i]) if side > 0 else (-l[i], -h[i])
+        stop_hit = lo_side <= side * stop
+        tp1_hit = minute[i] >= entry_minute and hi_side >= side * tp1
+        exit_minute = int(minute[i]) + CANDLE_MINUTES
+        if stop_hit:
+            exit_reason, exit_spx = 'STOP', stop
+            break
+        if tp1_hit:
+            exit_reason, exit_spx = 'TP1', tp1
+            tp2_hit = bool(hi_side >= side * tp2)
+            break
+        exit_spx = float(c[i])
+    exit_minute = min(max(exit_minute, entry_minute), params['time_stop_minute'])
+    exit_premium = float(price_options_bs(exit_spx, strike, vol, clock.hours_left(exit_minute), direction,
+                                          extrinsic_factor=params['extrinsic_factor']))
+    pnl = (exit_premium - entry_premium) * 100 * params['contracts']
+    
+    row.update(stop=stop, tp1=tp1, tp2=tp2, strike=strike, vol=vol, entry_premium=entry_premium,
+               exit_reason=exit_reason, exit_minute=exit_minute, exit_spx=exit_spx,
+               exit_premium=exit_premium, tp2_hit=tp2_hit, pnl=pnl,
+               r_multiple=(exit_spx - price) * side / abs(price - stop) if price != stop else np.nan)
+    return row
+
+
+def _backtest_ny_shard(args: tuple) -> list:
+    """
+    A contiguous block of days (picklable for process pools). Prepared days
+    (prepare_backtest_days) are reused when given, detected here otherwise.
+    """
+    candles, pairs, params, day_data = args
+    day = candles['ct_day'].to_numpy()
+    bounds = lambda d: slice(*np.searchsorted(day, [d, d + 1]))
+    if day_data is None:
+        day_data = prepare_backtest_days(candles, pairs)
+    return [backtest_ny_day(prepared, candles.iloc[bounds(b)], a, b, params)
+            for prepared, (a, b) in zip(day_data, pairs)]
+
+
+BACKTEST_TRADED_EXITS = ('STOP', 'TP1', 'TP2', 'TIME')
+
+
+def backtest_summary(days: pd.DataFrame, group_by: str = 'signal') -> dict:
+    """Aggregate stats over backtest rows; equity runs over filled trades only."""
+    traded = days[days['exit_reason'].isin(BACKTEST_TRADED_EXITS)] if len(days) else days
+    pnl = traded['pnl'].to_numpy(dtype=float) if len(traded) else np.zeros(0)
+    equity = np.cumsum(pnl)
+    gross_win, gross_loss = pnl[pnl > 0].sum(), -pnl[pnl < 0].sum()
+    by_group = (traded.groupby(group_by).agg(trades=('pnl', 'size'), wins=('pnl', lambda x: int((x > 0).sum())),
+                                             total_pnl=('pnl', 'sum'), expectancy=('pnl', 'mean'))
+                if len(traded) else pd.DataFrame())
+    return {
+        'days': len(days),
+        'trades': len(traded),
+        'wins': int((pnl > 0).sum()),
+        'losses': int((pnl < 0).sum()),
+        'win_rate': float((pnl > 0).mean() * 100) if len(pnl) else 0.0,
+        'total_pnl': float(pnl.sum()),
+        'expectancy': float(pnl.mean()) if len(pnl) else 0.0,
+        'profit_factor': float(gross_win / gross_loss) if gross_loss > 0 else float('inf'),
+        'max_drawdown': float((equity - np.maximum.accumulate(equity)).min()) if len(equity) else 0.0,
+        'avg_r': float(np.nanmean(traded['r_multiple'])) if len(traded) else 0.0,
+        'exits': days['exit_reason'].value_counts().to_dict() if len(days) else {},
+        'by_group': by_group,
+    }
+
+
+def apply_confluence_filter(days: pd.DataFrame, candles: pd.DataFrame, params: dict) -> pd.DataFrame:
+    """
+    Score each traded day with the batch confluence factors (at the params'
+    cluster width, move threshold and sweep tolerance), keep the five factors
+    on the row for the combination stats, and mark trades below
+    params['min_confluence'] as FILTERED.
+    """
+    ladders = {d: v for d, v in zip(days['date'], days['ladder_values']) if isinstance(v, list)}
+    table = build_confluence_factor_table(candles, params['es_offset'], ladders,
+                                          cluster_width=params['cluster_width'],
+                                          move_threshold=params['move_threshold'],
+                                          sweep_tolerance=params['sweep_tolerance'])
+    directions = days.set_index('date')['direction']
+    factors = confluence_factors_for(table, directions)
+    days = days.drop(columns='ladder_values')
+    for f in CONFLUENCE_FACTORS:
+        values = days['date'].map(factors[f])
+        days[f] = values if f == 'data_reaction' else values.astype(float)  # NaN on days without a side
+    days['confluence'] = days['date'].map(factors['score'])
+    filtered = days['exit_reason'].isin(BACKTEST_TRADED_EXITS) & ~(days['confluence'] >= params['min_confluence'])
+    if params['min_confluence'] > 0 and filtered.any():
+        days.loc[filtered, 'exit_reason'] = 'FILTERED'
+        days.loc[filtered, 'pnl'] = 0.0
+    return days
+
+
+def run_ny_backtest(candles: pd.DataFrame, start=None, end=None, params: dict = None,
+                    workers: int = 0, shard_days: int = 120, day_data: list = None,
+                    pairs: list = None) -> dict:
+    """
+    Backtest the 9 AM framework over every trading day in [start, end].
+    
+    Days are cut into contiguous shards of shard_days, each shipped with only
+    the candles it needs; workers > 1 runs the shards on a process pool
+    (falls back to serial), and the rows come back in date order either way.
+    day_data (prepare_backtest_days over the same days) skips detection;
+    pairs (a subset of ny_backtest_days) replaces start/end.
+    
+    Returns:
+        Dict with 'days' (one row per trading day), 'summary', 'params', 'seconds'
+    """
+    started = time_mod.perf_counter()
+    params = {**NY_BACKTEST_DEFAULTS, **(params or {})}
+    df = ensure_time_columns(candles).sort_values('ts_ns').reset_index(drop=True)
+    if pairs is None:
+        pairs = ny_backtest_days(df, start, end)
+    
+    day = df['ct_day'].to_numpy()
+    jobs = []
+    for i in range(0, len(pairs), shard_days):
+        block = pairs[i:i + shard_days]
+        lo, hi = np.searchsorted(day, [block[0][0], block[-1][1] + 1])
+        jobs.append((df.iloc[lo:hi], block, params, day_data[i:i + shard_days] if day_data else None))
+    
+    shards = None
+    if workers and workers > 1 and len(jobs) > 1:
+        try:
+            from concurrent.futures import ProcessPoolExecutor
+            with ProcessPoolExecutor(max_workers=workers) as pool:
+                shards = list(pool.map(_backtest_ny_shard, jobs))
+        except Exception:
+            shards = None
+    if shards is None:
+        shards = [_backtest_ny_shard(job) for job in jobs]
+    
+    days = pd.DataFrame([r for rows in shards for r in rows])
+    if 'ladder_values' in days:
+        days = apply_confluence_filter(days, df, params)
+    if 'tp2_hit' in days:
+        days['tp2_hit'] = days['tp2_hit'].eq(True)
+    return {
+        'days': days,
+        'summary': backtest_summary(days),
+        'params': params,
+        'seconds': time_mod.perf_counter() - started,
+    }
+
+
+def backtest_workers() -> int:
+    """Processes for backtests and grids: backtest_workers in secrets.toml, else 0 (in-process)."""
+    try:
+        return int(st.secrets.get("backtest_workers", 0))
+    except:
+        return 0
+
+
+@st.cache_data(show_spinner=False, max_entries=8)
+def cached_ny_backtest(store_signature: tuple, start, end, params_items: tuple, workers: int = 0) -> dict:
+    """
+    The 9 AM backtest over the local candle store, keyed on its signature and
+    the params; days already in the results store are read, not recomputed.
+    """
+    return run_incremental_backtest(load_candle_store(), 'ny', start, end, dict(params_items), workers=workers)
+
+
+# ============================================================
+# ASIAN 6 PM BACKTESTER
+# The 6 PM setups rebuilt each evening and resolved bar by bar
+# (first touch) over 6:00-7:00 PM CT, all evenings in one array pass
+# ============================================================
+
+FUTURES_POINT_VALUES = {'MES': 5.0, 'ES': 50.0}
+ASIAN_BACKTEST_DEFAULTS = {
+    'rate': RATE_PER_CANDLE,
+    'max_move': ASIAN_MAX_MOVE,
+    'stop_points': ASIAN_STOP_POINTS,
+    'breakout_trigger': ASIAN_BREAKOUT_TRIGGER,
+    'target': 'target_1',   # exit target: 'target_1' or 'target_2'
+    'contract': 'MES',
+    'contracts': 2,
+}
+
+
+def evening_bar_matrix(bars: pd.DataFrame, evening_days: np.ndarray, bar_minutes: int) -> tuple:
+    """
+    O, H, L, C arrays of shape (evenings, 60 / bar_minutes) covering 6:00-7:00 PM
+    CT on each ct_day in evening_days (sorted); missing bars are NaN.
+    """
+    df = ensure_time_columns(bars)
+    start = ASIAN_DECISION_CT.hour * 60
+    n_cols = 60 // bar_minutes
+    minute = df['ct_minute'].to_numpy().astype(np.int64)
+    day = df['ct_day'].to_numpy()
+    row = np.searchsorted(evening_days, day)
+    keep = ((minute >= start) & (minute < start + 60) & ((minute - start) % bar_minutes == 0)
+            & (row < len(evening_days)))
+    keep[keep] = evening_days[row[keep]] == day[keep]
+    col = (minute[keep] - start) // bar_minutes
+    out = []
+    for name in ('open', 'high', 'low', 'close'):
+        arr = np.full((len(evening_days), n_cols), np.nan)
+        arr[row[keep], col] = df[name].to_numpy(dtype=float)[keep]
+        out.append(arr)
+    return tuple(out)
+
+
+def resolve_first_touch(side, entry, stop, target, trigger_up, is_stop_order, o, h, l, c) -> dict:
+    """
+    Resolve N bracket orders against their own bar rows (all arrays length N,
+    bars N × T) in one pass:
+    
+    - fill: first bar touching entry (high ≥ entry if trigger_up, else low ≤);
+      stop-type entries that gap through fill at the bar open
+    - exit: first bar after the fill touching the target, or from the fill bar
+      on touching the stop — a stop in the same bar as the target wins
+    - otherwise flat at the last bar's close (hard close)
+    
+    Returns arrays 'filled', 'fill_bar', 'fill_price', 'exit_bar', 'exit_price', 'exit_reason'
+    ('STOP', 'TARGET', 'TIME', 'NO FILL').
+    """
+    n, t = h.shape
+    cols = np.arange(t)
+    long = side > 0
+    trig = np.where(trigger_up[:, None], h >= entry[:, None], l <= entry[:, None])
+    filled = trig.any(axis=1)
+    fill_bar = np.where(filled, trig.argmax(axis=1), t)
+    rows = np.arange(n)
+    fill_open = o[rows, np.minimum(fill_bar, t - 1)]
+    gapped = is_stop_order & filled & np.where(trigger_up, fill_open > entry, fill_open < entry)
+    fill_price = np.where(gapped, fill_open, entry)
+    
+    adverse = np.where(long[:, None], l, h)
+    favorable = np.where(long[:, None], h, l)
+    s = side[:, None]
+    stop_hit = (s * adverse <= s * stop[:, None]) & (cols >= fill_bar[:, None])
+    tgt_hit = (s * favorable >= s * target[:, None]) & (cols > fill_bar[:, None])
+    first_stop = np.where(stop_hit.any(axis=1), stop_hit.argmax(axis=1), t)
+    first_tgt = np.where(tgt_hit.any(axis=1), tgt_hit.argmax(axis=1), t)
+    
+    valid = ~np.isnan(c)
+    last_bar = np.where(valid.any(axis=1), t - 1 - valid[:, ::-1].argmax(axis=1), t - 1)
+    by_stop = filled & (first_stop < t) & (first_stop <= first_tgt)
+    by_tgt = filled & (first_tgt < t) & ~by_stop
+    exit_bar = np.where(by_stop, first_stop, np.where(by_tgt, first_tgt, last_bar))
+    exit_price = np.where(by_stop, stop, np.where(by_tgt, target, c[rows, last_bar]))
+    reason = np.select([~filled, by_stop, by_tgt], ['NO FILL', 'STOP', 'TARGET'], 'TIME')
+    return {'filled': filled, 'fill_bar': fill_bar, 'fill_price': fill_price,
+            'exit_bar': exit_bar, 'exit_price': exit_price, 'exit_reason': reason}
+
+
+def run_asian_backtest(candles: pd.DataFrame, bars: pd.DataFrame = None, start=None, end=None,
+                       params: dict = None, day_data: list = None, pairs: list = None) -> dict:
+    """
+    Backtest the 6 PM futures setups over every evening in [start, end].
+    
+    Each evening (the calendar day before a trade day — Sunday for Monday)
+    gets the prior NY session's levels, the 6 PM ladder and the exact tab
+    setups at the 6:00 PM open. All setups of all evenings are then resolved
+    together against 6:00-7:00 PM bars: the 1-minute `bars` (the local 1m
+    store) on evenings they cover from 6:00 PM, the 30-min candles on every
+    other evening — 1-minute coverage is usually only the recent weeks. Each
+    trade row records its bar_minutes. day_data (prepare_backtest_days over
+    the same days) skips detection; pairs (a subset of ny_backtest_days)
+    replaces start/end.
+    
+    Returns:
+        Dict with 'trades' (one row per setup), 'summary', 'params',
+        'bar_minutes' (finest resolution used), 'seconds'
+    """
+    started = time_mod.perf_counter()
+    params = {**ASIAN_BACKTEST_DEFAULTS, **(params or {})}
+    df = ensure_time_columns(candles).sort_values('ts_ns').reset_index(drop=True)
+    if pairs is None:
+        pairs = ny_backtest_days(df, start, end)
+    evenings = np.array([b - 1 for _, b in pairs], dtype=np.int64)
+    matrices = {CANDLE_MINUTES: evening_bar_matrix(df, evenings, CANDLE_MINUTES)}
+    evening_minutes = np.full(len(evenings), CANDLE_MINUTES)
+    if bars is not None and len(bars):
+        matrices[1] = evening_bar_matrix(ensure_time_columns(bars), evenings, 1)
+        evening_minutes[~np.isnan(matrices[1][0][:, 0])] = 1
+    
+    # Setups per evening (levels are per-day work; resolution below is one pass per bar size)
+    day = df['ct_day'].to_numpy()
+    setups, setup_row = [], []
+    for i, (prior_day, trade_day) in enumerate(pairs):
+        price = matrices[evening_minutes[i]][0][i, 0]
+        if np.isnan(price):
+            continue
+        if day_data is not None:
+            prepared = day_data[i]
+        else:
+            lo, hi = np.searchsorted(day, [prior_day, prior_day + 1])
+            prepared = detect_backtest_day(df.iloc[lo:hi], prior_day)
+        levels = backtest_day_levels(prepared, trade_day, 0.0, params['rate'])
+        if levels is None:
+            continue
+        ladder = build_asian_ladder(levels, _day_date(evenings[i]).date())
+        plan = asian_trade_setups(ladder, price, params['max_move'], params['stop_points'],
+                                  params['breakout_trigger'])
+        for setup in plan['setups']:
+            setups.append({'trade_day': trade_day, 'date': _day_date(evenings[i]).date(),
+                           'setup': setup['direction'], 'price_6pm': price, 'entry': setup['entry'],
+                           'stop': setup['stop'], 'target': setup[params['target']],
+                           'bar_minutes': int(evening_minutes[i])})
+            setup_row.append(i)
+    
+    trades = pd.DataFrame(setups, columns=['trade_day', 'date', 'setup', 'price_6pm', 'entry', 'stop', 'target',
+                                           'bar_minutes'])
+    if len(trades):
+        rows = np.array(setup_row)
+        side = np.where(trades['setup'].str.startswith('LONG'), 1.0, -1.0)
+        entry = trades['entry'].to_numpy(dtype=float)
+        stop = trades['stop'].to_numpy(dtype=float)
+        target = trades['target'].to_numpy(dtype=float)
+        trigger_up = entry > trades['price_6pm'].to_numpy()
+        is_stop_order = trades['setup'].str.contains('BREAK').to_numpy()
+        bar_minutes = trades['bar_minutes'].to_numpy()
+        res = {}
+        for minutes, (o, h, l, c) in matrices.items():
+            sel = np.flatnonzero(bar_minutes == minutes)
+            if not len(sel):
+                continue
+            r = rows[sel]
+            part = resolve_first_touch(side[sel], entry[sel], stop[sel], target[sel], trigger_up[sel],
+                                       is_stop_order[sel], o[r], h[r], l[r], c[r])
+            for name, values in part.items():
+                res.setdefault(name, np.empty(len(trades), dtype=object if values.dtype.kind == 'U'
+                                              else values.dtype))[sel] = values
+        start_minute = ASIAN_DECISION_CT.hour * 60
+        points = np.where(res['filled'], side * (res['exit_price'] - res['fill_price']), 0.0)
+        target_reason = 'TP1' if params['target'] == 'target_1' else 'TP2'
+        trades['side'] = np.where(side > 0, 'LONG', 'SHORT')
+        trades['exit_reason'] = np.where(res['exit_reason'] == 'TARGET', target_reason, res['exit_reason'])
+        trades['fill_minute'] = np.where(res['filled'], start_minute + res['fill_bar'] * bar_minutes, np.nan)
+        trades['fill_price'] = np.where(res['filled'], res['fill_price'], np.nan)
+        trades['exit_minute'] = np.where(res['filled'], start_minute + (res['exit_bar'] + 1) * bar_minutes, np.nan)
+        trades['exit_price'] = np.where(res['filled'], res['exit_price'], np.nan)
+        trades['points'] = points
+        trades['pnl'] = points * FUTURES_POINT_VALUES[params['contract']] * params['contracts']
+        trades['r_multiple'] = np.where(res['filled'], points / np.abs(entry - trades['stop'].to_numpy()), np.nan)
+    else:
+        trades = trades.assign(side=[], exit_reason=[], points=[], pnl=[], r_multiple=[])
+    
+    return {
+        'trades': trades,
+        'summary': backtest_summary(trades, group_by='setup'),
+        'params': params,
+        'bar_minutes': int(evening_minutes.min()) if len(evening_minutes) else CANDLE_MINUTES,
+        'seconds': time_mod.perf_counter() - started,
+    }
+
+
+@st.cache_data(show_spinner=False, max_entries=8)
+def cached_asian_backtest(store_signature: tuple, minute_signature: tuple, start, end,
+                          params_items: tuple) -> dict:
+    """
+    The 6 PM backtest over the local stores (1-minute bars on the evenings
+    they cover, 30-min candles elsewhere); evenings already in the results
+    store are read, not recomputed.
+    """
+    bars = load_candle_store(interval='1m') if minute_signature else None
+    return run_incremental_backtest(load_candle_store(), 'asian', start, end, dict(params_items), bars=bars)
+
+
+# ============================================================
+# BACKTEST RESULTS STORE
+# Per-day backtest rows in parquet, addressed by (framework, params,
+# code version) and checked day by day against a hash of the bars the
+# day was computed from — re-runs only compute missing or changed days
+# ============================================================
+
+BACKTEST_FRAMEWORKS = {'ny': NY_BACKTEST_DEFAULTS, 'asian': ASIAN_BACKTEST_DEFAULTS}
+BACKTEST_CODE_ROOTS = {  # a stored row depends on these and every module name they reach (backtest_code_closure)
+    'ny': ['run_ny_backtest', 'ny_backtest_days', 'prepare_backtest_days', 'ensure_time_columns', 'RESULT_COLUMNS'],
+    'asian': ['run_asian_backtest', 'ny_backtest_days', 'prepare_backtest_days', 'ensure_time_columns',
+              'RESULT_COLUMNS'],
+}
+RESULT_COLUMNS = {
+    'ny': ['trade_day', 'date', 'prior_date', 'signal', 'direction', 'exit_reason', 'pnl', 'price', 'n_lines',
+           'stop', 'tp1', 'tp2', 'strike', 'vol', 'entry_premium', 'exit_minute', 'exit_spx', 'exit_premium',
+           'tp2_hit', 'r_multiple', 'confluence', 'asian_aligns', 'london_sweep', 'data_reaction',
+           'opening_drive', 'line_cluster', 'calendar_known'],
+    'asian': ['trade_day', 'date', 'setup', 'price_6pm', 'entry', 'stop', 'target', 'bar_minutes', 'side',
+              'exit_reason', 'fill_minute', 'fill_price', 'exit_minute', 'exit_price', 'points', 'pnl',
+              'r_multiple'],
+}
+RESULTS_MAX_PARTS = 16  # appended parts per parameter set before they are compacted into one
+RESULTS_LOCK_STALE_SECONDS = 60.0  # a lock file older than this was left by a writer that died
+RESULT_GROUPINGS = ['month', 'weekday', 'exit_reason', 'signal', 'setup']
+
+
+def params_hash(framework: str, params: dict) -> str:
+    """Store key of a parameter set; numbers are compared as floats (15 and 15.0 are one set)."""
+    import hashlib
+    norm = {k: float(v) if isinstance(v, (int, float, np.number)) and not isinstance(v, bool) else v
+            for k, v in params.items()}
+    payload = json.dumps([framework, sorted(norm.items())], default=str)
+    return hashlib.sha1(payload.encode()).hexdigest()[:16]
+
+
+def _stable_repr(obj) -> str:
+    """repr that is the same in every process: sets sorted, object addresses dropped."""
+    import re
+    if isinstance(obj, (set, frozenset)):
+        return "{" + ", ".join(sorted(_stable_repr(v) for v in obj)) + "}"
+    if isinstance(obj, dict):
+        return "{" + ", ".join(f"{_stable_repr(k)}: {_stable_repr(v)}" for k, v in obj.items()) + "}"
+    if isinstance(obj, (list, tuple)):
+        return "[" + ", ".join(_stable_repr(v) for v in obj) + "]"
+    return re.sub(r" at 0x[0-9a-fA-F]+", "", repr(obj))
+
+
+@lru_cache(maxsize=None)
+def backtest_code_closure(framework: str) -> tuple:
+    """
+    Every module-level name BACKTEST_CODE_ROOTS[framework] reaches: the names
+    read in each function's or class's source (its AST), followed through
+    the functions and classes defined in this file. Imported modules and
+    library objects stop the walk.
+    """
+    import ast
+    import inspect
+    import textwrap
+    module = globals()
+    seen, todo = set(), list(BACKTEST_CODE_ROOTS[framework])
+    while todo:
+        name = todo.pop()
+        if name in seen or name not in module:
+            continue
+        obj = inspect.unwrap(module[name]) if callable(module[name]) else module[name]
+        if inspect.ismodule(obj):
+            continue
+        if callable(obj):
+            if getattr(obj, '__module__', None) != __name__:
+                continue
+            try:
+                tree = ast.parse(textwrap.dedent(inspect.getsource(obj)))
+            except (OSError, TypeError, SyntaxError):
+                continue
+            todo.extend(node.id for node in ast.walk(tree) if isinstance(node, ast.Name))
+        seen.add(name)
+    return tuple(sorted(seen))
+
+
+@lru_cache(maxsize=None)
+def backtest_code_version(framework: str) -> str:
+    """
+    Hash of the source of every function and class (and the value of every
+    constant) in backtest_code_closure(framework): editing anything a stored
+    row depends on invalidates that framework's stored results.
+    """
+    import hashlib
+    import inspect
+    digest = hashlib.sha1(framework.encode())
+    for name in backtest_code_closure(framework):
+        obj = globals()[name]
+        try:
+            text = inspect.getsource(inspect.unwrap(obj)) if callable(obj) else _stable_repr(obj)
+        except (OSError, TypeError):
+            text = _stable_repr(obj)
+        digest.update(name.encode() + b"\0" + text.encode())
+    return digest.hexdigest()[:12]
+
+
+def session_day_hashes(df: pd.DataFrame) -> pd.Series:
+    """Content hash of each session day's bars (timestamps and OHLC), indexed by session_day."""
+    if df is None or len(df) == 0:
+        return pd.Series(dtype=np.uint64)
+    rows = pd.util.hash_pandas_object(df[['ts_ns', 'open', 'high', 'low', 'close']], index=False).to_numpy()
+    day = df['session_day'].to_numpy()
+    order = np.argsort(day, kind='stable')
+    day, rows = day[order], rows[order]
+    starts = np.flatnonzero(np.r_[True, day[1:] != day[:-1]])
+    return pd.Series(np.bitwise_xor.reduceat(rows, starts), index=day[starts])
+
+
+def backtest_input_hashes(candles: pd.DataFrame, framework: str, pairs: list,
+                          bars: pd.DataFrame = None) -> np.ndarray:
+    """
+    One uint64 per (prior_day, trade_day) pair over the bars its result is
+    computed from: the prior session and the trade day's session (Asian
+    evening included) — for the 6 PM framework also the trade day's session
+    in the resolution bars. A repaired or late-arriving bar changes the hash
+    of exactly the days it feeds.
+    """
+    if not pairs:
+        return np.zeros(0, dtype=np.uint64)
+    by_day = session_day_hashes(candles)
+    prior = np.array([a for a, _ in pairs])
+    trade = np.array([b for _, b in pairs])
+    parts = {'prior': by_day.reindex(prior, fill_value=0).to_numpy(),
+             'trade': by_day.reindex(trade, fill_value=0).to_numpy()}
+    if framework == 'asian' and bars is not None and len(bars) and bars is not candles:
+        parts['bars'] = session_day_hashes(bars).reindex(trade, fill_value=0).to_numpy()
+    return pd.util.hash_pandas_object(pd.DataFrame(parts), index=False).to_numpy()
+
+
+def results_store_dir(framework: str, key: str = None, version: str = None) -> str:
+    """STORE_DIR/results/{framework}[/{params key}-{code version}]"""
+    import os
+    path = os.path.join(os.path.expanduser(STORE_DIR), "results", framework)
+    if key is not None:
+        path = os.path.join(path, f"{key}-{version}")
+    os.makedirs(path, exist_ok=True)
+    return path
+
+
+@contextmanager
+def _results_lock(path: str):
+    """
+    Exclusive hold on one parameter set's directory — a lock file, so it
+    holds across sessions and processes. Appends, compaction and reads take
+    it: compaction can then never delete a rows part whose days part is
+    still being written, and a read never sees a half-compacted set.
+    """
+    import os
+    lock = os.path.join(path, ".lock")
+    while True:
+        try:
+            os.close(os.open(lock, os.O_CREAT | os.O_EXCL | os.O_WRONLY))
+            break
+        except FileExistsError:
+            try:
+                if time_mod.time() - os.path.getmtime(lock) > RESULTS_LOCK_STALE_SECONDS:
+                    os.remove(lock)
+                    continue
+            except OSError:
+                continue
+            time_mod.sleep(0.01)
+    try:
+        yield
+    finally:
+        try:
+            os.remove(lock)
+        except OSError:
+            pass
+
+
+def _read_result_parts(path: str, filters: list = None) -> tuple:
+    """
+    (days, rows) of one parameter set's directory. Each write appends a
+    rows_{seq} part and then a days_{seq} part listing the days it holds;
+    a day's latest days part wins and only rows from that same part count,
+    so a write interrupted before its days part is simply ignored. Callers
+    hold _results_lock(path).
+    """
+    import os
+    files = os.listdir(path)
+    seqs = sorted(int(f[5:-8]) for f in files if f.startswith('days_') and f.endswith('.parquet'))
+    if not seqs:
+        return pd.DataFrame(columns=['trade_day', 'input_hash', 'seq']), None
+    days = pd.concat([pd.read_parquet(os.path.join(path, f"days_{q}.parquet"), filters=filters).assign(seq=q)
+                      for q in seqs], ignore_index=True).drop_duplicates('trade_day', keep='last')
+    parts = [pd.read_parquet(os.path.join(path, f"rows_{q}.parquet"), filters=filters).assign(seq=q)
+             for q in seqs if f"rows_{q}.parquet" in files]
+    if not parts:
+        return days, None
+    rows = pd.concat(parts, ignore_index=True)
+    rows = rows[rows['trade_day'].map(days.set_index('trade_day')['seq']).to_numpy() == rows['seq'].to_numpy()]
+    return days, rows.drop(columns='seq').reset_index(drop=True)
+
+
+def stored_backtest_rows(framework: str, params: dict, trade_days: np.ndarray,
+                         input_hashes: np.ndarray) -> tuple:
+    """
+    Stored rows of `params` for the given trade days whose input hash still
+    matches, and the boolean mask of days that must be (re)computed.
+    """
+    path = results_store_dir(framework, params_hash(framework, params), backtest_code_version(framework))
+    with _results_lock(path):
+        days, rows = _read_result_parts(path)
+    valid = np.isin(trade_days, days['trade_day'].to_numpy())
+    stored = days.set_index('trade_day')['input_hash']
+    valid[valid] = stored.loc[trade_days[valid]].to_numpy(dtype=np.uint64) == input_hashes[valid]
+    if rows is None:
+        rows = pd.DataFrame(columns=RESULT_COLUMNS[framework])
+    return rows[rows['trade_day'].isin(trade_days[valid])], ~valid
+
+
+def save_backtest_rows(framework: str, params: dict, trade_days: np.ndarray, input_hashes: np.ndarray,
+                       rows: pd.DataFrame):
+    """
+    Append freshly computed days (and their rows, possibly none for a day)
+    to the store; a parameter set with more than RESULTS_MAX_PARTS parts is
+    compacted into one.
+    """
+    import os
+    if not len(trade_days):
+        return
+    key, version = params_hash(framework, params), backtest_code_version(framework)
+    path = results_store_dir(framework, key, version)
+    meta = os.path.join(path, "meta.json")
+    rows = rows.reindex(columns=RESULT_COLUMNS[framework])
+    days = pd.DataFrame({'trade_day': np.asarray(trade_days, dtype=np.int64),
+                         'input_hash': np.asarray(input_hashes, dtype=np.uint64)})
+    with _results_lock(path):
+        if not os.path.exists(meta):
+            with open(meta, 'w') as f:
+                json.dump({'framework': framework, 'key': key, 'code_version': version, 'params': params}, f,
+                          default=str)
+        
+        seq = time_mod.time_ns()
+        if len(rows):
+            rows.to_parquet(os.path.join(path, f"rows_{seq}.parquet"), index=False)
+        tmp = os.path.join(path, f"days_{seq}.tmp")
+        days.to_parquet(tmp, index=False)
+        os.replace(tmp, os.path.join(path, f"days_{seq}.parquet"))
+        
+        parts = [f for f in os.listdir(path) if f.endswith('.parquet')]
+        if sum(f.startswith('days_') for f in parts) > RESULTS_MAX_PARTS:
+            days, rows = _read_result_parts(path)
+            seq = time_mod.time_ns()
+            if rows is not None and len(rows):
+                rows.to_parquet(os.path.join(path, f"rows_{seq}.parquet"), index=False)
+            days[['trade_day', 'input_hash']].to_parquet(os.path.join(path, f"days_{seq}.tmp"), index=False)
+            os.replace(os.path.join(path, f"days_{seq}.tmp"), os.path.join(path, f"days_{seq}.parquet"))
+            for f in parts:
+                os.remove(os.path.join(path, f))
+
+
+def backtest_rows(candles: pd.DataFrame, framework: str, pairs: list, params: dict,
+                  bars: pd.DataFrame = None, day_data: list = None, workers: int = 0) -> pd.DataFrame:
+    """Freshly computed rows of the given (prior_day, trade_day) pairs."""
+    if framework == 'ny':
+        return run_ny_backtest(candles, params=params, workers=workers, day_data=day_data, pairs=pairs)['days']
+    return run_asian_backtest(candles, bars, params=params, day_data=day_data, pairs=pairs)['trades']
+
+
+def _merge_rows(framework: str, stored: pd.DataFrame, fresh: pd.DataFrame) -> pd.DataFrame:
+    """Stored and fresh rows in trade-day order (rows within a day keep their order)."""
+    frames = [f.reindex(columns=RESULT_COLUMNS[framework]) for f in (stored, fresh) if f is not None and len(f)]
+    if not frames:
+        return pd.DataFrame(columns=RESULT_COLUMNS[framework])
+    rows = pd.concat(frames, ignore_index=True) if len(frames) > 1 else frames[0]
+    return rows.sort_values('trade_day', kind='stable').reset_index(drop=True)
+
+
+def run_incremental_backtest(candles: pd.DataFrame, framework: str, start=None, end=None,
+                             params: dict = None, bars: pd.DataFrame = None, workers: int = 0) -> dict:
+    """
+    run_ny_backtest / run_asian_backtest through the results store: days
+    whose stored rows match the current params, code version and input bars
+    are read from disk, only the rest is computed (and then stored). A
+    re-run after one new day of candles computes one day.
+    
+    Returns:
+        Dict with 'rows', 'summary', 'params', 'key', 'computed' / 'cached'
+        (days), 'seconds'
+    """
+    started = time_mod.perf_counter()
+    params = {**BACKTEST_FRAMEWORKS[framework], **(params or {})}
+    df = ensure_time_columns(candles).sort_values('ts_ns').reset_index(drop=True)
+    if bars is not None and len(bars):
+        bars = ensure_time_columns(bars)
+    pairs = ny_backtest_days(df, start, end)
+    trade_days = np.array([b for _, b in pairs], dtype=np.int64)
+    hashes = backtest_input_hashes(df, framework, pairs, bars)
+    
+    stored, todo = stored_backtest_rows(framework, params, trade_days, hashes)
+    fresh = None
+    if todo.any():
+        fresh = backtest_rows(df, framework, [p for p, t in zip(pairs, todo) if t], params, bars, workers=workers)
+        save_backtest_rows(framework, params, trade_days[todo], hashes[todo], fresh)
+    rows = _merge_rows(framework, stored, fresh)
+    return {
+        'rows': rows,
+        'summary': backtest_summary(rows, group_by='signal' if framework == 'ny' else 'setup'),
+        'params': params,
+        'key': params_hash(framework, params),
+        'computed': int(todo.sum()),
+        'cached': int((~todo).sum()),
+        'seconds': time_mod.perf_counter() - started,
+    }
+
+
+def results_store_index(framework: str) -> pd.DataFrame:
+    """
+    One row per stored parameter set of the current code version: key,
+    stored days, first / last date and the parameters that differ from the
+    defaults.
+    """
+    import os
+    root = results_store_dir(framework)
+    version = backtest_code_version(framework)
+    defaults = BACKTEST_FRAMEWORKS[framework]
+    records = []
+    for name in sorted(os.listdir(root)):
+        key, _, v = name.partition('-')
+        meta = os.path.join(root, name, "meta.json")
+        if v != version or not os.path.exists(meta):
+            continue
+        with open(meta) as f:
+            params = json.load(f)['params']
+        with _results_lock(os.path.join(root, name)):
+            days, _ = _read_result_parts(os.path.join(root, name))
+        changed = {k: v for k, v in params.items() if k in defaults and str(v) != str(defaults[k])}
+        records.append({'key': key, 'days': len(days),
+                        'first': _day_date(days['trade_day'].min()).date() if len(days) else None,
+                        'last': _day_date(days['trade_day'].max()).date() if len(days) else None,
+                        'params': ", ".join(f"{k}={v}" for k, v in sorted(changed.items())) or "defaults"})
+    return pd.DataFrame(records, columns=['key', 'days', 'first', 'last', 'params'])
+
+
+def query_backtest_results(framework: str, key: str, start=None, end=None, columns: list = None) -> pd.DataFrame:
+    """
+    Stored rows of one parameter set (current code version), filtered to
+    trade days in [start, end] inside the parquet reader.
+    """
+    filters = []
+    if start is not None:
+        filters.append(('trade_day', '>=', day_number(start)))
+    if end is not None:
+        filters.append(('trade_day', '<=', day_number(end)))
+    path = results_store_dir(framework, key, backtest_code_version(framework))
+    with _results_lock(path):
+        _, rows = _read_result_parts(path, filters or None)
+    if rows is None:
+        rows = pd.DataFrame(columns=RESULT_COLUMNS[framework])
+    return rows[columns] if columns else rows
+
+
+def results_store_signature(framework: str, key: str) -> tuple:
+    """(file, mtime, size) of one parameter set's parts — changes whenever its rows do."""
+    import os
+    path = results_store_dir(framework, key, backtest_code_version(framework))
+    return tuple(sorted((f, os.path.getmtime(os.path.join(path, f)), os.path.getsize(os.path.join(path, f)))
+                        for f in os.listdir(path) if f.endswith('.parquet')))
+
+
+@st.cache_data(show_spinner=False, max_entries=8)
+def cached_backtest_combination_stats(key: str, results_signature: tuple, start=None, end=None) -> dict:
+    """
+    Factor-combination stats for the traded days of one stored NY parameter
+    set, from the factors the backtest kept on each row. Recomputed only when
+    that set's stored rows change (results_signature) or the range does.
+    """
+    rows = query_backtest_results('ny', key, start, end)
+    traded = rows[rows['exit_reason'].isin(BACKTEST_TRADED_EXITS)]
+    trades = traded[['date', 'direction', 'pnl', *CONFLUENCE_FACTORS]].assign(r=traded['r_multiple'])
+    joined = join_outcomes_with_factors(trades, None)
+    return {'joined': len(joined), 'total': len(trades),
+            'stats': confluence_combination_stats(joined) if len(joined) else None}
+
+
+def aggregate_backtest_results(rows: pd.DataFrame, by: str = 'month') -> pd.DataFrame:
+    """
+    Traded rows grouped by 'month', 'weekday' or any row column: trades,
+    wins, win rate, total P&L, expectancy and average R.
+    """
+    traded = rows[rows['exit_reason'].isin(BACKTEST_TRADED_EXITS)].reset_index(drop=True)
+    if not len(traded) or (by not in ('month', 'weekday') and by not in traded):
+        return pd.DataFrame()
+    if by in ('month', 'weekday'):
+        dates = pd.to_datetime(traded['date'])
+        keys = dates.dt.strftime('%Y-%m') if by == 'month' else dates.dt.day_name()
+    else:
+        keys = traded[by]
+    groups = traded.groupby(keys.rename(by))
+    table = groups['pnl'].agg(trades='size', wins=lambda x: int((x > 0).sum()), total_pnl='sum', expectancy='mean')
+    table['win_rate'] = table['wins'] / table['trades'] * 100
+    table['avg_r'] = groups['r_multiple'].mean()
+    return table.reset_index()
+
+
+def prune_backtest_results(framework: str) -> int:
+    """Delete stored parameter sets of older code versions; returns how many."""
+    import os
+    import shutil
+    root = results_store_dir(framework)
+    version = backtest_code_version(framework)
+    stale = [n for n in os.listdir(root) if n.partition('-')[2] != version]
+    for name in stale:
+        shutil.rmtree(os.path.join(root, name), ignore_errors=True)
+    return len(stale)
+
+
+# ============================================================
+# PARAMETER GRID SEARCH
+# Backtests over combinations of the framework constants: detection is
+# done once and shared with every worker, and per-day results go through
+# the results store so re-runs only compute what is new
+# ============================================================
+
+GRID_PARAMETERS = {
+    'ny': ['rate', 'otm_points', 'min_confluence', 'cluster_width', 'move_threshold', 'sweep_tolerance'],
+    'asian': ['rate', 'stop_points', 'breakout_trigger', 'max_move'],
+}
+_GRID_SHARED = {}  # pool worker processes only: candles, bars, pairs and prepared days
+
+
+def grid_combinations(grid: dict) -> list:
+    """Every combination of {param: [values]} as a list of dicts (sorted keys)."""
+    import itertools
+    keys = sorted(grid)
+    return [dict(zip(keys, values)) for values in itertools.product(*(grid[k] for k in keys))]
+
+
+def _init_grid_worker(shared: dict):
+    global _GRID_SHARED
+    _GRID_SHARED = shared
+
+
+def _grid_rows(shared: dict, framework: str, params: dict, todo: np.ndarray) -> pd.DataFrame:
+    """One combination's missing days (indices into shared['pairs'])."""
+    return backtest_rows(shared['candles'], framework, [shared['pairs'][i] for i in todo], params,
+                         shared['bars'], [shared['day_data'][i] for i in todo])
+
+
+def _grid_task(args: tuple) -> pd.DataFrame:
+    """_grid_rows against the pool worker's shared data (picklable for process pools)."""
+    return _grid_rows(_GRID_SHARED, *args)
+
+
+def run_parameter_grid(candles: pd.DataFrame, framework: str, grid: dict, start=None, end=None,
+                       bars: pd.DataFrame = None, base_params: dict = None, workers: int = 0,
+                       progress=None) -> dict:
+    """
+    Backtest every combination of `grid` ({param: [values]}) for one framework
+    ('ny' or 'asian'), on top of base_params and the framework defaults.
+    
+    Each combination reads its valid days from the results store and only
+    computes the rest, so a re-run, a grid overlapping an earlier one or a
+    range extended by new candles computes only what is new. Prior-session
+    detection does not depend on the parameters, so it runs once for the
+    days any combination needs and is handed to each worker process a single
+    time (pool initializer) together with the candles; workers then only
+    project, classify and resolve.
+    
+    Args:
+        progress: optional callback(done, total)
+    
+    Returns:
+        Dict with 'results' (one row per combination: its grid values and
+        summary stats), 'rows' (per-day rows per combination, same order),
+        'keys' (results store keys), 'computed' / 'cached' (combinations),
+        'trade_days' (every backtested ct_day, traded or not), 'days_computed', 'seconds'
+    """
+    started = time_mod.perf_counter()
+    df = ensure_time_columns(candles).sort_values('ts_ns').reset_index(drop=True)
+    if bars is not None and len(bars):
+        bars = ensure_time_columns(bars)
+    combos = [{**BACKTEST_FRAMEWORKS[framework], **(base_params or {}), **c} for c in grid_combinations(grid)]
+    pairs = ny_backtest_days(df, start, end)
+    trade_days = np.array([b for _, b in pairs], dtype=np.int64)
+    hashes = backtest_input_hashes(df, framework, pairs, bars)
+    plans = [stored_backtest_rows(framework, c, trade_days, hashes) for c in combos]
+    todo = [j for j, (_, missing) in enumerate(plans) if missing.any()]
+    
+    rows = {j: plan[0] for j, plan in enumerate(plans) if not plan[1].any()}
+    if todo:
+        needed = np.flatnonzero(np.any([plans[j][1] for j in todo], axis=0))
+        day_data = [None] * len(pairs)
+        for i, prepared in zip(needed, prepare_backtest_days(df, [pairs[i] for i in needed])):
+            day_data[i] = prepared
+        shared = {'candles': df, 'bars': bars, 'pairs': pairs, 'day_data': day_data}
+        jobs = [(framework, combos[j], np.flatnonzero(plans[j][1])) for j in todo]
+        done = 0
+        
+        def finish(j, frame):
+            nonlocal done
+            missing = plans[j][1]
+            save_backtest_rows(framework, combos[j], trade_days[missing], hashes[missing], frame)
+            rows[j] = _merge_rows(framework, plans[j][0], frame)
+            done += 1
+            if progress:
+                progress(done, len(todo))
+        
+        pooled = False
+        if workers and workers > 1 and len(jobs) > 1:
+            try:
+                from concurrent.futures import ProcessPoolExecutor, as_completed
+                with ProcessPoolExecutor(max_workers=workers, initializer=_init_grid_worker,
+                                         initargs=(shared,)) as pool:
+                    futures = {pool.submit(_grid_task, job): j for j, job in zip(todo, jobs)}
+                    for future in as_completed(futures):
+                        finish(futures[future], future.result())
+                pooled = True
+            except Exception:
+                pooled = False
+        if not pooled:
+            # In-process: this run's own data, never the module global another session may be using
+            for j, job in zip(todo, jobs):
+                if j not in rows:  # a pool that failed part-way keeps what it finished
+                    finish(j, _grid_rows(shared, *job))
+    
+    records = []
+    for j, combo in enumerate(combos):
+        summary = backtest_summary(rows[j], group_by='exit_reason')
+        records.append({**{k: combo[k] for k in sorted(grid)},
+                        **{k: summary[k] for k in ('trades', 'win_rate', 'total_pnl', 'expectancy',
+                                                   'profit_factor', 'max_drawdown')}})
+    return {
+        'results': pd.DataFrame(records),
+        'rows': [rows[j] for j in range(len(combos))],
+        'keys': [params_hash(framework, c) for c in combos],
+        'computed': len(todo),
+        'cached': len(combos) - len(todo),
+        'trade_days': trade_days,
+        'days_computed': int(sum(plans[j][1].sum() for j in todo)),
+        'seconds': time_mod.perf_counter() - started,
+    }
+
+
+# ============================================================
+# WALK-FORWARD OPTIMIZATION
+# Re-optimize on a rolling train window, trade the next test window
+# with the winner, and stitch the test windows into one OOS curve
+# ============================================================
+
+WF_TRAIN_DAYS = 250
+WF_TEST_DAYS = 60
+WF_OBJECTIVES = ['total_pnl', 'expectancy', 'profit_factor']
+
+
+def _window_objective(pnl: np.ndarray, trades: np.ndarray, objective: str) -> np.ndarray:
+    """Objective per combination over a (days × combos) slice."""
+    if objective == 'expectancy':
+        return pnl.sum(axis=0) / np.maximum(trades.sum(axis=0), 1)
+    if objective == 'profit_factor':
+        gain = np.where(pnl > 0, pnl, 0).sum(axis=0)
+        loss = -np.where(pnl < 0, pnl, 0).sum(axis=0)
+        return np.where(loss > 0, gain / np.maximum(loss, 1e-9), np.where(gain > 0, np.inf, 0.0))
+    return pnl.sum(axis=0)
+
+
+def run_walk_forward(candles: pd.DataFrame, framework: str, grid: dict, start=None, end=None,
+                     train_days: int = WF_TRAIN_DAYS, test_days: int = WF_TEST_DAYS,
+                     objective: str = 'total_pnl', bars: pd.DataFrame = None,
+                     base_params: dict = None, workers: int = 0, progress=None) -> dict:
+    """
+    Walk-forward optimization over the parameter grid.
+    
+    A backtest day only depends on its own prior session, so every
+    combination's per-day results are the same whichever window they fall
+    in. The grid is therefore run once over the whole range (in parallel and
+    through the results store, see run_parameter_grid), and every train/test
+    window is then evaluated at once on the days × combinations P&L matrix:
+    best combination on each train window by `objective`, its trades on the
+    following test window. Windows roll forward by test_days and count
+    trading days (every backtested day; a day without a trade scores 0).
+    
+    Returns:
+        Dict with 'windows' (one row per window: dates, chosen parameters,
+        train objective, test P&L / trades), 'oos' (the stitched out-of-sample
+        trades: date, pnl, window), 'in_sample' / 'in_sample_params' (trades and
+        parameters of the single best combination over the whole range),
+        'grid' (run_parameter_grid output), 'seconds'
+    """
+    started = time_mod.perf_counter()
+    grid_run = run_parameter_grid(candles, framework, grid, start, end, bars=bars,
+                                  base_params=base_params, workers=workers, progress=progress)
+    combos = grid_combinations(grid)
+    frames = [f[f['exit_reason'].isin(BACKTEST_TRADED_EXITS)] for f in grid_run['rows']]
+    
+    days = grid_run['trade_days']
+    empty = {'windows': pd.DataFrame(), 'oos': pd.DataFrame(columns=['date', 'pnl', 'window']),
+             'in_sample': pd.DataFrame(columns=['date', 'pnl']), 'in_sample_params': None, 'grid': grid_run,
+             'seconds': time_mod.perf_counter() - started}
+    if len(days) < train_days + 1:
+        return empty
+    dates = np.array([_day_date(d).date() for d in days])
+    
+    # trading days × combos P&L and trade-count matrices (no-trade days stay 0)
+    pnl = np.zeros((len(days), len(frames)))
+    trades = np.zeros((len(days), len(frames)))
+    for j, f in enumerate(frames):
+        daily = f.groupby('trade_day')['pnl'].agg(['sum', 'size'])
+        idx = np.searchsorted(days, daily.index.to_numpy(dtype=np.int64))
+        pnl[idx, j] = daily['sum'].to_numpy()
+        trades[idx, j] = daily['size'].to_numpy()
+    
+    windows, oos = [], []
+    for w, i in enumerate(range(0, len(days) - train_days, test_days)):
+        train, test = slice(i, i + train_days), slice(i + train_days, min(i + train_days + test_days, len(days)))
+        scores = _window_objective(pnl[train], trades[train], objective)
+        best = int(np.argmax(scores))
+        windows.append({'window': w + 1, 'train_start': dates[train][0], 'train_end': dates[train][-1],
+                        'test_start': dates[test][0], 'test_end': dates[test][-1], **combos[best],
+                        f'train_{objective}': float(scores[best]),
+                        'test_pnl': float(pnl[test, best].sum()), 'test_trades': int(trades[test, best].sum())})
+        chosen = frames[best]
+        in_test = (chosen['trade_day'] >= days[test][0]) & (chosen['trade_day'] <= days[test][-1])
+        oos.append(chosen.loc[in_test, ['date', 'pnl']].assign(window=w + 1))
+    
+    best_overall = int(np.argmax(_window_objective(pnl, trades, objective)))
+    return {
+        'windows': pd.DataFrame(windows),
+        'oos': pd.concat(oos, ignore_index=True),
+        'in_sample': frames[best_overall][['date', 'pnl']].reset_index(drop=True),
+        'in_sample_params': combos[best_overall],
+        'grid': grid_run,
+        'seconds': time_mod.perf_counter() - started,
+    }
+
+
+# ============================================================
+# SESSION REPLAY
+# Stored 1-minute bars replayed as live quotes through LivePipeline on
+# a simulated clock (1×-1000× or flat out), timing every tick
+# ============================================================
+
+REPLAY_SPEEDS = [1, 10, 60, 300, 1000]
+REPLAY_PATHS = ['close', 'ohlc']
+
+
+class SimulatedClock:
+    """
+    Session time running `speed` times faster than the wall clock from
+    `start`. wait_until() sleeps the scaled time left to a tick (nothing when
+    the replay is already behind); speed None jumps straight to each tick.
+    """
+    def __init__(self, start: datetime, speed: float = None):
+        self.start = start
+        self.speed = speed
+        self.current = start
+        self._wall = time_mod.perf_counter()
+    
+    def now(self) -> datetime:
+        if not self.speed:
+            return self.current
+        return self.start + timedelta(seconds=(time_mod.perf_counter() - self._wall) * self.speed)
+    
+    def wait_until(self, when: datetime) -> float:
+        """Block until session time `when`; returns the wall seconds slept."""
+        slept = 0.0
+        if self.speed:
+            slept = max(0.0, (when - self.now()).total_seconds() / self.speed)
+            if slept > 0:
+                time_mod.sleep(slept)
+        self.current = when
+        return slept
+
+
+def replay_quotes(bars: pd.DataFrame, path: str = 'close', bar_minutes: int = 1) -> pd.DataFrame:
+    """
+    Quote snapshots (time, price, high, low — what fetch_live_price reports)
+    from bar_minutes bars: one per bar at its close ('close'), or four per bar
+    a quarter bar apart walking open → nearer extreme → other extreme → close
+    ('ohlc').
+    """
+    df = ensure_time_columns(bars).sort_values('ts_ns')
+    t = pd.to_datetime(df['datetime']).to_numpy()
+    o, h, l, c = (df[k].to_numpy(dtype=float) for k in ('open', 'high', 'low', 'close'))
+    if path == 'close':
+        return pd.DataFrame({'time': t + np.timedelta64(bar_minutes, 'm'), 'price': c, 'high': h, 'low': l})
+    low_first = (o - l) <= (h - o)
+    prices = np.column_stack([o, np.where(low_first, l, h), np.where(low_first, h, l), c])
+    times = t[:, None] + (np.arange(4) * np.timedelta64(bar_minutes * 15, 's'))[None, :]
+    return pd.DataFrame({'time': times.ravel(), 'price': prices.ravel(),
+                         'high': np.repeat(h, 4), 'low': np.repeat(l, 4)})
+
+
+def session_levels(candles: pd.DataFrame, trade_day, es_offset: float = 0.0, rate: float = None):
+    """
+    The 9 AM levels the app would have had for a stored trade day (date):
+    prior-session detection and projection exactly as the backtester builds
+    them. None when the store has no prior session with levels for it.
+    """
+    df = ensure_time_columns(candles).sort_values('ts_ns').reset_index(drop=True)
+    pairs = ny_backtest_days(df, trade_day, trade_day)
+    if not pairs:
+        return None
+    prior_day, day = pairs[0]
+    lo, hi = np.searchsorted(df['ct_day'].to_numpy(), [prior_day, prior_day + 1])
+    return backtest_day_levels(detect_backtest_day(df.iloc[lo:hi], prior_day), day, es_offset,
+                               RATE_PER_CANDLE if rate is None else rate)
+
+
+def decision_open(bars: pd.DataFrame, ct_day: int, decision: time):
+    """Open of the bar starting at `decision` on ct_day (the price the backtesters decide at), or None."""
+    df = ensure_time_columns(bars)
+    at = np.flatnonzero((df['ct_day'].to_numpy() == ct_day) &
+                        (df['ct_minute'].to_numpy() == decision.hour * 60 + decision.minute))
+    return float(df['open'].to_numpy()[at[0]]) if len(at) else None
+
+
+def replay_pipeline(candles: pd.DataFrame, trade_day, es_offset: float = 0.0, rate: float = None,
+                    alert_distance: float = ALERT_PROXIMITY_POINTS):
+    """
+    LivePipeline for a stored trade day (date) on session_levels. Alerts go
+    to a DesktopAlertSink only — a replay never posts webhooks. Live, the
+    trader locks the 6 PM price by hand; the replay simulates that lock at
+    the 6:00 open, the price time travel and the backtester use.
+    """
+    levels = session_levels(candles, trade_day, es_offset, rate)
+    if levels is None:
+        return None
+    day = day_number(trade_day)
+    price_6pm = decision_open(candles, day - 1, ASIAN_DECISION_CT)
+    simulated_lock = None
+    if price_6pm is not None:
+        simulated_lock = (datetime.combine(_day_date(day - 1).date(), ASIAN_DECISION_CT), price_6pm)
+    pipeline = LivePipeline(levels, pd.Timestamp(trade_day).date(), es_offset, simulated_lock=simulated_lock)
+    engine = AlertEngine([DesktopAlertSink()])
+    engine.arm(ladder_alerts(pipeline.ny_ladder, pipeline.key_values, alert_distance))
+    pipeline.alert_engine = engine
+    return pipeline
+
+
+def replay_session(pipeline: LivePipeline, quotes: pd.DataFrame, speed: float = None,
+                   on_tick=None, profile: bool = False) -> dict:
+    """
+    Feed quote snapshots (replay_quotes, or any frame with time and price)
+    through pipeline.tick on a SimulatedClock.
+    
+    Only the tick itself is timed; on_tick(tick, clock) runs after it (for
+    rendering) and may return False to stop ('stopped'). profile=True runs
+    the ticks under cProfile.
+    
+    Returns:
+        Dict with 'ticks' (per-tick frame: time, price, zone, signal,
+        ny_signal, asian_price, asian_locked, auto_fetch, n_events, n_alerts,
+        latency_us), 'events', 'alerts', 'latency' (mean / p50 / p95 / p99 /
+        max µs), 'sim_seconds', 'wall_seconds', 'effective_speed', 'stopped',
+        'profile' (top functions by cumulative time, or None)
+    """
+    times = pd.to_datetime(quotes['time']).to_list()
+    prices = quotes['price'].to_numpy(dtype=float)
+    if not times:
+        return {'ticks': pd.DataFrame(), 'events': [], 'alerts': [], 'latency': {}, 'sim_seconds': 0.0,
+                'wall_seconds': 0.0, 'effective_speed': 0.0, 'stopped': False, 'profile': None}
+    profiler = None
+    if profile:
+        import cProfile
+        profiler = cProfile.Profile()
+    
+    clock = SimulatedClock(times[0], speed)
+    latency = np.zeros(len(times))
+    records, events, alerts = [], [], []
+    stopped = False
+    started = time_mod.perf_counter()
+    for i, (ts, price) in enumerate(zip(times, prices)):
+        clock.wait_until(ts)
+        t0 = time_mod.perf_counter_ns()
+        if profiler is not None:
+            profiler.enable()
+        tick = pipeline.tick(float(price), ts)
+        if profiler is not None:
+            profiler.disable()
+        latency[i] = (time_mod.perf_counter_ns() - t0) / 1000
+        events.extend(tick['events'])
+        alerts.extend(tick['alerts'])
+        records.append((ts, tick['spx_price'], tick['zone'], tick['signal'], tick['ny_signal'],
+                        tick['asian_price'], tick['asian_locked'], tick['auto_fetch'],
+                        len(tick['events']), len(tick['alerts'])))
+        if on_tick is not None and on_tick(tick, clock) is False:
+            latency = latency[:i + 1]
+            stopped = True
+            break
+    wall = time_mod.perf_counter() - started
+    
+    ticks = pd.DataFrame(records, columns=['time', 'price', 'zone', 'signal', 'ny_signal', 'asian_price',
+                                           'asian_locked', 'auto_fetch', 'n_events', 'n_alerts'])
+    ticks['latency_us'] = latency
+    sim = (ticks['time'].iloc[-1] - ticks['time'].iloc[0]).total_seconds()
+    report = None
+    if profiler is not None:
+        import io
+        import pstats
+        out = io.StringIO()
+        pstats.Stats(profiler, stream=out).sort_stats('cumulative').print_stats(15)
+        report = out.getvalue()
+    return {
+        'ticks': ticks,
+        'events': events,
+        'alerts': alerts,
+        'latency': {'mean_us': float(latency.mean()), 'p50_us': float(np.percentile(latency, 50)),
+                    'p95_us': float(np.percentile(latency, 95)), 'p99_us': float(np.percentile(latency, 99)),
+                    'max_us': float(latency.max())},
+        'sim_seconds': sim,
+        'wall_seconds': wall,
+        'effective_speed': sim / wall if wall > 0 else float('inf'),
+        'stopped': stopped,
+        'profile': report,
+    }
+
+
+# ============================================================
+# TIME TRAVEL
+# The dashboard as it stood at any stored minute: levels and quotes
+# are built once per session, and a cursor moves the live pipeline
+# forward tick by tick (or re-runs it from the open to go back)
+# ============================================================
+
+@st.cache_data(show_spinner=False, max_entries=64)
+def time_travel_day(store_signature: tuple, minute_signature: tuple, trade_day, es_offset: float,
+                    rate: float) -> dict:
+    """
+    The minute-independent part of one stored session: its levels
+    (session_levels), the quotes the live feed would have shown from the
+    5 PM open to the close (1-minute closes when stored, else 30-min) and
+    the 6 PM / 9 AM decision prices (bar opens, as the backtesters use).
+    None when the session has no levels.
+    """
+    day = day_number(trade_day)
+    # Back to the prior session the store actually has, however long the gap before it
+    stored = load_candle_store(end=_day_date(day))
+    pairs = ny_backtest_days(stored, _day_date(day), _day_date(day))
+    if not pairs:
+        return None
+    candles = stored[stored['session_day'].to_numpy() >= pairs[0][0]]
+    levels = session_levels(candles, trade_day, es_offset, rate)
+    if levels is None:
+        return None
+    bars = load_candle_store(_day_date(day), _day_date(day), interval='1m') if minute_signature else None
+    bar_minutes = 1
+    if bars is None or not len(bars) or not (bars['session_day'] == day).any():
+        bars, bar_minutes = candles, CANDLE_MINUTES
+    bars = bars[bars['session_day'] == day]
+    quotes = replay_quotes(bars, 'close', bar_minutes)
+    price_6pm = decision_open(bars, day - 1, ASIAN_DECISION_CT)
+    price_9am = decision_open(bars, day, NY_DECISION_CT)
+    return {
+        'date': _day_date(day).date(),
+        'levels': levels,
+        'es_offset': es_offset,
+        'rate': rate,
+        'times': quotes['time'].to_numpy(),
+        'prices': quotes['price'].to_numpy(),
+        'bar_minutes': bar_minutes,
+        'open': datetime.combine(_day_date(day - 1).date(), time(17, 0)),
+        'close': pd.Timestamp(quotes['time'].max()).to_pydatetime() if len(quotes) else
+                 datetime.combine(_day_date(day).date(), NY_CLOSE_CT),
+        'price_6pm': price_6pm,
+        'price_9am': price_9am - es_offset if price_9am is not None else None,
+    }
+
+
+class TimeTravelCursor:
+    """
+    A LivePipeline over one stored session (time_travel_day) that can be set
+    to any minute. A seek feeds the quotes from the current position, or from
+    the nearest checkpoint before the target when that is closer (a pipeline
+    copy every checkpoint_every quotes, taken on the way forward). The 6 PM price
+    locks at the 6:00 open, the 9 AM signal is the one at the 9:00 open.
+    """
+    checkpoint_every = 60
+    
+    def __init__(self, day: dict):
+        self.day = day
+        self.decision_6pm = datetime.combine(self.day['open'].date(), ASIAN_DECISION_CT)
+        self.decision_9am = datetime.combine(self.day['date'], NY_DECISION_CT)
+        self._decision_6pm = np.datetime64(self.decision_6pm)
+        self.ny_decision = None
+        pipeline = LivePipeline(self.day['levels'], self.day['date'], self.day['es_offset'])
+        self._checkpoints = {0: (pipeline, None)}
+        self._restore(0)
+        self.seek(self.day['close'])  # one pass lays down every checkpoint
+    
+    def _restore(self, position: int):
+        pipeline, self.tick = self._checkpoints[position]
+        self.pipeline = copy.deepcopy(pipeline)
+        self.position = position
+    
+    def _lock(self):
+        if self.day['price_6pm'] is not None and self.pipeline.locked_price is None:
+            self.pipeline.lock(self.day['price_6pm'])
+    
+    def seek(self, when: datetime) -> dict:
+        """State of the dashboard at `when` (quotes up to and including it)."""
+        times, prices = self.day['times'], self.day['prices']
+        i = int(np.searchsorted(times, np.datetime64(pd.Timestamp(when)), side='right'))
+        nearest = max(p for p in self._checkpoints if p <= i)
+        if i < self.position or nearest > self.position:
+            self._restore(nearest)
+        for j in range(self.position, i):
+            if times[j] >= self._decision_6pm:
+                self._lock()
+            self.tick = self.pipeline.tick(float(prices[j]), pd.Timestamp(times[j]))
+            if (j + 1) % self.checkpoint_every == 0 and j + 1 not in self._checkpoints:
+                self._checkpoints[j + 1] = (copy.deepcopy(self.pipeline), self.tick)
+        self.position = i
+        
+        pipeline = self.pipeline
+        if when >= self.decision_6pm:
+            self._lock()
+        if when >= self.decision_9am and self.day['price_9am'] is not None and self.ny_decision is None:
+            self.ny_decision = classify_signal(pipeline.ny_ladder, self.day['price_9am'])
+        
+        es_price = self.tick['es_price'] if self.tick else None
+        asian_price = pipeline.locked_price if pipeline.locked_price is not None else es_price
+        plan = pipeline.asian_plan
+        if plan is None and asian_price is not None:
+            plan = asian_trade_setups(pipeline.asian_ladder, asian_price, pipeline.asian_max_move)
+        return {
+            'time': when,
+            'tick': self.tick,
+            'asian_price': asian_price,
+            'asian_locked': pipeline.locked_price is not None,
+            'asian_plan': plan,
+            'ny_decision': self.ny_decision if when >= self.decision_9am else None,
+            'events': list(pipeline.tracker.events),
+        }
+
+
+# ============================================================
+# STRUCTURAL MAP CHART
+# The 9 AM line ladder as a "thermometer" with a price marker — the
+# structural map tab and the time-travel view draw the same figure
+# ============================================================
+
+STRUCTURAL_MAP_CONFIG = {
+    'displayModeBar': True,
+    'modeBarButtonsToRemove': ['autoScale2d', 'lasso2d', 'select2d', 'zoom2d', 'zoomIn2d', 'zoomOut2d'],
+    'displaylogo': False,
+    'scrollZoom': True,
+}
+
+
+def structural_map_figure(levels: dict, price: float = None, label: str = "LIVE") -> go.Figure:
+    """
+    Every projected line at its 9 AM value as a horizontal level (key lines
+    solid, zones shaded by the directions around them), plus a `label`
+    price marker with the distance to the nearest line on each side.
+    """
+    fig = go.Figure()
+    shapes, annotations = [], []  # applied in one update_layout (add_shape re-validates every call)
+    
+    # ══════════════════════════════════════════════════════════════
+    # HORIZONTAL LADDER CHART — "Thermometer" style
+    # Price levels as horizontal zones, current price as marker
+    # ══════════════════════════════════════════════════════════════
+    
+    # Collect all line levels at 9 AM into a sorted ladder
+    ladder_lines = []
+    for li, asc_line in enumerate(levels['ascending']):
+        is_wick = asc_line['type'] == 'highest_wick'
+        ladder_lines.append({
+            'value': asc_line['value_at_9am'],
+            'label': 'HW' if is_wick else f'B{li+1}',
+            'full': f"{'Highest Wick' if is_wick else f'Bounce {li+1}'}",
+            'direction': 'ascending',
+            'color': '#ff1744' if is_wick else '#ff5252',
+            'is_key': is_wick,
+            'anchor': asc_line['anchor_price'],
+        })
+    for li, desc_line in enumerate(levels['descending']):
+        is_wick = desc_line['type'] == 'lowest_wick'
+        ladder_lines.append({
+            'value': desc_line['value_at_9am'],
+            'label': 'LW' if is_wick else f'R{li+1}',
+            'full': f"{'Lowest Wick' if is_wick else f'Rejection {li+1}'}",
+            'direction': 'descending',
+            'color': '#00e676' if is_wick else '#69f0ae',
+            'is_key': is_wick,
+            'anchor': desc_line['anchor_price'],
+        })
+    ladder_lines.sort(key=lambda x: x['value'])
+    
+    if ladder_lines:
+        # Price range for chart
+        all_vals = [l['value'] for l in ladder_lines]
+        price_min = min(all_vals) - 3
+        price_max = max(all_vals) + 3
+        price_range = price_max - price_min
+        
+        # Price marker (live, replayed or historical)
+        live_spx = price
+        if live_spx is not None:
+            price_min = min(price_min, live_spx - 3)
+            price_max = max(price_max, live_spx + 3)
+            price_range = price_max - price_min
+        
+        # ── Zone fills between adjacent lines ──
+        for i in range(len(ladder_lines) - 1):
+            lower = ladder_lines[i]
+            upper = ladder_lines[i + 1]
+            if upper['value'] - lower['value'] <= 0:
+                continue  # coincident lines leave no zone to fill
+            
+            # Color based on what's above vs below
+            if upper['direction'] == 'ascending' and lower['direction'] == 'descending':
+                # Ascending above + descending below = compression zone (gold)
+                zone_color = 'rgba(255,215,64,0.04)'
+            elif upper['direction'] == 'descending':
+                # Descending above = bearish zone
+                zone_color = 'rgba(255,23,68,0.03)'
+            elif lower['direction'] == 'ascending':
+                # Ascending below = bullish zone
+                zone_color = 'rgba(0,230,118,0.03)'
+            else:
+                zone_color = 'rgba(255,255,255,0.01)'
+            
+            shapes.append(dict(type="rect",
+                x0=-0.5, x1=10.5,
+                y0=lower['value'], y1=upper['value'],
+                fillcolor=zone_color,
+                line=dict(width=0),
+                layer="below",
+            ))
+        
+        # ── Horizontal level lines with glow ──
+        for line in ladder_lines:
+            # Glow layer
+            shapes.append(dict(type="line",
+                x0=-0.5, x1=10.5,
+                y0=line['value'], y1=line['value'],
+                line=dict(color=line['color'], width=8 if line['is_key'] else 4),
+                opacity=0.06,
+                layer="below",
+            ))
+            
+            # Main line
+            line_width = 3 if line['is_key'] else 1.5
+            dash = 'solid' if line['is_key'] else 'dot'
+            shapes.append(dict(type="line",
+                x0=-0.5, x1=10.5,
+                y0=line['value'], y1=line['value'],
+                line=dict(color=line['color'], width=line_width, dash=dash),
+                opacity=0.85 if line['is_key'] else 0.45,
+            ))
+            
+            # Right-side label
+            icon = '▲' if line['direction'] == 'ascending' else '▼'
+            font_size = 12 if line['is_key'] else 10
+            annotations.append(dict(
+                x=10.5, y=line['value'],
+                text=f"<b>{icon} {line['label']}</b> {line['value']:.2f}",
+                showarrow=False,
+                xanchor="left", xshift=8,
+                font=dict(size=font_size, color=line['color'], family='JetBrains Mono'),
+                bgcolor='rgba(6,9,16,0.85)',
+                bordercolor=line['color'],
+                borderwidth=1 if line['is_key'] else 0,
+                borderpad=4,
+            ))
+            
+            # Left-side direction indicator  
+            if line['is_key']:
+                annotations.append(dict(
+                    x=-0.5, y=line['value'],
+                    text=f"<b>{line['full']}</b>",
+                    showarrow=False,
+                    xanchor="right", xshift=-8,
+                    font=dict(size=9, color=line['color'], family='Rajdhani'),
+                    opacity=0.7,
+                ))
+        
+        # ── Live price marker — glowing horizontal band ──
+        if live_spx is not None:
+            # Wide glow band
+            shapes.append(dict(type="rect",
+                x0=-0.5, x1=10.5,
+                y0=live_spx - 0.5, y1=live_spx + 0.5,
+                fillcolor='rgba(0,212,255,0.08)',
+                line=dict(width=0),
+            ))
+            # Bright line
+            shapes.append(dict(type="line",
+                x0=-0.5, x1=10.5,
+                y0=live_spx, y1=live_spx,
+                line=dict(color='#00d4ff', width=2.5, dash='solid'),
+            ))
+            # Diamond marker
+            fig.add_trace(go.Scatter(
+                x=[5], y=[live_spx],
+                mode='markers+text',
+                marker=dict(symbol='diamond', size=18, color='#00d4ff',
+                    line=dict(width=2, color='rgba(0,212,255,0.4)')),
+                text=[f"  ◉ {label}  {live_spx:.2f}"],
+                textposition='middle right',
+                textfont=dict(color='#00d4ff', size=13, family='Orbitron'),
+                showlegend=False,
+                hovertemplate=f"<b>{label} SPX</b><br>{live_spx:.2f}<extra></extra>",
+            ))
+            
+            # Show distance to nearest lines above/below
+            above_lines = [l for l in ladder_lines if l['value'] > live_spx]
+            below_lines = [l for l in ladder_lines if l['value'] <= live_spx]
+            
+            if above_lines:
+                nearest_above = min(above_lines, key=lambda x: x['value'])
+                dist_up = nearest_above['value'] - live_spx
+                annotations.append(dict(
+                    x=5, y=(live_spx + nearest_above['value']) / 2,
+                    text=f"<b>{dist_up:.1f}pt</b>",
+                    showarrow=False,
+                    font=dict(size=10, color='rgba(255,255,255,0.3)', family='JetBrains Mono'),
+                ))
+            
+            if below_lines:
+                nearest_below = max(below_lines, key=lambda x: x['value'])
+                dist_down = live_spx - nearest_below['value']
+                annotations.append(dict(
+                    x=5, y=(live_spx + nearest_below['value']) / 2,
+                    text=f"<b>{dist_down:.1f}pt</b>",
+                    showarrow=False,
+                    font=dict(size=10, color='rgba(255,255,255,0.3)', family='JetBrains Mono'),
+                ))
+    
+    # ── Chart layout — clean thermometer style ──
+    fig.update_layout(
+        shapes=shapes,
+        annotations=annotations,
+        template='plotly_dark',
+        paper_bgcolor='rgba(5,8,16,1)',
+        plot_bgcolor='rgba(8,13,22,1)',
+        height=700,
+        margin=dict(l=120, r=200, t=30, b=30),
+        xaxis=dict(
+            showgrid=False, showticklabels=False, showline=False,
+            zeroline=False, range=[-1, 11.5],
+            fixedrange=True,
+        ),
+        yaxis=dict(
+            gridcolor='rgba(30,45,74,0.08)',
+            showgrid=True, gridwidth=1,
+            zeroline=False,
+            tickformat='.2f', side='right',
+            range=[price_min, price_max] if ladder_lines else None,
+            tickfont=dict(size=11, family='JetBrains Mono', color='#3a4a6a'),
+            showline=True, linecolor='rgba(30,45,74,0.2)', linewidth=1,
+            dtick=2,
+        ),
+        showlegend=False,
+        font=dict(family='JetBrains Mono', color='#8892b0'),
+        hovermode='closest',
+        hoverlabel=dict(
+            bgcolor='rgba(6,9,16,0.95)',
+            bordercolor='rgba(0,212,255,0.2)',
+            font=dict(family='JetBrains Mono', size=11, color='#ccd6f6'),
+        ),
+        dragmode='pan',
+    )
+    return fig
+
+
+# ============================================================
+# PERFORMANCE CHARTS
+# Equity curve shared by the trade log dashboard and the backtest lab
+# ============================================================
+
+def equity_curve_frame(dates, pnl) -> pd.DataFrame:
+    """Trades sorted by date with cumulative_pnl, peak and drawdown columns."""
+    curve = pd.DataFrame({'date': pd.to_datetime(pd.Series(dates)).to_numpy(),
+                          'pnl': np.asarray(pnl, dtype=float)}).sort_values('date', kind='stable')
+    curve['cumulative_pnl'] = curve['pnl'].cumsum()
+    curve['peak'] = curve['cumulative_pnl'].cummax()
+    curve['drawdown'] = curve['cumulative_pnl'] - curve['peak']
+    return curve.reset_index(drop=True)
+
+
+def equity_curve_figure(curve: pd.DataFrame, name: str = 'Equity', overlays: dict = None,
+                        markers: bool = True) -> go.Figure:
+    """
+    Performance Dashboard equity chart for an equity_curve_frame(): equity
+    line with fill, zero line and drawdown shading. overlays adds further
+    {name: curve} lines (e.g. in-sample next to out-of-sample).
+    """
+    eq_fig = go.Figure()
+    
+    # Equity line with fill
+    eq_fig.add_trace(go.Scatter(
+        x=curve['date'], 
+        y=curve['cumulative_pnl'],
+        mode='lines+markers' if markers else 'lines',
+        name=name,
+        line=dict(color='#00d4ff', width=2.5),
+        marker=dict(size=6, color=curve['pnl'].apply(lambda x: '#00e676' if x >= 0 else '#ff1744')),
+        fill='tozeroy',
+        fillcolor='rgba(0,212,255,0.06)',
+        hovertemplate='<b>%{x|%b %d}</b><br>Equity: $%{y:+,.0f}<extra></extra>'
+    ))
+    
+    for overlay_name, overlay in (overlays or {}).items():
+        eq_fig.add_trace(go.Scatter(
+            x=overlay['date'], y=overlay['cumulative_pnl'], mode='lines', name=overlay_name,
+            line=dict(color='#ffd740', width=1.5, dash='dash'),
+            hovertemplate=f'{overlay_name}: $%{{y:+,.0f}}<extra></extra>'
+        ))
+    
+    # Zero line
+    eq_fig.add_hline(y=0, line_dash="dot", line_color="rgba(255,255,255,0.1)", line_width=1)
     
-    # Lowest wick: lowest LOW of a BULLISH candle (close > open)
-    # Only consider candles from 9:00 AM to 2:30 PM CT (exclude open/close noise)
-    bullish_mask = closes > opens
-    lowest_wick = None
-    if bullish_mask.any():
-        best_low = float('inf')
-        best_idx = None
-        for idx in range(n):
-            if not bullish_mask[idx]:
-                continue
-            t = pd.Timestamp(times[idx]).to_pydatetime()
-            # Skip opening noise (before 9:00 AM)
-            if t.hour < 9:
-                continue
-            # Skip closing noise (2:30 PM and later)
-            if t.hour >= 15 or (t.hour == 14 and t.minute >= 30):
-                continue
-            if lows[idx] < best_low:
-                best_low = lows[idx]
-                best_idx = idx
-        
-        if best_idx is not None:
-            lowest_wick = {
-                'price': float(lows[best_idx]),
-                'time': pd.Timestamp(times[best_idx]).to_pydatetime()
-            }
+    # Drawdown shading
+    if len(curve) and curve['drawdown'].min() < 0:
+        eq_fig.add_trace(go.Scatter(
+            x=curve['date'],
+            y=curve['drawdown'],
+            mode='lines',
+            name='Drawdown',
+            line=dict(color='#ff1744', width=1, dash='dot'),
+            fill='tozeroy',
+            fillcolor='rgba(255,23,68,0.06)',
+            hovertemplate='Drawdown: $%{y:,.0f}<extra></extra>'
+        ))
     
-    return {
-        'bounces': bounces,
-        'rejections': rejections,
-        'highest_wick': highest_wick,
-        'lowest_wick': lowest_wick,
-    }
+    eq_fig.update_layout(
+        template='plotly_dark',
+        paper_bgcolor='rgba(5,8,16,1)',
+        plot_bgcolor='rgba(8,13,22,1)',
+        height=350,
+        margin=dict(l=10, r=20, t=10, b=40),
+        xaxis=dict(
+            gridcolor='rgba(30,45,74,0.12)', showgrid=True,
+            tickfont=dict(family='Rajdhani', size=11, color='#3a4a6a'),
+        ),
+        yaxis=dict(
+            gridcolor='rgba(30,45,74,0.12)', showgrid=True,
+            tickformat='$,.0f', side='right',
+            tickfont=dict(family='JetBrains Mono', size=11, color='#5a6a8a'),
+        ),
+        legend=dict(bgcolor='rgba(6,9,16,0.95)', font=dict(size=10, family='JetBrains Mono', color='#8892b0')),
+        font=dict(family='JetBrains Mono', color='#8892b0'),
+        hovermode='x unified',
+        hoverlabel=dict(bgcolor='rgba(6,9,16,0.95)', bordercolor='rgba(0,212,255,0.2)',
+            font=dict(family='JetBrains Mono', size=11, color='#ccd6f6')),
+    )
+    return eq_fig
 
 
 # ============================================================
@@ -1570,6 +5613,15 @@ def main():
     # Live price tracking toggle
     live_mode = st.toggle("🔴 LIVE MODE", value=False, help="Auto-refresh every 30 seconds with current ES price")
     
+    # One latency budget for this rerun's automatic fetches, another for clicked ones
+    budget_seconds = RERUN_FETCH_BUDGET_SECONDS
+    user_budget_seconds = USER_FETCH_BUDGET_SECONDS
+    try:
+        budget_seconds = float(st.secrets.get("fetch_budget_seconds", budget_seconds))
+        user_budget_seconds = float(st.secrets.get("user_fetch_budget_seconds", user_budget_seconds))
+    except:
+        pass
+    
     # ============================================================
     # SIDEBAR: Input Panel
     # ============================================================
@@ -1585,6 +5637,10 @@ def main():
         next_date = st.date_input("Next Trading Day",
                                    value=datetime.now().date(),
                                    help="The day you're projecting lines into")
+        if not ExpiryClock(next_date).calendar_known:
+            st.warning(f"⚠️ The early-close calendar covers {EARLY_CLOSE_FIRST_YEAR}–{EARLY_CLOSE_LAST_YEAR}: "
+                       f"a {next_date.year} half-day would be priced as a full session. "
+                       f"Extend EARLY_CLOSE_DATES.")
         
         st.markdown("---")
         
@@ -1613,9 +5669,24 @@ def main():
             if fetch_btn or st.session_state.get('last_fetch_status'):
                 if fetch_btn:
                     with st.spinner("Fetching ES candle data..."):
-                        data_status = fetch_es_candles(prior_date, next_date)
-                        st.session_state['last_fetch_status'] = data_status
-                        st.session_state['last_fetch_candles'] = data_status.candles
+                        es_fetch = run_fetches({
+                            'es': (('es_candles', prior_date, next_date), fetch_es_candles, (prior_date, next_date)),
+                        }, user_budget_seconds)['es']
+                    if es_fetch['value'] is not None:
+                        data_status = copy.copy(es_fetch['value'])
+                    else:
+                        data_status = DataSourceStatus()
+                        data_status.error_msg = f"Candle fetch {es_fetch['error']}"
+                    if es_fetch['stale']:
+                        st.warning(f"⏳ Candle fetch {es_fetch['error'] or 'failed'} — "
+                                   f"using cached data from {es_fetch['as_of'].strftime('%I:%M:%S %p')}")
+                    st.session_state['last_fetch_status'] = data_status
+                    st.session_state['last_fetch_candles'] = data_status.candles
+                    if data_status.candles is not None and not es_fetch['stale']:
+                        try:
+                            store_candles(data_status.candles)
+                        except Exception as e:
+                            st.caption(f"Candle store not updated: {str(e)[:60]}")
                 else:
                     data_status = st.session_state.get('last_fetch_status', DataSourceStatus())
                 
@@ -1630,6 +5701,29 @@ def main():
                         st.caption(data_status.error_msg)
                     st.info("Falling back to manual input below.")
                 
+                # Data quality report (validated before detection)
+                quality = getattr(data_status, 'quality', None)
+                if quality:
+                    q_issues = quality['issues']
+                    q_label = "✅ Clean" if quality['ok'] else "⚠️ Issues found"
+                    with st.expander(f"🩺 Data Quality — {q_label}", expanded=False):
+                        st.caption(f"{quality['rows']} bars checked • "
+                                   f"{'repaired' if quality['repaired'] else 'report only'}"
+                                   f"{' • ' + str(quality['dst_shifted']) + ' DST suspects shifted 1h' if quality.get('dst_shifted') else ''}")
+                        for q_name, q_label_text in [('missing_slots', 'Missing slots'),
+                                                     ('duplicates', 'Duplicate timestamps'),
+                                                     ('misaligned', 'Off :00/:30 grid'),
+                                                     ('off_calendar', 'Inside closed hours'),
+                                                     ('dst_suspect', 'DST-shift suspects'),
+                                                     ('ohlc_invalid', 'Invalid OHLC'),
+                                                     ('spikes', 'Outlier spikes')]:
+                            if q_issues[q_name]:
+                                st.caption(f"• {q_label_text}: **{q_issues[q_name]}**")
+                        for gap in quality['gaps'][:5]:
+                            st.caption(f"↳ Gap {gap['start'].strftime('%a %I:%M %p')} → "
+                                       f"{gap['end'].strftime('%a %I:%M %p')} ({gap['slots']} bars)")
+                        st.caption(f"ℹ️ {quality['note']}")
+                
                 # If we got candle data, run auto-detection
                 if data_status.candles is not None and len(data_status.candles) > 0:
                     ny_candles = filter_ny_session(data_status.candles, prior_date)
@@ -1849,24 +5943,53 @@ def main():
         
         show_all_lines = st.checkbox("Show all projected lines", value=True)
         show_session_boxes = st.checkbox("Show session boxes", value=True)
+        
+        # VIX is refreshed in the background for all sessions, at the server's interval
+        vix_cache = get_vix_cache()
+        vix_cache.set_interval(vix_refresh_seconds())  # picks up an edited secrets.toml
+        st.caption(f"VIX refreshes every {vix_cache.interval:.0f}s for all viewers (vix_refresh_seconds)")
+        
+        # Sigma for the premium model: VIX or intraday realized vol from ES 1-min bars
+        vol_options = ["VIX"] + list(RV_ESTIMATORS.values())
+        default_vol_source = "VIX"
+        try:
+            default_vol_source = st.secrets.get("pricing_vol_source", default_vol_source)
+        except:
+            pass
+        pricing_vol_source = st.selectbox("Pricing vol", vol_options,
+                                          index=vol_options.index(default_vol_source) if default_vol_source in vol_options else 0,
+                                          help="Sigma for the premium model when no live IV smile is available")
+        
+        # Level alerts (live mode): proximity to any line, crosses of the key levels
+        alerts_on = st.toggle("🔔 Level alerts", value=True, help="Alert near projected lines and on key-level crosses")
+        alert_distance = st.number_input("Alert within (pts)", value=ALERT_PROXIMITY_POINTS, min_value=0.25,
+                                         step=0.25, format="%.2f")
+        
+        # Shared fetch stats (single-flight coalescing across sessions)
+        flight_metrics = get_single_flight().metrics()
+        flight_totals = flight_metrics['totals']
+        with st.expander(f"📡 Shared Fetches — {flight_totals['saved']} saved", expanded=False):
+            st.caption(f"{flight_totals['requests']} requests → {flight_totals['upstream']} upstream calls "
+                       f"• {flight_totals['in_flight']} in flight")
+            for source_name, counters in sorted(flight_metrics['sources'].items()):
+                st.caption(f"• {source_name}: {counters['requests']} req / {counters['upstream']} upstream "
+                           f"/ {counters['coalesced']} coalesced")
     
     # ============================================================
     # CALCULATIONS
     # ============================================================
     
-    # Override global rate if changed
-    global RATE_PER_CANDLE
-    RATE_PER_CANDLE = rate
-    
-    # Calculate 9 AM levels
+    # Calculate 9 AM levels at this session's rate (never via the module default other sessions share)
     next_day_dt = datetime.combine(next_date, time(9, 0))
-    levels = calculate_nine_am_levels(bounces, rejections, highest_wick, lowest_wick, next_day_dt)
+    levels = calculate_nine_am_levels(bounces, rejections, highest_wick, lowest_wick, next_day_dt, rate)
     
     # ============================================================
     # LIVE PRICE TRACKING
     # ============================================================
     live_price_data = None
+    live_tick = None
     es_offset_val = st.session_state.get('_es_offset', 0.0)
+    auto_fetches = {}
     
     if live_mode:
         # Auto-refresh every 30 seconds
@@ -1879,78 +6002,85 @@ def main():
             if st.button("🔄 Refresh Price", key="manual_refresh"):
                 st.rerun()
         
-        live_price_data = fetch_live_price()
+        # The rerun's one automatic batch: the price, plus the option chain
+        # planned on the last tick while quotes are auto-pulled
+        auto_calls = {'live': (('live_price',), fetch_live_price, ())}
+        chain_plan = st.session_state.get('_chain_plan')
+        if (chain_plan and chain_plan['expiry'] == str(next_date) and
+                chain_auto_fetch_window(ExpiryClock.now_ct(), ExpiryClock(next_date))):
+            tt_token = st.session_state.get('_tt_session_token', '')
+            auto_calls['chain'] = (('option_chain', chain_plan['symbols']), fetch_option_chain,
+                                   (chain_plan['symbols'], tt_token))
+        auto_fetches = run_fetches(auto_calls, budget_seconds)
+        live_fetch = auto_fetches['live']
+        live_price_data = live_fetch['value'] or {'ok': False, 'error': live_fetch['error'], 'price': 0}
         
         if live_price_data['ok']:
             es_price = live_price_data['price']
-            spx_price = es_price - es_offset_val
             price_time = live_price_data['time']
             time_str = price_time.strftime('%I:%M:%S %p') if hasattr(price_time, 'strftime') else str(price_time)
             
-            # Get level values
-            hw_val_live = levels['key_levels']['highest_wick_ascending']['value_at_9am'] if levels['key_levels']['highest_wick_ascending'] else None
-            hb_val_live = levels['key_levels']['highest_bounce_ascending']['value_at_9am'] if levels['key_levels']['highest_bounce_ascending'] else None
-            lr_val_live = levels['key_levels']['lowest_rejection_descending']['value_at_9am'] if levels['key_levels']['lowest_rejection_descending'] else None
-            lw_val_live = levels['key_levels']['lowest_wick_descending']['value_at_9am'] if levels['key_levels']['lowest_wick_descending'] else None
-            
-            # Determine live position
-            all_levels = {}
-            if hw_val_live: all_levels['HW Asc'] = hw_val_live
-            if hb_val_live: all_levels['HB Asc'] = hb_val_live
-            if lr_val_live: all_levels['LR Desc'] = lr_val_live
-            if lw_val_live: all_levels['LW Desc'] = lw_val_live
-            
-            # Live signal
-            live_signal = ""
-            live_color = "#ffd740"
-            if hw_val_live and hb_val_live and lr_val_live and lw_val_live:
-                asc_h = max(hw_val_live, hb_val_live)
-                asc_l = min(hw_val_live, hb_val_live)
-                desc_h = max(lr_val_live, lw_val_live)
-                desc_l = min(lr_val_live, lw_val_live)
-                
-                if spx_price > asc_h:
-                    live_signal = "BULLISH TREND DAY"
-                    live_color = "#00e676"
-                elif spx_price >= asc_l:
-                    live_signal = "BETWEEN ASCENDING"
-                    live_color = "#ffd740"
-                elif spx_price > desc_h:
-                    live_signal = "BEARISH BIAS"
-                    live_color = "#ff5252"
-                elif spx_price >= desc_l:
-                    live_signal = "BETWEEN DESCENDING"
-                    live_color = "#ffd740"
-                else:
-                    live_signal = "BEARISH TREND DAY"
-                    live_color = "#ff1744"
+            # Per-session pipeline: ladder position carried across ticks
+            pipeline_key = (str(next_date), tuple(sorted(key_level_values(levels).items())),
+                            tuple(l['value'] for l in build_ny_ladder(levels)), es_offset_val)
+            pipeline = st.session_state.get('_live_pipeline')
+            if pipeline is None or st.session_state.get('_live_pipeline_key') != pipeline_key:
+                pipeline = LivePipeline(levels, next_date, es_offset_val)
+                st.session_state['_live_pipeline'] = pipeline
+                st.session_state['_live_pipeline_key'] = pipeline_key
+            tracker = pipeline.tracker
+            
+            # Level alerts: re-armed when the ladder or distance changes, fed fresh ticks only
+            pipeline.alert_engine = None
+            if alerts_on:
+                alert_engine = st.session_state.get('_alert_engine')
+                if alert_engine is None:
+                    alert_config = {}
+                    try:
+                        alert_config = dict(st.secrets.get("alerts", {}))
+                    except:
+                        pass
+                    alert_engine = AlertEngine(build_alert_sinks(alert_config))
+                    st.session_state['_alert_engine'] = alert_engine
+                alert_key = (pipeline_key, alert_distance)
+                if st.session_state.get('_alert_key') != alert_key:
+                    alert_engine.arm(ladder_alerts(pipeline.ny_ladder, pipeline.key_values, alert_distance))
+                    st.session_state['_alert_key'] = alert_key
+                pipeline.alert_engine = alert_engine
+            
+            # 6 PM lock lives in the session (lock / unlock buttons on the Asian tab)
+            if st.session_state.get('asian_6pm_locked', False):
+                if pipeline.locked_price is None:
+                    pipeline.lock(st.session_state.get('_asian_locked_price', es_price))
+            elif pipeline.locked_price is not None:
+                pipeline.unlock()
             
-            # Distances
-            distances = []
-            for name, val in sorted(all_levels.items(), key=lambda x: x[1], reverse=True):
-                diff = spx_price - val
-                arrow = "▲" if diff > 0 else "▼"
-                distances.append(f"{name}: {val:.2f} ({arrow}{abs(diff):.2f})")
+            live_tick = pipeline.tick(es_price, price_time, stale=live_fetch['stale'])
+            if alerts_on:
+                for sink in alert_engine.sinks:
+                    if isinstance(sink, DesktopAlertSink):
+                        for event in sink.drain():
+                            st.toast(f"🔔 {event['text']}")
             
             # Display live banner
             offset_note = f" (offset {es_offset_val:+.1f})" if es_offset_val != 0 else ""
-            st.markdown(f"""
-            <div style="background: linear-gradient(135deg, #0d1117 0%, #131a2e 100%); border: 2px solid {live_color}; 
-                        border-radius: 12px; padding: 15px; margin: 10px 0; text-align: center;">
-                <div style="font-family: 'Rajdhani'; color: #8892b0; font-size: 0.85rem;">
-                    🔴 LIVE • ES=F @ {time_str}{offset_note}
-                </div>
-                <div style="font-family: 'Orbitron'; font-size: 2.2rem; color: {live_color}; margin: 5px 0;">
-                    {spx_price:.2f}
-                </div>
-                <div style="font-family: 'Orbitron'; font-size: 1rem; color: {live_color};">
-                    {live_signal}
-                </div>
-                <div style="font-family: 'JetBrains Mono'; font-size: 0.8rem; color: #8892b0; margin-top: 8px;">
-                    {'  •  '.join(distances)}
-                </div>
-            </div>
-            """, unsafe_allow_html=True)
+            stale_note = (f" • ⏳ STALE ({live_fetch['error']}, as of {live_fetch['as_of'].strftime('%I:%M:%S %p')})"
+                          if live_fetch['stale'] else "")
+            st.markdown(live_banner_html(live_tick, f"🔴 LIVE • ES=F @ {time_str}{offset_note}{stale_note}"),
+                        unsafe_allow_html=True)
+            
+            # Line-cross / zone event log (newest first)
+            if tracker.events:
+                recent = list(tracker.events)[::-1]
+                last = recent[0]
+                last_time = last['time'].strftime('%I:%M %p') if hasattr(last['time'], 'strftime') else str(last['time'])
+                with st.expander(f"📜 Live Events — {last_time} {last['text']}", expanded=False):
+                    st.dataframe(pd.DataFrame([{
+                        'Time': e['time'].strftime('%I:%M:%S %p') if hasattr(e['time'], 'strftime') else str(e['time']),
+                        'Event': e['type'].replace('_', ' '),
+                        'Detail': e['text'],
+                        'SPX': round(e['price'], 2),
+                    } for e in recent]), hide_index=True, use_container_width=True)
         else:
             st.warning(f"Live price unavailable: {live_price_data.get('error', 'Unknown')}")
     
@@ -1958,11 +6088,13 @@ def main():
     # MAIN CONTENT: Tabs
     # ============================================================
     
-    tab1, tab2, tab3, tab4 = st.tabs([
+    tab1, tab2, tab3, tab4, tab5, tab6 = st.tabs([
         "📈 STRUCTURAL MAP", 
         "🌙 ASIAN SESSION (Futures)", 
         "☀️ NY SESSION (Options)",
-        "📋 TRADE LOG"
+        "📋 TRADE LOG",
+        "🧪 BACKTEST LAB",
+        "⏳ TIME TRAVEL"
     ])
     
     # ============================================================
@@ -2087,222 +6219,10 @@ def main():
             tick_vals.append(time_to_idx[nine_am_dt])
             tick_texts.append("9AM ▶")
         
-        fig = go.Figure()
-        
-        # ══════════════════════════════════════════════════════════════
-        # HORIZONTAL LADDER CHART — "Thermometer" style
-        # Price levels as horizontal zones, current price as marker
-        # ══════════════════════════════════════════════════════════════
-        
-        # Collect all line levels at 9 AM into a sorted ladder
-        ladder_lines = []
-        for li, asc_line in enumerate(levels['ascending']):
-            is_wick = asc_line['type'] == 'highest_wick'
-            ladder_lines.append({
-                'value': asc_line['value_at_9am'],
-                'label': 'HW' if is_wick else f'B{li+1}',
-                'full': f"{'Highest Wick' if is_wick else f'Bounce {li+1}'}",
-                'direction': 'ascending',
-                'color': '#ff1744' if is_wick else '#ff5252',
-                'is_key': is_wick,
-                'anchor': asc_line['anchor_price'],
-            })
-        for li, desc_line in enumerate(levels['descending']):
-            is_wick = desc_line['type'] == 'lowest_wick'
-            ladder_lines.append({
-                'value': desc_line['value_at_9am'],
-                'label': 'LW' if is_wick else f'R{li+1}',
-                'full': f"{'Lowest Wick' if is_wick else f'Rejection {li+1}'}",
-                'direction': 'descending',
-                'color': '#00e676' if is_wick else '#69f0ae',
-                'is_key': is_wick,
-                'anchor': desc_line['anchor_price'],
-            })
-        ladder_lines.sort(key=lambda x: x['value'])
-        
-        if ladder_lines:
-            # Price range for chart
-            all_vals = [l['value'] for l in ladder_lines]
-            price_min = min(all_vals) - 3
-            price_max = max(all_vals) + 3
-            price_range = price_max - price_min
-            
-            # Get live price if available
-            live_spx = None
-            if live_mode and live_price_data and live_price_data.get('ok'):
-                live_spx = live_price_data['price'] - es_offset_val
-                price_min = min(price_min, live_spx - 3)
-                price_max = max(price_max, live_spx + 3)
-                price_range = price_max - price_min
-            
-            # ── Zone fills between adjacent lines ──
-            for i in range(len(ladder_lines) - 1):
-                lower = ladder_lines[i]
-                upper = ladder_lines[i + 1]
-                gap = upper['value'] - lower['value']
-                
-                # Color based on what's above vs below
-                if upper['direction'] == 'ascending' and lower['direction'] == 'descending':
-                    # Ascending above + descending below = compression zone (gold)
-                    zone_color = 'rgba(255,215,64,0.04)'
-                elif upper['direction'] == 'descending':
-                    # Descending above = bearish zone
-                    zone_color = 'rgba(255,23,68,0.03)'
-                elif lower['direction'] == 'ascending':
-                    # Ascending below = bullish zone
-                    zone_color = 'rgba(0,230,118,0.03)'
-                else:
-                    zone_color = 'rgba(255,255,255,0.01)'
-                
-                fig.add_shape(type="rect",
-                    x0=-0.5, x1=10.5,
-                    y0=lower['value'], y1=upper['value'],
-                    fillcolor=zone_color,
-                    line=dict(width=0),
-                    layer="below",
-                )
-            
-            # ── Horizontal level lines with glow ──
-            for line in ladder_lines:
-                # Glow layer
-                fig.add_shape(type="line",
-                    x0=-0.5, x1=10.5,
-                    y0=line['value'], y1=line['value'],
-                    line=dict(color=line['color'], width=8 if line['is_key'] else 4),
-                    opacity=0.06,
-                    layer="below",
-                )
-                
-                # Main line
-                line_width = 3 if line['is_key'] else 1.5
-                dash = 'solid' if line['is_key'] else 'dot'
-                fig.add_shape(type="line",
-                    x0=-0.5, x1=10.5,
-                    y0=line['value'], y1=line['value'],
-                    line=dict(color=line['color'], width=line_width, dash=dash),
-                    opacity=0.85 if line['is_key'] else 0.45,
-                )
-                
-                # Right-side label
-                icon = '▲' if line['direction'] == 'ascending' else '▼'
-                font_size = 12 if line['is_key'] else 10
-                fig.add_annotation(
-                    x=10.5, y=line['value'],
-                    text=f"<b>{icon} {line['label']}</b> {line['value']:.2f}",
-                    showarrow=False,
-                    xanchor="left", xshift=8,
-                    font=dict(size=font_size, color=line['color'], family='JetBrains Mono'),
-                    bgcolor='rgba(6,9,16,0.85)',
-                    bordercolor=line['color'],
-                    borderwidth=1 if line['is_key'] else 0,
-                    borderpad=4,
-                )
-                
-                # Left-side direction indicator  
-                if line['is_key']:
-                    fig.add_annotation(
-                        x=-0.5, y=line['value'],
-                        text=f"<b>{line['full']}</b>",
-                        showarrow=False,
-                        xanchor="right", xshift=-8,
-                        font=dict(size=9, color=line['color'], family='Rajdhani'),
-                        opacity=0.7,
-                    )
-            
-            # ── Live price marker — glowing horizontal band ──
-            if live_spx:
-                # Wide glow band
-                fig.add_shape(type="rect",
-                    x0=-0.5, x1=10.5,
-                    y0=live_spx - 0.5, y1=live_spx + 0.5,
-                    fillcolor='rgba(0,212,255,0.08)',
-                    line=dict(width=0),
-                )
-                # Bright line
-                fig.add_shape(type="line",
-                    x0=-0.5, x1=10.5,
-                    y0=live_spx, y1=live_spx,
-                    line=dict(color='#00d4ff', width=2.5, dash='solid'),
-                )
-                # Diamond marker
-                fig.add_trace(go.Scatter(
-                    x=[5], y=[live_spx],
-                    mode='markers+text',
-                    marker=dict(symbol='diamond', size=18, color='#00d4ff',
-                        line=dict(width=2, color='rgba(0,212,255,0.4)')),
-                    text=[f"  ◉ LIVE  {live_spx:.2f}"],
-                    textposition='middle right',
-                    textfont=dict(color='#00d4ff', size=13, family='Orbitron'),
-                    showlegend=False,
-                    hovertemplate=f"<b>LIVE SPX</b><br>{live_spx:.2f}<extra></extra>",
-                ))
-                
-                # Show distance to nearest lines above/below
-                above_lines = [l for l in ladder_lines if l['value'] > live_spx]
-                below_lines = [l for l in ladder_lines if l['value'] <= live_spx]
-                
-                if above_lines:
-                    nearest_above = min(above_lines, key=lambda x: x['value'])
-                    dist_up = nearest_above['value'] - live_spx
-                    fig.add_annotation(
-                        x=5, y=(live_spx + nearest_above['value']) / 2,
-                        text=f"<b>{dist_up:.1f}pt</b>",
-                        showarrow=False,
-                        font=dict(size=10, color='rgba(255,255,255,0.3)', family='JetBrains Mono'),
-                    )
-                
-                if below_lines:
-                    nearest_below = max(below_lines, key=lambda x: x['value'])
-                    dist_down = live_spx - nearest_below['value']
-                    fig.add_annotation(
-                        x=5, y=(live_spx + nearest_below['value']) / 2,
-                        text=f"<b>{dist_down:.1f}pt</b>",
-                        showarrow=False,
-                        font=dict(size=10, color='rgba(255,255,255,0.3)', family='JetBrains Mono'),
-                    )
-            
-        # ── Chart layout — clean thermometer style ──
-        fig.update_layout(
-            template='plotly_dark',
-            paper_bgcolor='rgba(5,8,16,1)',
-            plot_bgcolor='rgba(8,13,22,1)',
-            height=700,
-            margin=dict(l=120, r=200, t=30, b=30),
-            xaxis=dict(
-                showgrid=False, showticklabels=False, showline=False,
-                zeroline=False, range=[-1, 11.5],
-                fixedrange=True,
-            ),
-            yaxis=dict(
-                gridcolor='rgba(30,45,74,0.08)',
-                showgrid=True, gridwidth=1,
-                zeroline=False,
-                tickformat='.2f', side='right',
-                range=[price_min, price_max] if ladder_lines else None,
-                tickfont=dict(size=11, family='JetBrains Mono', color='#3a4a6a'),
-                showline=True, linecolor='rgba(30,45,74,0.2)', linewidth=1,
-                dtick=2,
-            ),
-            showlegend=False,
-            font=dict(family='JetBrains Mono', color='#8892b0'),
-            hovermode='closest',
-            hoverlabel=dict(
-                bgcolor='rgba(6,9,16,0.95)',
-                bordercolor='rgba(0,212,255,0.2)',
-                font=dict(family='JetBrains Mono', size=11, color='#ccd6f6'),
-            ),
-            dragmode='pan',
-        )
-        
-        # Chart config
-        chart_config = {
-            'displayModeBar': True,
-            'modeBarButtonsToRemove': ['autoScale2d', 'lasso2d', 'select2d', 'zoom2d', 'zoomIn2d', 'zoomOut2d'],
-            'displaylogo': False,
-            'scrollZoom': True,
-        }
+        live_spx = live_tick['spx_price'] if live_tick is not None else None
+        fig = structural_map_figure(levels, live_spx)
         
-        st.plotly_chart(fig, use_container_width=True, config=chart_config)
+        st.plotly_chart(fig, use_container_width=True, config=STRUCTURAL_MAP_CONFIG)
         
         # ============================================================
         # 9 AM LINE LADDER (all lines sorted by value)
@@ -2389,8 +6309,6 @@ def main():
         # Lines are stored as SPX-adjusted if offset was applied.
         # For ES futures trading, add the offset back.
         # ============================================================
-        decision_time_6pm = datetime.combine(overnight_date_tab2, time(18, 0))
-        exit_time_7pm = datetime.combine(overnight_date_tab2, time(19, 0))
         
         # Get the offset — try widget key first, then session state
         es_offset_asian = st.session_state.get('global_es_offset', st.session_state.get('_es_offset', 0.0))
@@ -2406,46 +6324,7 @@ def main():
         """, unsafe_allow_html=True)
         
         # Build the full line ladder at 6 PM (in ES terms)
-        line_ladder_6pm = []
-        
-        # All ascending lines (bounces + highest wick)
-        for line in levels['ascending']:
-            val_6pm = calculate_line_value(line['anchor_price'], line['anchor_time'], decision_time_6pm, 'ascending')
-            val_7pm = calculate_line_value(line['anchor_price'], line['anchor_time'], exit_time_7pm, 'ascending')
-            # Add offset back: SPX → ES
-            val_6pm += es_offset_asian
-            val_7pm += es_offset_asian
-            line_ladder_6pm.append({
-                'name': line['source'].split(' @ ')[0] if ' @ ' in line['source'] else line['source'],
-                'short': f"{'HW' if line['type'] == 'highest_wick' else 'B'} ↗",
-                'value_6pm': val_6pm,
-                'value_7pm': val_7pm,
-                'direction': 'ascending',
-                'anchor': line['anchor_price'] + es_offset_asian,
-                'color': '#ff1744' if line['type'] == 'highest_wick' else '#ff5252',
-                'is_key': line['type'] == 'highest_wick',
-            })
-        
-        # All descending lines (rejections + lowest wick)
-        for line in levels['descending']:
-            val_6pm = calculate_line_value(line['anchor_price'], line['anchor_time'], decision_time_6pm, 'descending')
-            val_7pm = calculate_line_value(line['anchor_price'], line['anchor_time'], exit_time_7pm, 'descending')
-            # Add offset back: SPX → ES
-            val_6pm += es_offset_asian
-            val_7pm += es_offset_asian
-            line_ladder_6pm.append({
-                'name': line['source'].split(' @ ')[0] if ' @ ' in line['source'] else line['source'],
-                'short': f"{'LW' if line['type'] == 'lowest_wick' else 'R'} ↘",
-                'value_6pm': val_6pm,
-                'value_7pm': val_7pm,
-                'direction': 'descending',
-                'anchor': line['anchor_price'] + es_offset_asian,
-                'color': '#00e676' if line['type'] == 'lowest_wick' else '#69f0ae',
-                'is_key': line['type'] == 'lowest_wick',
-            })
-        
-        # Sort by 6 PM value, highest to lowest
-        line_ladder_6pm.sort(key=lambda x: x['value_6pm'], reverse=True)
+        line_ladder_6pm = build_asian_ladder(levels, overnight_date_tab2, es_offset_asian)
         
         # ============================================================
         # 6 PM LINE LADDER DISPLAY
@@ -2478,13 +6357,11 @@ def main():
         
         # Auto-fill from live price if available
         asian_default = 6870.0
-        if live_mode and live_price_data and live_price_data.get('ok'):
-            # Only auto-update if NOT locked
-            if not st.session_state.get('asian_6pm_locked', False):
-                asian_default = live_price_data['price']  # ES price, no SPX offset for futures
+        if live_tick is not None:
+            # Follows the live ES price (no SPX offset for futures) until locked
+            asian_default = live_tick['asian_price']
+            if not live_tick['asian_locked']:
                 st.session_state['_asian_live_price'] = asian_default
-            else:
-                asian_default = st.session_state.get('_asian_locked_price', asian_default)
         
         col_price, col_lock = st.columns([3, 1])
         
@@ -2518,14 +6395,10 @@ def main():
                                     help="Maximum points expected in the 6-7 PM window")
         
         if line_ladder_6pm:
-            # Find lines immediately above and below price
-            lines_above = [l for l in line_ladder_6pm if l['value_6pm'] > asian_price]
-            lines_below = [l for l in line_ladder_6pm if l['value_6pm'] <= asian_price]
-            
-            nearest_above = lines_above[-1] if lines_above else None  # closest above
-            nearest_below = lines_below[0] if lines_below else None   # closest below
-            second_above = lines_above[-2] if len(lines_above) >= 2 else None
-            second_below = lines_below[1] if len(lines_below) >= 2 else None
+            # Lines immediately above/below price and the setups they generate
+            asian_plan = asian_trade_setups(line_ladder_6pm, asian_price, max_move)
+            nearest_above = asian_plan['nearest_above']
+            nearest_below = asian_plan['nearest_below']
             
             # Position description
             if nearest_above and nearest_below:
@@ -2543,10 +6416,6 @@ def main():
             
             st.markdown(position_text)
             
-            # Pre-calculate distances for trade setups
-            dist_above = (nearest_above['value_6pm'] - asian_price) if nearest_above else 999
-            dist_below = (asian_price - nearest_below['value_6pm']) if nearest_below else 999
-            
             st.markdown('<div class="section-divider"></div>', unsafe_allow_html=True)
             
             # ============================================================
@@ -2555,108 +6424,7 @@ def main():
             st.markdown("### 📋 Trade Setups (6:00 - 7:00 PM CT)")
             st.caption("Flat by 7:00 PM before Nikkei opens. Max hold: 1 hour.")
             
-            trades = []
-            
-            # SETUP 1: SHORT — if there's resistance above and room to drop
-            if nearest_above and nearest_below:
-                # Short setup: price rallies to nearest line above, reject back down
-                short_entry = nearest_above['value_6pm']
-                short_stop = short_entry + 2.0
-                short_t1 = asian_price  # back to current price
-                short_t2 = nearest_below['value_6pm']  # to the line below
-                short_exit_7pm = nearest_above['value_7pm']  # line moves by 7PM
-                
-                # Cap target at max_move
-                if short_entry - short_t2 > max_move:
-                    short_t2 = short_entry - max_move
-                
-                trades.append({
-                    'direction': 'SHORT',
-                    'bias': 'Rejection at resistance',
-                    'trigger': f"Price rallies to {short_entry:.2f} ({nearest_above['short']})",
-                    'entry': short_entry,
-                    'stop': short_stop,
-                    'target_1': short_t1,
-                    'target_2': short_t2,
-                    'risk': short_stop - short_entry,
-                    'reward_1': short_entry - short_t1,
-                    'reward_2': short_entry - short_t2,
-                    'color': '#ff5252',
-                    'icon': '🔻',
-                })
-                
-                # Long setup: price drops to nearest line below, bounce back up
-                long_entry = nearest_below['value_6pm']
-                long_stop = long_entry - 2.0
-                long_t1 = asian_price  # back to current price
-                long_t2 = nearest_above['value_6pm']  # to the line above
-                
-                # Cap target at max_move
-                if long_t2 - long_entry > max_move:
-                    long_t2 = long_entry + max_move
-                
-                trades.append({
-                    'direction': 'LONG',
-                    'bias': 'Bounce at support',
-                    'trigger': f"Price drops to {long_entry:.2f} ({nearest_below['short']})",
-                    'entry': long_entry,
-                    'stop': long_stop,
-                    'target_1': long_t1,
-                    'target_2': long_t2,
-                    'risk': long_entry - long_stop,
-                    'reward_1': long_t1 - long_entry,
-                    'reward_2': long_t2 - long_entry,
-                    'color': '#00e676',
-                    'icon': '🔺',
-                })
-            
-            # SETUP 2: Breakout — if price is already at or past a line
-            if nearest_above and dist_above <= 1.0:
-                # Price is right at resistance — could break through
-                break_entry = nearest_above['value_6pm'] + 0.5
-                break_stop = nearest_above['value_6pm'] - 1.5
-                break_t1 = break_entry + 2.5
-                break_t2 = break_entry + max_move
-                if second_above:
-                    break_t2 = min(break_t2, second_above['value_6pm'])
-                
-                trades.append({
-                    'direction': 'LONG BREAKOUT',
-                    'bias': f"Break above {nearest_above['short']}",
-                    'trigger': f"Price breaks above {nearest_above['value_6pm']:.2f} with momentum",
-                    'entry': break_entry,
-                    'stop': break_stop,
-                    'target_1': break_t1,
-                    'target_2': break_t2,
-                    'risk': break_entry - break_stop,
-                    'reward_1': break_t1 - break_entry,
-                    'reward_2': break_t2 - break_entry,
-                    'color': '#ffd740',
-                    'icon': '⚡',
-                })
-            
-            if nearest_below and dist_below <= 1.0:
-                break_entry = nearest_below['value_6pm'] - 0.5
-                break_stop = nearest_below['value_6pm'] + 1.5
-                break_t1 = break_entry - 2.5
-                break_t2 = break_entry - max_move
-                if second_below:
-                    break_t2 = max(break_t2, second_below['value_6pm'])
-                
-                trades.append({
-                    'direction': 'SHORT BREAKDOWN',
-                    'bias': f"Break below {nearest_below['short']}",
-                    'trigger': f"Price breaks below {nearest_below['value_6pm']:.2f} with momentum",
-                    'entry': break_entry,
-                    'stop': break_stop,
-                    'target_1': break_t1,
-                    'target_2': break_t2,
-                    'risk': break_stop - break_entry,
-                    'reward_1': break_entry - break_t1,
-                    'reward_2': break_entry - break_t2,
-                    'color': '#ffd740',
-                    'icon': '⚡',
-                })
+            trades = asian_plan['setups']
             
             # ============================================================
             # DISPLAY TRADE CARDS
@@ -2739,8 +6507,8 @@ def main():
         
         # Auto-fill from live price if available
         default_price = 6865.0
-        if live_mode and live_price_data and live_price_data.get('ok'):
-            default_price = live_price_data['price'] - es_offset_val
+        if live_tick is not None:
+            default_price = live_tick['spx_price']
         
         current_price = st.number_input("Current SPX Price at 9:00 AM CT", 
                                          value=default_price, step=0.5, format="%.2f",
@@ -2750,114 +6518,20 @@ def main():
         # ============================================================
         # BUILD 9 AM LINE LADDER (reuse from structural map)
         # ============================================================
-        ny_ladder = []
-        for line in levels['ascending']:
-            ny_ladder.append({
-                'name': line['source'].split(' @ ')[0] if ' @ ' in line['source'] else line['source'],
-                'short': f"{'HW' if line['type'] == 'highest_wick' else 'B'} ↗",
-                'value': line['value_at_9am'],
-                'direction': 'ascending',
-                'color': '#ff1744' if line['type'] == 'highest_wick' else '#ff5252',
-            })
-        for line in levels['descending']:
-            ny_ladder.append({
-                'name': line['source'].split(' @ ')[0] if ' @ ' in line['source'] else line['source'],
-                'short': f"{'LW' if line['type'] == 'lowest_wick' else 'R'} ↘",
-                'value': line['value_at_9am'],
-                'direction': 'descending',
-                'color': '#00e676' if line['type'] == 'lowest_wick' else '#69f0ae',
-            })
-        ny_ladder.sort(key=lambda x: x['value'], reverse=True)
-        
-        # Find nearest lines above and below current price
-        lines_above = [l for l in ny_ladder if l['value'] > current_price]
-        lines_below = [l for l in ny_ladder if l['value'] <= current_price]
-        
-        nearest_above = lines_above[-1] if lines_above else None
-        nearest_below = lines_below[0] if lines_below else None
+        ny_ladder = build_ny_ladder(levels)
         
         # ============================================================
         # POSITION & SIGNAL
         # ============================================================
-        # Count ascending vs descending lines above/below
-        asc_above = sum(1 for l in lines_above if l['direction'] == 'ascending')
-        desc_below = sum(1 for l in lines_below if l['direction'] == 'descending')
-        
-        # Determine signal based on position
-        signal = "NEUTRAL"
-        signal_detail = ""
-        signal_class = "neutral"
-        trade_direction = None  # 'PUT' or 'CALL'
-        stop_line = None
-        target_lines = []
-        
-        if nearest_above and nearest_below:
-            dist_above = nearest_above['value'] - current_price
-            dist_below = current_price - nearest_below['value']
-            
-            # Check if price is below all ascending lines
-            all_asc_values = [l['value'] for l in ny_ladder if l['direction'] == 'ascending']
-            all_desc_values = [l['value'] for l in ny_ladder if l['direction'] == 'descending']
-            
-            if all_asc_values and current_price < min(all_asc_values):
-                # Below ALL ascending lines = bearish
-                signal = "BEARISH — BUY PUTS"
-                signal_class = "bear"
-                trade_direction = "PUT"
-                stop_line = nearest_above  # line above = invalidation
-                target_lines = [l for l in lines_below if l['direction'] == 'descending'][:2]
-                signal_detail = f"Price {current_price:.2f} is BELOW all ascending lines. Buyers trapped above. Stop: {stop_line['value']:.2f} ({stop_line['short']})"
-                
-            elif all_desc_values and current_price > max(all_desc_values) and all_asc_values and current_price > max(all_asc_values):
-                # Above ALL lines = strong bullish
-                signal = "BULLISH TREND — BUY CALLS"
-                signal_class = "bull"
-                trade_direction = "CALL"
-                stop_line = nearest_below
-                target_lines = []  # no ceiling, use fixed targets
-                signal_detail = f"Price {current_price:.2f} is ABOVE all lines. Strong trend day. Stop: {stop_line['value']:.2f} ({stop_line['short']})"
-                
-            elif all_desc_values and current_price < min(all_desc_values):
-                # Below ALL lines = strong bearish
-                signal = "BEARISH TREND — BUY PUTS"
-                signal_class = "bear"
-                trade_direction = "PUT"
-                stop_line = nearest_above
-                target_lines = []
-                signal_detail = f"Price {current_price:.2f} is BELOW all lines including descending. Stop: {stop_line['value']:.2f} ({stop_line['short']})"
-                
-            elif all_asc_values and current_price > max(all_asc_values):
-                # Above all ascending = bullish
-                signal = "BULLISH — BUY CALLS"
-                signal_class = "bull"
-                trade_direction = "CALL"
-                stop_line = nearest_below
-                target_lines = [l for l in lines_above if l['direction'] == 'ascending'][:2]
-                signal_detail = f"Price {current_price:.2f} is ABOVE all ascending lines. Stop: {stop_line['value']:.2f} ({stop_line['short']})"
-                
-            elif nearest_above['direction'] == 'ascending' and nearest_below['direction'] == 'descending':
-                # Between ascending above and descending below — choppy, wait
-                signal = "BETWEEN ASC ↗ & DESC ↘ — WAIT"
-                signal_class = "neutral"
-                signal_detail = f"Price {current_price:.2f} between {nearest_above['short']} ({nearest_above['value']:.2f}) and {nearest_below['short']} ({nearest_below['value']:.2f}). No clear bias."
-                
-            elif nearest_above['direction'] == 'descending':
-                # Descending line above = resistance, bearish lean
-                signal = "BEARISH LEAN — BUY PUTS"
-                signal_class = "bear"
-                trade_direction = "PUT"
-                stop_line = nearest_above
-                target_lines = [l for l in lines_below][:2]
-                signal_detail = f"Descending resistance at {nearest_above['value']:.2f} above. Stop: {stop_line['value']:.2f}"
-                
-            elif nearest_below['direction'] == 'ascending':
-                # Ascending line below = support, bullish lean
-                signal = "BULLISH LEAN — BUY CALLS"
-                signal_class = "bull"
-                trade_direction = "CALL"
-                stop_line = nearest_below
-                target_lines = [l for l in lines_above][:2]
-                signal_detail = f"Ascending support at {nearest_below['value']:.2f} below. Stop: {stop_line['value']:.2f}"
+        ny_signal = classify_signal(ny_ladder, current_price)
+        signal = ny_signal['signal']
+        signal_detail = ny_signal['signal_detail']
+        signal_class = ny_signal['signal_class']
+        trade_direction = ny_signal['trade_direction']  # 'PUT' or 'CALL'
+        stop_line = ny_signal['stop_line']
+        target_lines = ny_signal['target_lines']
+        nearest_above = ny_signal['nearest_above']
+        nearest_below = ny_signal['nearest_below']
         
         # Signal display
         sig_color = '#00e676' if signal_class == 'bull' else '#ff1744' if signal_class == 'bear' else '#ffd740'
@@ -2928,16 +6602,6 @@ def main():
             st.markdown('<div class="section-divider"></div>', unsafe_allow_html=True)
             st.markdown("### 📋 0DTE Trade Setup")
             
-            # Calculate strike: 20 points OTM, rounded to nearest 5
-            if trade_direction == "PUT":
-                raw_strike = current_price - 20
-                strike = int(raw_strike // 5) * 5  # round down to nearest 5
-            else:
-                raw_strike = current_price + 20
-                strike = int((raw_strike + 4) // 5) * 5  # round up to nearest 5
-            
-            otm_distance = abs(strike - current_price)
-            
             # Stop and targets (SPX levels)
             stop_price = stop_line['value'] if stop_line else (current_price + 10 if trade_direction == "PUT" else current_price - 10)
             
@@ -2961,98 +6625,166 @@ def main():
             # PREMIUM: Auto-fetch + Scenario Projections
             # ============================================================
             
-            # Fetch VIX
-            try:
-                import yfinance as yf
-                vix_data = yf.Ticker("^VIX").history(period="1d")
-                current_vix = float(vix_data['Close'].iloc[-1]) if len(vix_data) > 0 else 18.0
-            except:
-                current_vix = 18.0
-            
-            import math
-            from datetime import time as dt_time
-            
-            # Determine current time context for hours-to-expiry
-            try:
-                import pytz
-                ct_tz = pytz.timezone('America/Chicago')
-                now_ct = datetime.now(ct_tz).replace(tzinfo=None)
-                market_close = datetime.combine(next_date, dt_time(15, 0))
-                hours_now = max(0.1, (market_close - now_ct).total_seconds() / 3600)
-            except:
-                hours_now = 6.5  # default to 8:30 AM
+            # VIX from the shared background cache (never blocks the rerun)
+            vix_state = get_vix_cache().get()
+            current_vix = vix_state['value'] if vix_state['value'] else VIX_DEFAULT
+            vol_label = "VIX"
+            vol_factor = ZERO_DTE_EXTRINSIC_FACTOR
             
-            # Hours at 9:05 AM entry
-            entry_dt = datetime.combine(next_date, dt_time(9, 5))
-            hours_at_entry = max(0.1, (market_close - entry_dt).total_seconds() / 3600)
+            # Or realized vol (annualized, in VIX points) when selected and warmed up
+            if pricing_vol_source != "VIX":
+                rv_state = get_realized_vol_cache().get()
+                rv_key = next(k for k, v in RV_ESTIMATORS.items() if v == pricing_vol_source)
+                rv = (rv_state['value'] or {}).get(rv_key)
+                if rv:
+                    current_vix = rv * 100
+                    vol_label = f"RV {rv_key.replace('_', '-')}"
+                    vol_factor = REALIZED_VOL_EXTRINSIC_FACTOR
+                    vix_state = rv_state
+                else:
+                    st.caption(f"⏳ {pricing_vol_source} warming up — pricing with VIX")
             
-            # Black-Scholes estimate (always available)
-            est_premium = estimate_option_premium(current_price, strike, current_vix, hours_at_entry, trade_direction)
+            # Trading time to expiry (early-close aware) now and at the 9:05 AM entry
+            expiry_clock = ExpiryClock(next_date)
+            now_ct = ExpiryClock.now_ct()
+            hours_now = max(0.1, expiry_clock.hours_left(now_ct))
+            entry_minute = NY_DECISION_CT.hour * 60 + 5
+            hours_at_entry = max(0.1, expiry_clock.hours_left(entry_minute))
+            # The smile and chain snapshot only apply to the expiry/side they were quoted for
+            chain_key = (str(next_date), trade_direction)
+            smile_entry = st.session_state.get('_live_smile') or {}
+            live_smile = smile_entry.get('smile') if smile_entry.get('key') == chain_key else None
             
-            # Auto-fetch live premium when LIVE MODE is on and market is open
-            live_premium = None
-            live_bid = None
-            live_ask = None
+            # Chain snapshot around the rule strike (IV smile, quotes, Greeks table) — fetched
+            # before the strike is chosen, so the optimizer can score its quoted strikes
+            fixed_strike = rule_strike(current_price, trade_direction)
+            chain_strikes = tuple(float(k) for k in range(fixed_strike - 60, fixed_strike + 65, STRIKE_INCREMENT))
             
-            auto_fetch = live_mode and hours_now < 7.0 and hours_now > 0.5  # between 8:00 AM and 2:30 PM
+            # Between 8:00 AM and 30 min before the close on expiry day
+            auto_fetch = live_mode and chain_auto_fetch_window(now_ct, expiry_clock)
             manual_fetch = False
-            
+            est_slot = None
             if not auto_fetch:
                 col_f1, col_f2 = st.columns([3, 1])
                 with col_f1:
-                    st.markdown(f"""
-                    <div style="font-family: JetBrains Mono; color: #8892b0; font-size: 0.85rem;">
-                        VIX: {current_vix:.1f} • Pre-Market Est: ${est_premium:.2f}/contract
-                    </div>""", unsafe_allow_html=True)
+                    est_slot = st.empty()  # filled once the traded strike is known
                 with col_f2:
                     manual_fetch = st.button("📊 Fetch Live Price", key="fetch_tt_chain")
             
+            quote_fetch, chain_quotes = None, {}
+            chain_symbols = {k: build_occ_symbol(next_date, trade_direction, k) for k in chain_strikes}
             if auto_fetch or manual_fetch:
+                # One login (if needed), then every strike quoted with that token
+                tt_token = st.session_state.get('_tt_session_token', '')
+                symbols = tuple(chain_symbols.values())
+                if manual_fetch:
+                    # A click gets its own budget, long enough for a fresh login
+                    quote_fetch = run_fetches({
+                        'chain': (('option_chain', symbols), fetch_option_chain, (symbols, tt_token)),
+                    }, user_budget_seconds)['chain']
+                else:
+                    # Auto-pull: the chain rode in this rerun's batch, planned on the last tick
+                    # (strikes it doesn't cover wait for the recentred plan on the next tick)
+                    quote_fetch = auto_fetches.get('chain') or {
+                        'value': None, 'stale': False, 'timed_out': False,
+                        'error': 'queued for the next refresh', 'as_of': None}
+                st.session_state['_chain_plan'] = {'expiry': str(next_date), 'symbols': symbols}
+                chain = quote_fetch['value'] or {}
+                chain_quotes = chain.get('quotes', {})
+                if not quote_fetch['stale'] and 'token' in chain:
+                    st.session_state['_tt_session_token'] = chain['token']
+                
+                # Keep the quoted strikes, then solve their IVs at once → per-strike smile
+                quoted = {k: chain_quotes[sym] for k, sym in chain_symbols.items()
+                          if chain_quotes.get(sym, {}).get('ok')}
+                if quoted:
+                    st.session_state['_live_chain'] = {'key': chain_key, 'hours': hours_now, 'quotes': quoted}
+                if len(quoted) >= 2:
+                    ks = sorted(quoted)
+                    ivs = implied_vol_batch([quoted[k]['mid'] for k in ks], current_price, ks,
+                                            hours_now, trade_direction)
+                    smile = build_smile(ks, ivs)
+                    if len(smile['strikes']) >= 2:
+                        st.session_state['_live_smile'] = {'key': chain_key, 'smile': smile}
+                        live_smile = smile
+            chain_entry = st.session_state.get('_live_chain') or {}
+            live_chain = chain_entry.get('quotes', {}) if chain_entry.get('key') == chain_key else {}
+            
+            # Path vol: ATM implied vol from the last live smile, else VIX
+            mc_vol = float(smile_vol(live_smile, current_price)) if live_smile else current_vix / 100.0
+            mc_workers = 0
+            try:
+                mc_workers = int(st.secrets.get("mc_workers", mc_workers))
+            except:
+                pass
+            mc = simulate_trade_outcomes(float(current_price), trade_direction, float(stop_price),
+                                         float(tp1), float(tp2), mc_vol,
+                                         int(expiry_clock.minutes_left(entry_minute)),
+                                         workers=mc_workers)
+            
+            # Strike: best expected R across the chain under the position budget,
+            # falling back to the fixed 20-pt OTM rule
+            col_s1, col_s2 = st.columns([1, 1])
+            with col_s1:
+                optimize_on = st.toggle("Optimize strike (expected R)", value=False, key="strike_optimize",
+                                        help="Trade the recommended strike instead of the 20-pt OTM rule strike")
+            with col_s2:
+                default_max_cost = 3000
                 try:
-                    import requests as req
-                    tt_token = st.session_state.get('_tt_session_token', '')
-                    
-                    if not tt_token:
-                        # Authenticate with Tastytrade
-                        tt_user = st.secrets.get("tastytrade", {}).get("username", "")
-                        tt_pass = st.secrets.get("tastytrade", {}).get("password", "")
-                        if tt_user and tt_pass:
-                            auth_resp = req.post("https://api.tastytrade.com/sessions",
-                                                  json={"login": tt_user, "password": tt_pass}, timeout=10)
-                            if auth_resp.status_code in (200, 201):
-                                tt_token = auth_resp.json().get("data", {}).get("session-token", "")
-                                st.session_state['_tt_session_token'] = tt_token
-                    
-                    if tt_token:
-                        headers = {"Authorization": tt_token, "Content-Type": "application/json"}
-                        
-                        # Build OCC symbol
-                        exp_date = next_date
-                        date_str = exp_date.strftime("%y%m%d")
-                        opt_char = "C" if trade_direction == "CALL" else "P"
-                        strike_str = f"{int(strike * 1000):08d}"
-                        occ_symbol = f"SPXW  {date_str}{opt_char}{strike_str}"
-                        
-                        quote_url = f"https://api.tastytrade.com/market-data/{occ_symbol}/quote"
-                        quote_resp = req.get(quote_url, headers=headers, timeout=10)
-                        
-                        if quote_resp.status_code == 200:
-                            q = quote_resp.json().get("data", {})
-                            live_bid = float(q.get("bid", 0))
-                            live_ask = float(q.get("ask", 0))
-                            mid = (live_bid + live_ask) / 2 if live_bid and live_ask else 0
-                            if mid > 0:
-                                live_premium = mid
-                                st.session_state['_live_premium'] = mid
-                                st.session_state['_live_premium_hours'] = hours_now
-                except Exception as e:
-                    if manual_fetch:
-                        st.warning(f"Could not fetch: {str(e)[:80]}")
-            
-            # Also check session state for previously fetched premium
-            if not live_premium and '_live_premium' in st.session_state:
-                live_premium = st.session_state['_live_premium']
-                hours_now = st.session_state.get('_live_premium_hours', hours_now)
+                    default_max_cost = int(st.secrets.get("max_position_cost", default_max_cost))
+                except:
+                    pass
+                max_position_cost = st.number_input("Max cost, 3 contracts ($)", min_value=100, max_value=50000,
+                                                    value=default_max_cost, step=100, key="max_position_cost")
+            # Quoted strikes enter at their live mid; with no chain, the model grid prices every strike
+            if live_chain:
+                candidate_strikes = np.array(sorted(live_chain), dtype=float)
+                candidate_entry = np.array([live_chain[k]['mid'] for k in candidate_strikes])
+            else:
+                candidate_strikes, candidate_entry = np.array(chain_strikes), None
+            if live_smile:
+                candidate_vol, candidate_factor = smile_vol(live_smile, candidate_strikes), 1.0
+            else:
+                candidate_vol, candidate_factor = current_vix / 100.0, vol_factor
+            strike_scores = optimize_strike(current_price, trade_direction, stop_price, tp1, tp2,
+                                            candidate_strikes, candidate_vol, hours_at_entry, mc,
+                                            max_cost=max_position_cost, extrinsic_factor=candidate_factor,
+                                            entry_premiums=candidate_entry)
+            if optimize_on and strike_scores['best'] is not None:
+                strike = int(strike_scores['best'])
+            else:
+                strike = fixed_strike
+            otm_distance = abs(strike - current_price)
+            
+            # Black-Scholes estimate (always available)
+            est_premium = estimate_option_premium(current_price, strike, current_vix, hours_at_entry,
+                                                  trade_direction, vol_factor)
+            if est_slot is not None:
+                est_slot.markdown(f"""
+                    <div style="font-family: JetBrains Mono; color: #8892b0; font-size: 0.85rem;">
+                        {vol_label}: {current_vix:.1f}{' ⏳ stale' if vix_state['stale'] else ''} • Pre-Market Est: ${est_premium:.2f}/contract
+                    </div>""", unsafe_allow_html=True)
+            
+            # Live premium for the traded strike: this rerun's quote, else the last chain snapshot
+            live_premium = None
+            live_bid = None
+            live_ask = None
+            if quote_fetch is not None:
+                quote = chain_quotes.get(chain_symbols.get(float(strike)))
+                if quote is None and (quote_fetch['value'] or {}).get('error'):
+                    quote = {'ok': False, 'error': quote_fetch['value']['error']}
+                if quote:
+                    if manual_fetch and not quote['ok'] and not quote_fetch['stale']:
+                        st.warning(f"Could not fetch: {quote.get('error', 'no quote')[:80]}")
+                    if quote_fetch['stale']:
+                        st.caption(f"⏳ Quote stale ({quote_fetch['error']}) — "
+                                   f"last good @ {quote_fetch['as_of'].strftime('%I:%M:%S %p')}")
+                elif manual_fetch:
+                    st.warning(f"Could not fetch: {quote_fetch['error'][:80]}")
+            if float(strike) in live_chain:
+                traded_quote = live_chain[float(strike)]
+                live_premium, live_bid, live_ask = traded_quote['mid'], traded_quote['bid'], traded_quote['ask']
+                hours_now = chain_entry['hours']
             
             # Project premiums at entry using actual trade levels
             scenarios = project_premium_at_scenarios(
@@ -3066,6 +6798,8 @@ def main():
                 base_premium=live_premium,
                 current_hours=hours_now,
                 entry_hours=hours_at_entry,
+                smile=live_smile,
+                extrinsic_factor=vol_factor,
             )
             
             # Determine which premium to use for the trade card
@@ -3084,10 +6818,15 @@ def main():
             # SCENARIO TABLE
             # ============================================================
             st.markdown("### 💲 Premium Projections @ 9:05 AM Entry")
-            if scenarios['calibrated']:
+            if expiry_clock.early_close:
+                st.caption("⏰ Early close today — options expire at 12:00 PM CT")
+            if scenarios['iv'] is not None:
+                st.caption(f"Live IV smile • {strike} IV: {scenarios['iv']*100:.1f}% "
+                           f"({len(live_smile['strikes'])} strikes solved) • {hours_at_entry:.1f}hrs to expiry")
+            elif scenarios['calibrated']:
                 st.caption(f"Calibrated from live pull: ${live_premium:.2f} (Bid ${live_bid:.2f} / Ask ${live_ask:.2f})")
             else:
-                st.caption(f"Black-Scholes estimate • VIX: {current_vix:.1f} • {hours_at_entry:.1f}hrs to expiry")
+                st.caption(f"Black-Scholes estimate • {vol_label}: {current_vix:.1f} • {hours_at_entry:.1f}hrs to expiry")
             
             # Scenario cards
             scenario_data = [
@@ -3127,6 +6866,119 @@ def main():
             scenario_html += '</div>'
             st.markdown(scenario_html, unsafe_allow_html=True)
             
+            # ── Greeks: chosen strike at entry + nearby chain ──
+            if scenarios['iv'] is not None:
+                greeks = greeks_snapshot(float(current_price), chain_strikes,
+                                         tuple(float(v) for v in smile_vol(live_smile, chain_strikes)),
+                                         (hours_at_entry,), trade_direction, 1.0)
+            else:
+                greeks = greeks_snapshot(float(current_price), chain_strikes, current_vix / 100.0,
+                                         (hours_at_entry,), trade_direction, vol_factor)
+            ki = chain_strikes.index(float(strike))
+            st.markdown(f"""
+            <div style="font-family: JetBrains Mono; color: #8892b0; font-size: 0.8rem; margin-top: 8px;">
+                Δ {greeks['delta'][ki, 0]:+.3f} • Γ {greeks['gamma'][ki, 0]:.4f} • 
+                Θ ${greeks['theta'][ki, 0] * 100:+,.0f}/hr • ν ${greeks['vega'][ki, 0] * 100:,.0f}/vol pt
+                <span style="color: #3a4a6a;">(per contract @ 9:05 AM)</span>
+            </div>""", unsafe_allow_html=True)
+            with st.expander("Δ Greeks — Nearby Strikes @ 9:05 AM"):
+                st.dataframe(pd.DataFrame({
+                    'Strike': [int(k) for k in chain_strikes],
+                    'Est': np.round(greeks['premium'][:, 0], 2),
+                    'Delta': np.round(greeks['delta'][:, 0], 3),
+                    'Gamma': np.round(greeks['gamma'][:, 0], 4),
+                    'Theta $/hr': np.round(greeks['theta'][:, 0] * 100, 0),
+                    'Vega $/pt': np.round(greeks['vega'][:, 0] * 100, 0),
+                }), hide_index=True, use_container_width=True)
+            
+            # ── Monte Carlo odds: which level gets touched first ──
+            mc_cells = [
+                ("Stop First", mc['p_stop_first'], '#ff1744'),
+                ("TP1 First", mc['p_tp1_first'], '#00e676'),
+                ("TP2 Reached", mc['p_tp2'], '#00e676'),
+                ("Expire Between", mc['p_expire'], '#ffd740'),
+            ]
+            mc_html = '<div style="display:grid; grid-template-columns: repeat(4, 1fr); gap: 10px; margin-top: 10px;">'
+            for label, prob, color in mc_cells:
+                mc_html += f"""
+                <div style="text-align:center; padding: 8px; border: 1px solid {color}33; border-radius: 10px;
+                            background: rgba(255,255,255,0.02);">
+                    <div style="font-family: Rajdhani; color: {color}; font-size: 0.75rem; text-transform:uppercase;
+                                letter-spacing: 1px;">{label}</div>
+                    <div style="font-family: JetBrains Mono; color: {color}; font-size: 1.2rem; font-weight:700;">
+                        {prob*100:.1f}%</div>
+                </div>"""
+            mc_html += '</div>'
+            st.markdown(mc_html, unsafe_allow_html=True)
+            tp1_eta = f" • median TP1 in {mc['median_minutes_to_tp1']:.0f} min" if mc['median_minutes_to_tp1'] else ""
+            st.caption(f"🎲 Monte Carlo • {mc['n_paths']:,} 1-min paths • σ {mc_vol*100:.1f}%{tp1_eta}")
+            
+            best_strike = strike_scores['best']
+            with st.expander(f"🎯 Strike Optimizer — recommended "
+                             f"{int(best_strike) if best_strike is not None else '—'} • trading {strike} "
+                             f"(rule: {fixed_strike})"):
+                opt_df = pd.DataFrame({
+                    'Strike': strike_scores['strikes'].astype(int),
+                    'Entry': strike_scores['entry'].round(2),
+                    'Stop': strike_scores['at_stop'].round(2),
+                    'TP1': strike_scores['at_tp1'].round(2),
+                    'TP2': strike_scores['at_tp2'].round(2),
+                    '3-lot Cost': strike_scores['cost'].round(0),
+                    'E[P&L]': strike_scores['expected_pnl'].round(0),
+                    'E[R]': np.round(strike_scores['expected_r'], 2),
+                    'In Budget': np.where(strike_scores['affordable'], '✅', '—'),
+                })
+                st.dataframe(opt_df, hide_index=True, use_container_width=True)
+                st.caption(f"Entry = live chain mid ({len(live_chain)} quoted strikes)" if live_chain else
+                           "Entry = model premium at 9:05 AM (no chain loaded)")
+                if strike_scores['best'] is None:
+                    st.caption("No strike fits the budget with a positive stop risk — using the 20-pt OTM rule")
+            
+            # ── Premium / P&L surface: how theta erodes targets hit late ──
+            with st.expander("🗺️ Premium Surface — SPX × Time to Close"):
+                ladder_vals = [l['value'] for l in ny_ladder]
+                span_lo = min(stop_price, tp1, tp2, current_price) - 10
+                span_hi = max(stop_price, tp1, tp2, current_price) + 10
+                calibration = 1.0
+                surface_vol, surface_factor = current_vix / 100.0, vol_factor
+                if scenarios['iv'] is not None:
+                    surface_vol, surface_factor = scenarios['iv'], 1.0
+                elif scenarios['calibrated']:
+                    est_live = estimate_option_premium(current_price, strike, current_vix, hours_now,
+                                                       trade_direction, vol_factor)
+                    calibration = live_premium / est_live if est_live > 0 else 1.0
+                surface = build_premium_surface(
+                    float(strike), surface_vol, next_date, trade_direction,
+                    surface_spx_levels(ladder_vals, span_lo, span_hi),
+                    final_premium, calibration, num_contracts, surface_factor,
+                )
+                
+                surface_view = st.radio("Show", ["3-lot P&L", "Premium"], horizontal=True, key="surface_view")
+                z = surface['pnl'] if surface_view == "3-lot P&L" else surface['premium']
+                line_names = {l['value']: l['short'] for l in ny_ladder}
+                y_labels = [f"{v:.2f} {line_names.get(v, '')}".strip() for v in surface['levels']]
+                
+                surf_fig = go.Figure(go.Heatmap(
+                    z=z, x=surface['labels'], y=y_labels,
+                    colorscale='RdYlGn' if surface_view == "3-lot P&L" else 'Viridis',
+                    zmid=0 if surface_view == "3-lot P&L" else None,
+                    hovertemplate='%{x} • SPX %{y}<br>%{z:,.2f}<extra></extra>',
+                ))
+                surf_fig.update_layout(
+                    template='plotly_dark',
+                    paper_bgcolor='rgba(5,8,16,1)',
+                    plot_bgcolor='rgba(8,13,22,1)',
+                    height=420,
+                    margin=dict(l=10, r=20, t=10, b=40),
+                    xaxis=dict(tickfont=dict(family='Rajdhani', size=11, color='#3a4a6a'), nticks=13),
+                    yaxis=dict(tickfont=dict(family='JetBrains Mono', size=10, color='#5a6a8a')),
+                    font=dict(family='JetBrains Mono', color='#8892b0'),
+                )
+                st.plotly_chart(surf_fig, use_container_width=True)
+                st.caption(f"{trade_direction} {strike} • Entry ${final_premium:.2f} × {num_contracts} • "
+                           f"{'IV ' + format(surface_vol * 100, '.1f') + '% (live smile)' if scenarios['iv'] is not None else vol_label + ' ' + format(current_vix, '.1f')}"
+                           f"{' • calibrated to live' if calibration != 1.0 else ''}")
+            
             st.markdown('<div class="section-divider"></div>', unsafe_allow_html=True)
             
             # Trade card — split into separate markdown calls for reliable rendering
@@ -3652,58 +7504,7 @@ def main():
                 st.markdown('<div class="section-divider"></div>', unsafe_allow_html=True)
                 st.markdown("### 📈 Equity Curve")
                 
-                eq_fig = go.Figure()
-                
-                # Equity line with fill
-                eq_fig.add_trace(go.Scatter(
-                    x=df_trades_sorted['date'], 
-                    y=df_trades_sorted['cumulative_pnl'],
-                    mode='lines+markers',
-                    name='Equity',
-                    line=dict(color='#00d4ff', width=2.5),
-                    marker=dict(size=6, color=df_trades_sorted['pnl'].apply(lambda x: '#00e676' if x >= 0 else '#ff1744')),
-                    fill='tozeroy',
-                    fillcolor='rgba(0,212,255,0.06)',
-                    hovertemplate='<b>%{x|%b %d}</b><br>Equity: $%{y:+,.0f}<extra></extra>'
-                ))
-                
-                # Zero line
-                eq_fig.add_hline(y=0, line_dash="dot", line_color="rgba(255,255,255,0.1)", line_width=1)
-                
-                # Drawdown shading
-                if max_drawdown < 0:
-                    eq_fig.add_trace(go.Scatter(
-                        x=df_trades_sorted['date'],
-                        y=df_trades_sorted['drawdown'],
-                        mode='lines',
-                        name='Drawdown',
-                        line=dict(color='#ff1744', width=1, dash='dot'),
-                        fill='tozeroy',
-                        fillcolor='rgba(255,23,68,0.06)',
-                        hovertemplate='Drawdown: $%{y:,.0f}<extra></extra>'
-                    ))
-                
-                eq_fig.update_layout(
-                    template='plotly_dark',
-                    paper_bgcolor='rgba(5,8,16,1)',
-                    plot_bgcolor='rgba(8,13,22,1)',
-                    height=350,
-                    margin=dict(l=10, r=20, t=10, b=40),
-                    xaxis=dict(
-                        gridcolor='rgba(30,45,74,0.12)', showgrid=True,
-                        tickfont=dict(family='Rajdhani', size=11, color='#3a4a6a'),
-                    ),
-                    yaxis=dict(
-                        gridcolor='rgba(30,45,74,0.12)', showgrid=True,
-                        tickformat='$,.0f', side='right',
-                        tickfont=dict(family='JetBrains Mono', size=11, color='#5a6a8a'),
-                    ),
-                    legend=dict(bgcolor='rgba(6,9,16,0.95)', font=dict(size=10, family='JetBrains Mono', color='#8892b0')),
-                    font=dict(family='JetBrains Mono', color='#8892b0'),
-                    hovermode='x unified',
-                    hoverlabel=dict(bgcolor='rgba(6,9,16,0.95)', bordercolor='rgba(0,212,255,0.2)',
-                        font=dict(family='JetBrains Mono', size=11, color='#ccd6f6')),
-                )
+                eq_fig = equity_curve_figure(df_trades_sorted)
                 st.plotly_chart(eq_fig, use_container_width=True)
             
             # ── Win Rate by Confluence ──
@@ -3746,6 +7547,22 @@ def main():
                     </div>
                     """, unsafe_allow_html=True)
             
+            # ── Factor Combinations (trade log × per-day factor table) ──
+            with st.expander("🧬 Confluence Factor Combinations"):
+                trades_key = tuple((str(t.get('date')), t.get('direction'), float(t.get('pnl') or 0))
+                                   for t in all_trades)
+                combo = cached_combination_stats(trades_key, candle_store_signature(),
+                                                 st.session_state.get('_es_offset', 0.0), rate)
+                if combo['stats'] is None:
+                    st.caption("No logged NY options trade falls on a day in the local candle store yet")
+                else:
+                    st.caption(f"{combo['joined']} of {combo['total']} NY options trades matched to stored candle "
+                               f"days (futures trades are left out — their day's factors come after the 6 PM entry)")
+                    show_empty = st.checkbox("Show combinations with no trades", value=False, key="combo_empty")
+                    combo_df = combo['stats'] if show_empty else combo['stats'][combo['stats']['n'] > 0]
+                    st.dataframe(combo_df.round({'win_rate': 0, 'expectancy': 0, 'total_pnl': 0}),
+                                 hide_index=True, use_container_width=True)
+            
             # ── Trade History Table ──
             st.markdown('<div class="section-divider"></div>', unsafe_allow_html=True)
             st.markdown("### 📋 Trade History")
@@ -3807,6 +7624,414 @@ def main():
             </div>
             """, unsafe_allow_html=True)
     
+    # ============================================================
+    # TAB 5: BACKTEST LAB — both frameworks replayed over the candle store
+    # ============================================================
+    with tab5:
+        st.markdown("### 🧪 Backtest Lab")
+        st.markdown("*9 AM NY options and 6 PM Asian futures replayed day by day over the local candle store*")
+        
+        st.markdown('<div class="section-divider"></div>', unsafe_allow_html=True)
+        
+        store_sig = candle_store_signature()
+        store_df = load_candle_store() if store_sig else None
+        if store_df is None or len(store_df) == 0:
+            st.info("The local candle store is empty — every ES fetch is saved there, so history builds up as you use the app.")
+        else:
+            first_day = store_df['datetime'].iloc[0].date()
+            last_day = store_df['datetime'].iloc[-1].date()
+            st.caption(f"Store: {len(store_df):,} bars • {first_day} → {last_day}")
+            bt_workers = backtest_workers()
+            
+            bt_framework = st.radio("Framework", ["☀️ NY 9 AM options", "🌙 Asian 6 PM futures"],
+                                    horizontal=True, key="bt_framework")
+            is_asian_bt = bt_framework.startswith("🌙")
+            bt1, bt2 = st.columns(2)
+            with bt1:
+                bt_start = st.date_input("From", value=first_day, min_value=first_day, max_value=last_day, key="bt_start")
+            with bt2:
+                bt_end = st.date_input("To", value=last_day, min_value=first_day, max_value=last_day, key="bt_end")
+            
+            if is_asian_bt:
+                minute_sig = candle_store_signature('1m')
+                st.caption("Resolution: 1-minute bars on the evenings the local store covers, 30-min candles "
+                           "elsewhere" if minute_sig else "Resolution: 30-min candles (no 1-minute bars stored yet)")
+                bt3, bt4, bt5, bt6 = st.columns(4)
+                with bt3:
+                    bt_max_move = st.number_input("Max move (pts)", value=ASIAN_MAX_MOVE, step=0.5, format="%.1f",
+                                                  key="bt_max_move")
+                with bt4:
+                    bt_target = st.radio("Exit at", ["Target 1", "Target 2"], horizontal=True, key="bt_target")
+                with bt5:
+                    bt_contract = st.selectbox("Contract", list(FUTURES_POINT_VALUES), key="bt_contract")
+                with bt6:
+                    bt_contracts = st.number_input("Contracts", value=2, min_value=1, key="bt_contracts")
+                bt_params = {**ASIAN_BACKTEST_DEFAULTS, 'rate': rate, 'max_move': bt_max_move,
+                             'target': 'target_1' if bt_target == "Target 1" else 'target_2',
+                             'contract': bt_contract, 'contracts': int(bt_contracts)}
+            else:
+                bt3, bt4, bt5 = st.columns(3)
+                with bt3:
+                    bt_offset = st.number_input("ES → SPX offset", value=0.0, step=0.25, format="%.2f", key="bt_offset",
+                                                help="History is replayed in ES terms unless an offset is set")
+                with bt4:
+                    bt_vol_mode = st.radio("Premium vol", ["Prior-session realized", "Fixed"], horizontal=True,
+                                           key="bt_vol_mode")
+                with bt5:
+                    bt_vol = st.number_input("Fixed vol (VIX pts)", value=VIX_DEFAULT, min_value=5.0, max_value=80.0,
+                                             step=0.5, key="bt_vol", disabled=bt_vol_mode != "Fixed")
+                bt_params = {**NY_BACKTEST_DEFAULTS, 'rate': rate, 'es_offset': bt_offset,
+                             'vol': bt_vol / 100 if bt_vol_mode == "Fixed" else None}
+            
+            bt_state_key = '_asian_backtest' if is_asian_bt else '_ny_backtest'
+            if st.button("▶ Run backtest", type="primary", use_container_width=True, key="bt_run"):
+                with st.spinner("Replaying history…"):
+                    if is_asian_bt:
+                        st.session_state[bt_state_key] = cached_asian_backtest(
+                            store_sig, minute_sig, bt_start, bt_end, tuple(sorted(bt_params.items())))
+                    else:
+                        st.session_state[bt_state_key] = cached_ny_backtest(
+                            store_sig, bt_start, bt_end, tuple(sorted(bt_params.items())),
+                            bt_workers)
+            
+            bt = st.session_state.get(bt_state_key)
+            bt_rows = None if bt is None else bt['rows']
+            if bt_rows is not None and len(bt_rows):
+                summary = bt['summary']
+                unit = "setups" if is_asian_bt else "days"
+                st.caption(f"{summary['days']} {unit} • {summary['trades']} trades • {bt['seconds']:.1f}s • "
+                           f"rate {bt['params']['rate']:.4f} • {bt['computed']} days computed, "
+                           f"{bt['cached']} from the results store")
+                if is_asian_bt:
+                    fine = bt_rows['bar_minutes'].eq(1)
+                    st.caption(f"Resolved on 1-minute bars: {bt_rows.loc[fine, 'trade_day'].nunique()} evenings • "
+                               f"30-min candles: {bt_rows.loc[~fine, 'trade_day'].nunique()} evenings")
+                elif 'calendar_known' in bt_rows:
+                    off_calendar = int((~bt_rows['calendar_known'].astype(bool)).sum())
+                    if off_calendar:
+                        st.caption(f"⚠️ {off_calendar} days fall outside the early-close calendar "
+                                   f"({EARLY_CLOSE_FIRST_YEAR}–{EARLY_CLOSE_LAST_YEAR}): half-days there are "
+                                   f"priced as full sessions")
+                
+                m1, m2, m3, m4 = st.columns(4)
+                for col, label, value in [
+                    (m1, "Total P&L", f"${summary['total_pnl']:+,.0f}"),
+                    (m2, "Win Rate", f"{summary['win_rate']:.0f}%"),
+                    (m3, "Profit Factor", f"{summary['profit_factor']:.2f}"),
+                    (m4, "Max Drawdown", f"${summary['max_drawdown']:,.0f}"),
+                ]:
+                    with col:
+                        st.markdown(f"""
+                        <div class="metric-card">
+                            <div class="metric-label">{label}</div>
+                            <div class="metric-value-neutral">{value}</div>
+                        </div>""", unsafe_allow_html=True)
+                
+                traded = bt_rows[bt_rows['exit_reason'].isin(BACKTEST_TRADED_EXITS)]
+                if len(traded) >= 2:
+                    bt_fig = equity_curve_figure(equity_curve_frame(traded['date'], traded['pnl']), markers=False)
+                    st.plotly_chart(bt_fig, use_container_width=True)
+                
+                st.caption("Exits: " + " • ".join(f"{k} {v}" for k, v in summary['exits'].items()))
+                bt_group = st.radio("Group by", ['setup' if is_asian_bt else 'signal', 'month', 'weekday',
+                                                 'exit_reason'], horizontal=True, key="bt_group")
+                grouped = aggregate_backtest_results(bt_rows, bt_group)
+                if len(grouped):
+                    st.dataframe(grouped.round({'total_pnl': 0, 'expectancy': 0, 'win_rate': 0, 'avg_r': 2}),
+                                 use_container_width=True, hide_index=True)
+                if not is_asian_bt:
+                    with st.expander("🧬 Confluence Factor Combinations (backtest)"):
+                        bt_combo = cached_backtest_combination_stats(
+                            bt['key'], results_store_signature('ny', bt['key']), bt_start, bt_end)
+                        if bt_combo['stats'] is None:
+                            st.caption("No backtested trade carries confluence factors in this range")
+                        else:
+                            st.caption(f"{bt_combo['joined']} of {bt_combo['total']} backtested trades scored")
+                            bt_combo_df = bt_combo['stats'][bt_combo['stats']['n'] > 0]
+                            st.dataframe(bt_combo_df.round({'win_rate': 0, 'expectancy': 0, 'total_pnl': 0,
+                                                            'avg_r': 2}),
+                                         hide_index=True, use_container_width=True)
+                with st.expander(f"📅 Daily results ({len(bt_rows)})"):
+                    st.dataframe(bt_rows.drop(columns='trade_day').round(2), use_container_width=True,
+                                 hide_index=True)
+            
+            # ── Parameter grid: comma-separated values per constant ──
+            grid_framework = 'asian' if is_asian_bt else 'ny'
+            with st.expander("🔬 Parameter Grid Search"):
+                st.caption("Every combination is backtested over the range above; finished days are kept "
+                           "in the results store, so re-runs only compute new combinations and days.")
+                grid_cols = st.columns(3)
+                grid_spec = {}
+                for i, name in enumerate(GRID_PARAMETERS[grid_framework]):
+                    with grid_cols[i % 3]:
+                        raw = st.text_input(name, value=f"{bt_params[name]:g}", key=f"grid_{grid_framework}_{name}")
+                    try:
+                        grid_spec[name] = sorted({float(v) for v in raw.split(',') if v.strip()})
+                    except ValueError:
+                        st.warning(f"{name}: numbers separated by commas")
+                        grid_spec[name] = [bt_params[name]]
+                n_combos = int(np.prod([len(v) for v in grid_spec.values()]))
+                if st.button(f"▶ Run {n_combos} combinations", key="grid_run", use_container_width=True):
+                    grid_bar = st.progress(0.0)
+                    st.session_state[f'_grid_{grid_framework}'] = run_parameter_grid(
+                        store_df, grid_framework, grid_spec, bt_start, bt_end,
+                        bars=load_candle_store(interval='1m') if is_asian_bt and minute_sig else None,
+                        base_params=bt_params, workers=bt_workers,
+                        progress=lambda done, total: grid_bar.progress(done / total))
+                grid_result = st.session_state.get(f'_grid_{grid_framework}')
+                if grid_result is not None:
+                    st.caption(f"{grid_result['computed']} computed ({grid_result['days_computed']} days) • "
+                               f"{grid_result['cached']} from the results store • {grid_result['seconds']:.1f}s")
+                    st.dataframe(grid_result['results'].sort_values('total_pnl', ascending=False).round(2),
+                                 use_container_width=True, hide_index=True)
+            
+            # ── Walk-forward: re-optimize the same grid on rolling train windows ──
+            with st.expander("🚶 Walk-Forward (out-of-sample)"):
+                st.caption("Uses the grid above. Each train window picks the best combination, which then "
+                           "trades the following test window; the test windows form the out-of-sample curve.")
+                wf1, wf2, wf3 = st.columns(3)
+                with wf1:
+                    wf_train = st.number_input("Train (trading days)", value=WF_TRAIN_DAYS, min_value=20, step=10,
+                                               key="wf_train")
+                with wf2:
+                    wf_test = st.number_input("Test (trading days)", value=WF_TEST_DAYS, min_value=5, step=5,
+                                              key="wf_test")
+                with wf3:
+                    wf_objective = st.selectbox("Optimize", WF_OBJECTIVES, key="wf_objective")
+                if st.button("▶ Run walk-forward", key="wf_run", use_container_width=True):
+                    wf_bar = st.progress(0.0)
+                    st.session_state[f'_wf_{grid_framework}'] = run_walk_forward(
+                        store_df, grid_framework, grid_spec, bt_start, bt_end, int(wf_train), int(wf_test),
+                        wf_objective, bars=load_candle_store(interval='1m') if is_asian_bt and minute_sig else None,
+                        base_params=bt_params, workers=bt_workers,
+                        progress=lambda done, total: wf_bar.progress(done / total))
+                wf_result = st.session_state.get(f'_wf_{grid_framework}')
+                if wf_result is not None and len(wf_result['windows']):
+                    oos_curve = equity_curve_frame(wf_result['oos']['date'], wf_result['oos']['pnl'])
+                    in_sample = wf_result['in_sample']
+                    if len(wf_result['oos']):
+                        in_sample = in_sample[in_sample['date'] >= wf_result['oos']['date'].min()]
+                    is_curve = equity_curve_frame(in_sample['date'], in_sample['pnl'])
+                    oos_pnl = oos_curve['pnl']
+                    st.caption(f"{len(wf_result['windows'])} windows • OOS {len(oos_curve)} trades • "
+                               f"${oos_pnl.sum():+,.0f} • win rate {(oos_pnl > 0).mean() * 100 if len(oos_pnl) else 0:.0f}% • "
+                               f"max DD ${oos_curve['drawdown'].min() if len(oos_curve) else 0:,.0f} • "
+                               f"in-sample best over the same span ${is_curve['pnl'].sum() if len(is_curve) else 0:+,.0f}")
+                    if len(oos_curve) >= 2:
+                        st.plotly_chart(equity_curve_figure(oos_curve, name='Out-of-sample',
+                                                            overlays={'In-sample best': is_curve}, markers=False),
+                                        use_container_width=True)
+                    st.dataframe(wf_result['windows'].round(4), use_container_width=True, hide_index=True)
+                elif wf_result is not None:
+                    st.caption("Not enough traded days for one train + test window")
+            
+            # ── Results store: every parameter set backtested so far ──
+            with st.expander("🗄️ Results Store"):
+                stored_sets = results_store_index(grid_framework)
+                if not len(stored_sets):
+                    st.caption("Nothing stored yet for this framework and code version.")
+                else:
+                    st.dataframe(stored_sets, use_container_width=True, hide_index=True)
+                    rs1, rs2 = st.columns([3, 1])
+                    with rs1:
+                        rs_key = st.selectbox("Parameter set", stored_sets['key'],
+                                              format_func=lambda k: stored_sets.set_index('key').at[k, 'params'],
+                                              key="rs_key")
+                    with rs2:
+                        rs_group = st.selectbox("Group by", ['month', 'weekday', 'exit_reason',
+                                                             'setup' if is_asian_bt else 'signal'], key="rs_group")
+                    rs_rows = query_backtest_results(grid_framework, rs_key, bt_start, bt_end)
+                    rs_table = aggregate_backtest_results(rs_rows, rs_group)
+                    if len(rs_table):
+                        st.dataframe(rs_table.round({'total_pnl': 0, 'expectancy': 0, 'win_rate': 0, 'avg_r': 2}),
+                                     use_container_width=True, hide_index=True)
+                if st.button("🧹 Delete results of older code versions", key="rs_prune"):
+                    st.caption(f"Removed {prune_backtest_results(grid_framework)} stale parameter sets")
+            
+            # ── Session replay: stored bars through the LIVE MODE pipeline on a simulated clock ──
+            with st.expander("⏯️ Session Replay (live path)"):
+                replay_minutes = candle_store_signature('1m')
+                st.caption("Replays one stored session — from the 5 PM open through the close — as live quotes: "
+                           "banner, line-cross events, alerts, 6 PM auto-fill, 9 AM signal and the chain "
+                           "auto-fetch window, with per-tick latency. The 6 PM lock is simulated at the 6:00 open "
+                           "(live, you lock it yourself). "
+                           + ("Quotes from 1-minute bars." if replay_minutes else
+                              "No 1-minute bars stored yet — quotes from 30-min candles."))
+                rp1, rp2, rp3 = st.columns(3)
+                with rp1:
+                    rp_date = st.date_input("Session", value=last_day, min_value=first_day, max_value=last_day,
+                                            key="rp_date")
+                with rp2:
+                    rp_speed = st.select_slider("Speed", ["max"] + REPLAY_SPEEDS, value=60, key="rp_speed",
+                                                format_func=lambda v: "as fast as possible" if v == "max" else f"{v}×")
+                with rp3:
+                    rp_path = st.radio("Quotes per bar", REPLAY_PATHS, horizontal=True, key="rp_path",
+                                       format_func=lambda v: "1 (close)" if v == 'close' else "4 (O-H-L-C)")
+                rp4, rp5 = st.columns(2)
+                with rp4:
+                    rp_profile = st.checkbox("Profile the ticks (cProfile)", key="rp_profile")
+                with rp5:
+                    rp_max_wall = st.number_input("Stop after (wall seconds)", min_value=5, max_value=3600,
+                                                  value=120, step=5, key="rp_max_wall",
+                                                  help="The replay holds this page until it ends or stops")
+                if st.button("▶ Replay session", key="rp_run", use_container_width=True):
+                    rp_pipeline = replay_pipeline(store_df, rp_date, es_offset_val, rate, alert_distance)
+                    if rp_pipeline is None:
+                        st.warning("No prior session with levels in the store for that date")
+                    else:
+                        rp_day = day_number(rp_date)
+                        rp_bars = (load_candle_store(rp_date, rp_date, interval='1m') if replay_minutes
+                                   else store_df[store_df['session_day'] == rp_day])
+                        rp_bars = rp_bars[rp_bars['session_day'] == rp_day]
+                        rp_banner = st.empty()
+                        rp_status = st.empty()
+                        rp_drawn = [0.0]
+                        rp_started = time_mod.perf_counter()
+                        
+                        def draw_tick(tick, clock):
+                            # Render at most ~20 times a second of wall time; the tick itself is timed apart
+                            now = time_mod.perf_counter()
+                            if now - rp_started > rp_max_wall:
+                                return False
+                            if now - rp_drawn[0] >= 0.05:
+                                rp_drawn[0] = now
+                                rp_banner.markdown(live_banner_html(
+                                    tick, f"⏯️ REPLAY • {pd.Timestamp(tick['time']).strftime('%b %d %I:%M:%S %p')}"),
+                                    unsafe_allow_html=True)
+                                rp_status.caption(f"6 PM price {tick['asian_price']:.2f}"
+                                                  f"{' 🔒 (simulated 6:00 open)' if tick['asian_simulated'] else ' 🔒' if tick['asian_locked'] else ''}"
+                                                  f" • 9 AM {tick['ny_signal']}"
+                                                  f"{' • chain auto-fetch' if tick['auto_fetch'] else ''}")
+                        
+                        st.session_state['_replay'] = replay_session(
+                            rp_pipeline, replay_quotes(rp_bars, rp_path, 1 if replay_minutes else CANDLE_MINUTES),
+                            None if rp_speed == "max" else rp_speed,
+                            on_tick=draw_tick, profile=rp_profile)
+                        st.session_state['_replay_plan'] = rp_pipeline.asian_plan
+                replay = st.session_state.get('_replay')
+                if replay is not None and len(replay['ticks']):
+                    lat = replay['latency']
+                    st.caption(f"{len(replay['ticks']):,} ticks • {replay['sim_seconds'] / 3600:.1f} h session in "
+                               f"{replay['wall_seconds']:.1f}s ({replay['effective_speed']:,.0f}×) • "
+                               f"{len(replay['events'])} events • {len(replay['alerts'])} alerts"
+                               f"{' • ⏹ stopped at the wall-time limit' if replay.get('stopped') else ''}")
+                    st.caption(f"Tick latency: mean {lat['mean_us']:.0f} µs • p50 {lat['p50_us']:.0f} • "
+                               f"p95 {lat['p95_us']:.0f} • p99 {lat['p99_us']:.0f} • max {lat['max_us']:.0f} µs")
+                    replay_plan = st.session_state.get('_replay_plan')
+                    if replay_plan and replay_plan['setups']:
+                        st.dataframe(pd.DataFrame([{k: sp[k] for k in ('direction', 'entry', 'stop', 'target_1',
+                                                                        'target_2')} for sp in replay_plan['setups']]
+                                                  ).round(2), use_container_width=True, hide_index=True)
+                    if replay['events']:
+                        st.dataframe(pd.DataFrame([{
+                            'Time': pd.Timestamp(e['time']).strftime('%I:%M:%S %p'),
+                            'Event': e['type'].replace('_', ' '),
+                            'Detail': e['text'],
+                            'SPX': round(e['price'], 2),
+                        } for e in replay['events']]), hide_index=True, use_container_width=True)
+                    if replay['profile']:
+                        st.code(replay['profile'], language=None)
+    
+    # ============================================================
+    # TAB 6: TIME TRAVEL — the dashboard at any stored minute
+    # ============================================================
+    with tab6:
+        st.markdown("### ⏳ Time Travel")
+        st.markdown("*The structural map, 6 PM setups and 9 AM signal exactly as they stood at any minute in the candle store*")
+        
+        st.markdown('<div class="section-divider"></div>', unsafe_allow_html=True)
+        
+        if store_df is None or len(store_df) == 0:
+            st.info("The local candle store is empty — time travel needs stored sessions.")
+        else:
+            tt_minute_sig = candle_store_signature('1m')
+            tt_date = st.date_input("Session", value=store_df['datetime'].iloc[-1].date(),
+                                    min_value=store_df['datetime'].iloc[0].date(),
+                                    max_value=store_df['datetime'].iloc[-1].date(), key="tt_date")
+            tt_day = time_travel_day(store_sig, tt_minute_sig, tt_date, es_offset_val, rate)
+            if tt_day is None:
+                st.warning("No prior session with levels in the store for that date")
+            else:
+                # One cursor per session: scrubbing reuses it, so a step forward only feeds the new quotes
+                tt_key = (store_sig, tt_minute_sig, tt_date, es_offset_val, rate)
+                if st.session_state.get('_time_travel_key') != tt_key:
+                    st.session_state['_time_travel'] = TimeTravelCursor(tt_day)
+                    st.session_state['_time_travel_key'] = tt_key
+                
+                # Only this fragment reruns while the slider moves
+                @st.fragment
+                def time_travel_view(cursor):
+                    day = cursor.day
+                    when = st.slider("Minute (CT)", min_value=day['open'], max_value=day['close'],
+                                     value=min(cursor.decision_9am, day['close']), step=timedelta(minutes=1),
+                                     format="ddd MMM D • h:mm A", key=f"tt_minute_{day['date']}")
+                    started = time_mod.perf_counter()
+                    state = cursor.seek(when)
+                    tick = state['tick']
+                    spx_then = tick['spx_price'] if tick is not None else None
+                    fig = structural_map_figure(day['levels'], spx_then, "THEN")
+                    elapsed_ms = (time_mod.perf_counter() - started) * 1000
+                    
+                    if tick is not None:
+                        st.markdown(live_banner_html(tick, f"⏳ TIME TRAVEL • {when:%a %b %d %I:%M %p} CT"),
+                                    unsafe_allow_html=True)
+                    else:
+                        st.caption("No quote yet at that minute — the session opens at 5:00 PM CT")
+                    
+                    tt1, tt2 = st.columns([3, 2])
+                    with tt1:
+                        st.plotly_chart(fig, use_container_width=True, config=STRUCTURAL_MAP_CONFIG)
+                    with tt2:
+                        st.markdown("#### 🌙 6 PM Setups")
+                        if state['asian_price'] is None:
+                            st.caption("No ES quote yet")
+                        else:
+                            st.caption(f"ES {state['asian_price']:.2f} "
+                                       + ("🔒 locked at the 6:00 PM open" if state['asian_locked']
+                                          else "• live — locks at 6:00 PM"))
+                            plan = state['asian_plan']
+                            if plan and plan['setups']:
+                                st.dataframe(pd.DataFrame([{k: sp[k] for k in ('direction', 'entry', 'stop',
+                                                                                'target_1', 'target_2')}
+                                                           for sp in plan['setups']]).round(2),
+                                             use_container_width=True, hide_index=True)
+                            else:
+                                st.caption("No setup within the max move")
+                        
+                        st.markdown("#### ☀️ 9 AM Signal")
+                        ny = state['ny_decision']
+                        if ny is None and spx_then is not None:
+                            ny = classify_signal(cursor.pipeline.ny_ladder, spx_then)
+                        if ny is None:
+                            st.caption("No SPX quote yet")
+                        else:
+                            sig_color = ('#00e676' if ny['signal_class'] == 'bull' else
+                                         '#ff1744' if ny['signal_class'] == 'bear' else '#ffd740')
+                            st.markdown(f"""
+                            <div class="signal-box-{ny['signal_class']}">
+                                <div style="font-family: 'Orbitron'; font-size: 1.1rem; color: {sig_color};">
+                                    {ny['signal']}
+                                </div>
+                                <div style="font-family: 'Rajdhani'; font-size: 0.9rem; color: #8892b0; margin-top: 6px;">
+                                    {ny['signal_detail']}
+                                </div>
+                            </div>
+                            """, unsafe_allow_html=True)
+                            st.caption(f"Decided at the 9:00 AM open ({day['price_9am']:.2f})"
+                                       if state['ny_decision'] is not None else "Not decided yet — at the current price")
+                    
+                    if state['events']:
+                        st.dataframe(pd.DataFrame([{
+                            'Time': pd.Timestamp(e['time']).strftime('%I:%M %p'),
+                            'Event': e['type'].replace('_', ' '),
+                            'Detail': e['text'],
+                            'SPX': round(e['price'], 2),
+                        } for e in reversed(state['events'])]), hide_index=True, use_container_width=True)
+                    st.caption(f"Evaluated in {elapsed_ms:.1f} ms • {cursor.position:,} of {len(day['times']):,} "
+                               f"quotes from {'1-minute' if day['bar_minutes'] == 1 else '30-min'} bars")
+                
+                time_travel_view(st.session_state['_time_travel'])
+    
 
 if __name__ == "__main__":
     main()